@@ -0,0 +1,80 @@
+"""Benchmark de codificación y decodificación de los mensajes del pipeline.
+
+Uso: python benchmarks/bench_messages.py [--iterations 100000]
+Compara JSON (formato anterior y actual) contra msgpack si está instalado.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'common')))
+
+from pipeline import messages
+from pipeline.messages import encode_message, decode_message, DOCUMENT_DISCOVERED, DOCUMENT_STORED
+
+SAMPLES = {
+    DOCUMENT_DISCOVERED: {
+        'file_name': 'ebay_product_256789012345.html',
+        'status': 'new',
+        'path': '2023395931/ebay_product_256789012345.html',
+        'document_id': 123456
+    },
+    DOCUMENT_STORED: {
+        'document_id': 123456,
+        'elasticsearch_id': 'vQx3Uo0BvKq2cT9lX1aZ'
+    },
+}
+
+
+def measure(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed
+
+
+def bench_legacy(fields, iterations):
+    body = json.dumps(fields)
+    return {
+        'bytes': len(body),
+        'encode_per_second': measure(lambda: json.dumps(fields), iterations),
+        'decode_per_second': measure(lambda: json.loads(body), iterations),
+    }
+
+
+def bench_format(message_type, fields, message_format, iterations):
+    body, properties = encode_message(message_type, fields, message_format)
+    return {
+        'bytes': len(body),
+        'encode_per_second': measure(lambda: encode_message(message_type, fields, message_format), iterations),
+        'decode_per_second': measure(lambda: decode_message(body, properties), iterations),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    formats = ['json'] + (['msgpack'] if messages.msgpack is not None else [])
+    if messages.msgpack is None:
+        print("msgpack no está instalado; solo se mide JSON")
+
+    results = {}
+    for message_type, fields in SAMPLES.items():
+        results[(message_type, 'legacy-json')] = bench_legacy(fields, args.iterations)
+        for message_format in formats:
+            results[(message_type, message_format)] = bench_format(message_type, fields, message_format, args.iterations)
+
+    print(f"{'mensaje':<22}{'formato':<13}{'bytes':>7}{'encode/s':>13}{'decode/s':>13}")
+    for (message_type, message_format), result in results.items():
+        print(f"{message_type:<22}{message_format:<13}{result['bytes']:>7}"
+              f"{result['encode_per_second']:>13,.0f}{result['decode_per_second']:>13,.0f}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
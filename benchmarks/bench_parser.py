@@ -0,0 +1,202 @@
+"""Micro-benchmark de DocumentProcessor.parse_html_with_beautifulsoup sobre el corpus.
+
+Uso: python benchmarks/bench_parser.py [--iterations 20] [--page ebay_large]
+                                       [--json resultado.json] [--update-golden]
+
+Para cada página de benchmarks/corpus reporta el camino de extracción (JSON-LD,
+DOM o DOM con iframe), el tiempo de parseo, el costo del escaneo JSON-LD y de
+construir el DOM por separado, y la memoria pico y retenida medida con
+tracemalloc. Compara los campos extraídos contra los golden del corpus y termina
+con código 1 si alguno cambió, así una optimización no altera los resultados sin
+que se note. --update-golden regenera los golden después de un cambio intencional.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import load_service
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+PATHS = {0: 'json-ld', 1: 'dom', 2: 'dom+iframe'}
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    with open(os.path.join(corpus_dir, 'manifest.json'), encoding='utf-8') as file:
+        manifest = json.load(file)
+    for page in manifest['pages']:
+        with open(os.path.join(corpus_dir, page['file']), encoding='utf-8') as file:
+            page['html'] = file.read()
+    manifest['iframe_html'] = {}
+    for url, path in manifest.get('iframes', {}).items():
+        with open(os.path.join(corpus_dir, path), encoding='utf-8') as file:
+            manifest['iframe_html'][url] = file.read()
+    return manifest
+
+
+class FakeResponse:
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+
+
+class SoupCounter:
+    """Envuelve BeautifulSoup para contar cuántos DOM construye cada parseo"""
+
+    def __init__(self, soup_class):
+        self.soup_class = soup_class
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+        return self.soup_class(*args, **kwargs)
+
+
+class ParserBench:
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.module = load_service('procesor')
+        processor = self.module.DocumentProcessor.__new__(self.module.DocumentProcessor)
+        processor.profiles = self.module.load_profiles()
+        self.processor = processor
+
+    def fetch_iframe(self, url, timeout=None):
+        html = self.manifest['iframe_html'].get(url)
+        return FakeResponse(200, html) if html is not None else FakeResponse(404)
+
+    def parse(self, page):
+        return self.processor.parse_html_with_beautifulsoup(page['html'], page.get('url'))
+
+    def measure(self, page, iterations):
+        counter = SoupCounter(self.module.BeautifulSoup)
+        with patch.object(self.module, 'BeautifulSoup', counter), \
+                patch.object(self.module.requests, 'get', self.fetch_iframe):
+            result = self.parse(page)
+            soup_builds = counter.count
+
+            durations = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                self.parse(page)
+                durations.append(time.perf_counter() - started)
+
+            tracemalloc.start()
+            try:
+                baseline = tracemalloc.take_snapshot()
+                tracemalloc.reset_peak()
+                start_current, _ = tracemalloc.get_traced_memory()
+                self.parse(page)
+                current, peak = tracemalloc.get_traced_memory()
+                blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, 'filename'))
+            finally:
+                tracemalloc.stop()
+
+        html = page['html']
+        return result, {
+            'bytes': len(html.encode('utf-8')),
+            'path': PATHS.get(soup_builds, f'dom x{soup_builds}'),
+            'structured_fields': sorted(self.module.extract_structured_data(html)),
+            'parse_ms_p50': statistics.median(durations) * 1000,
+            'parse_ms_min': min(durations) * 1000,
+            'json_ld_ms': best_of(lambda: self.module.extract_structured_data(html), iterations) * 1000,
+            'dom_ms': best_of(lambda: counter.soup_class(html, 'html.parser'), max(1, iterations // 4)) * 1000,
+            'peak_kib': (peak - start_current) / 1024,
+            'retained_kib': (current - start_current) / 1024,
+            'net_blocks': blocks,
+        }
+
+
+def best_of(function, iterations):
+    best = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def golden_path(name, corpus_dir=CORPUS_DIR):
+    return os.path.join(corpus_dir, 'golden', f"{name}.json")
+
+
+def check_golden(page, result, stats, version, corpus_dir=CORPUS_DIR):
+    """Retorna la lista de diferencias contra el golden de la página (vacía si coincide)"""
+    path = golden_path(page['name'], corpus_dir)
+    if not os.path.exists(path):
+        return [f"no existe {os.path.relpath(path)}; ejecute con --update-golden"]
+    with open(path, encoding='utf-8') as file:
+        golden = json.load(file)
+    if golden.get('corpus_version') != version:
+        return [f"golden de la versión {golden.get('corpus_version')} y el corpus es la {version}"]
+    differences = []
+    if golden.get('path') != stats['path']:
+        differences.append(f"path: {golden.get('path')!r} -> {stats['path']!r}")
+    expected = golden.get('fields', {})
+    for field in sorted(set(expected) | set(result)):
+        if expected.get(field) != result.get(field):
+            differences.append(f"{field}: {expected.get(field)!r} -> {result.get(field)!r}")
+    return differences
+
+
+def write_golden(page, result, stats, version, corpus_dir=CORPUS_DIR):
+    with open(golden_path(page['name'], corpus_dir), 'w', encoding='utf-8') as file:
+        json.dump({'corpus_version': version, 'path': stats['path'], 'fields': result},
+                  file, indent=2, ensure_ascii=False, sort_keys=True)
+        file.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--page', action='append', help='limitar a estas páginas del corpus')
+    parser.add_argument('--json', help='archivo donde guardar los resultados')
+    parser.add_argument('--update-golden', action='store_true')
+    parser.add_argument('--corpus', default=CORPUS_DIR)
+    args = parser.parse_args(argv)
+
+    manifest = load_corpus(args.corpus)
+    pages = [page for page in manifest['pages'] if not args.page or page['name'] in args.page]
+    bench = ParserBench(manifest)
+
+    results, failures = {}, {}
+    for page in pages:
+        result, stats = bench.measure(page, args.iterations)
+        if args.update_golden:
+            write_golden(page, result, stats, manifest['version'], args.corpus)
+        else:
+            differences = check_golden(page, result, stats, manifest['version'], args.corpus)
+            if differences:
+                failures[page['name']] = differences
+        stats['golden'] = page['name'] not in failures
+        results[page['name']] = stats
+
+    print(f"corpus v{manifest['version']}, {args.iterations} iteraciones")
+    print(f"{'página':<22}{'camino':<12}{'KiB':>7}{'p50 ms':>9}{'min ms':>9}{'jsonld':>8}"
+          f"{'dom ms':>8}{'pico KiB':>10}{'ret KiB':>9}{'golden':>8}")
+    for name, stats in results.items():
+        print(f"{name:<22}{stats['path']:<12}{stats['bytes'] / 1024:>7.1f}{stats['parse_ms_p50']:>9.2f}"
+              f"{stats['parse_ms_min']:>9.2f}{stats['json_ld_ms']:>8.2f}{stats['dom_ms']:>8.2f}"
+              f"{stats['peak_kib']:>10.0f}{stats['retained_kib']:>9.1f}{'ok' if stats['golden'] else 'FALLA':>8}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'corpus_version': manifest['version'], 'pages': results}, file, indent=2, ensure_ascii=False)
+
+    if args.update_golden:
+        print(f"Golden actualizados en {os.path.join(args.corpus, 'golden')}")
+    for name, differences in failures.items():
+        print(f"\nERROR: {name} no coincide con su golden:")
+        for difference in differences:
+            print(f"  {difference}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""Benchmark de extremo a extremo del pipeline spider -> downloader -> procesador.
+
+Uso: python benchmarks/bench_pipeline.py [--documents 200] [--json resultado.json]
+                                         [--min-docs-per-second 50]
+
+Ejecuta el código real de los tres servicios en un solo proceso contra reemplazos
+locales (S3 en memoria, un broker en proceso, SQLite en lugar de MariaDB y un
+Elasticsearch en memoria), así se puede correr en CI sin el clúster. Reporta
+documentos por segundo y la latencia por etapa; con --min-docs-per-second
+termina con código 1 si el throughput queda por debajo del umbral.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import importlib.util
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(ROOT, 'docker', 'common'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Configuración de los servicios para la ejecución local (antes de importarlos)
+BENCH_ENV = {
+    'BUCKET': 'bench',
+    'KEY': 'bench',
+    'MARIADB_TABLE': 'objects',
+    'RABBITMQ_QUEUE': 'documents',
+    'RABBITMQ_QUEUE_DST': 'processed',
+    'ELASTICSEARCH_INDEX': 'documents',
+    'ELASTICSEARCH_INDEX_DST': 'processed_documents',
+    'METRICS_PORT': '0',
+    'LOG_SAMPLE_RATE': '0',
+    'LOG_LEVEL': 'WARNING',
+    'MESSAGE_FORMAT': 'json',
+}
+for name, value in BENCH_ENV.items():
+    os.environ.setdefault(name, value)
+
+from pipeline import metrics, tracing, trace_report, lanes
+from standins import FakeS3, FakeElasticsearch, SQLiteDatabase, FakeBroker
+
+SERVICES = {
+    'spider': os.path.join(ROOT, 'docker', 's3-spider', 'app'),
+    'downloader': os.path.join(ROOT, 'docker', 'downloader', 'app'),
+    'procesor': os.path.join(ROOT, 'docker', 'procesor', 'app'),
+}
+
+CATEGORIES = ['Electronics', 'Cell Phones & Accessories', 'Computers/Tablets', 'Cameras & Photo',
+              'Home & Garden', 'Sporting Goods', 'Toys & Hobbies', 'Collectibles']
+WORDS = ('vintage new sealed original genuine wireless portable premium stainless compact '
+         'bundle refurbished edition classic pro mini ultra rechargeable leather steel').split()
+
+
+def load_service(name):
+    """Importa el app.py de un servicio con un nombre propio (los tres se llaman app)"""
+    app_dir = SERVICES[name]
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    spec = importlib.util.spec_from_file_location(f"bench_{name}_app", os.path.join(app_dir, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def product_page(item_id, rng, structured=True, filler_kb=40):
+    """Página de producto sintética con el marcado de eBay que reconoce el perfil"""
+    name = ' '.join(rng.choice(WORDS) for _ in range(6)).title()
+    price = f"{rng.randint(1, 999)}.{rng.randint(0, 99):02d}"
+    categories = rng.sample(CATEGORIES, 3)
+    images = [f"https://i.ebayimg.com/images/g/{item_id}{index}/s-l500.jpg" for index in range(4)]
+    description = ' '.join(rng.choice(WORDS) for _ in range(80))
+    json_ld = ''
+    if structured:
+        json_ld = '<script type="application/ld+json">' + json.dumps({
+            '@context': 'https://schema.org', '@type': 'Product', 'name': name,
+            'description': description, 'image': images, 'category': ' > '.join(categories),
+            'offers': {'@type': 'Offer', 'price': price, 'priceCurrency': 'USD'}
+        }) + '</script>'
+    filler = ''.join(f'<div class="x-recs"><a href="/itm/{rng.randint(10**11, 10**12)}">'
+                     f'{" ".join(rng.choice(WORDS) for _ in range(8))}</a></div>'
+                     for _ in range(filler_kb * 10))
+    breadcrumbs = ''.join(f'<a class="seo-breadcrumb-text" href="#"><span>{category}</span></a>'
+                          for category in categories)
+    carousel = ''.join(f'<img src="{image}">' for image in images)
+    return (f'<html><head><title>{name} | eBay</title>{json_ld}</head><body>'
+            f'<nav class="breadcrumb">{breadcrumbs}</nav>'
+            f'<h1 class="x-item-title__mainTitle"><span>{name}</span></h1>'
+            f'<div class="x-price-primary"><span>US ${price}</span></div>'
+            f'<div class="ux-image-carousel">{carousel}</div>'
+            f'<div id="desc_div">{description}</div>{filler}</body></html>')
+
+
+def seed_pages(s3, bucket, key, documents, seed=0, structured_ratio=0.5, filler_kb=40):
+    rng = random.Random(seed)
+    names = []
+    for index in range(documents):
+        item_id = 100000000000 + index
+        file_name = f"ebay_product_{item_id}.html"
+        html = product_page(item_id, rng, rng.random() < structured_ratio, filler_kb)
+        s3.put_object(Bucket=bucket, Key=f"{key}/{file_name}", Body=html)
+        names.append(file_name)
+    return names
+
+
+class Harness:
+    """Conecta los tres servicios con los reemplazos locales"""
+
+    def __init__(self, workdir):
+        self.s3 = FakeS3()
+        self.es = FakeElasticsearch()
+        self.broker = FakeBroker()
+        self.spider = load_service('spider')
+        self.downloader = load_service('downloader')
+        self.procesor = load_service('procesor')
+        config = self.spider.config
+        self.config = config
+        self.db = SQLiteDatabase(os.path.join(workdir, 'pipeline.db'), config.mariadb.table)
+
+        for module in (self.spider, self.downloader):
+            module.get_s3_client = lambda: self.s3
+            module.db_connection = self.db.connection
+        self.spider.get_amqp_channel = self.broker.channel
+        self.downloader.get_elasticsearch = lambda: self.es
+
+        # El procesador se arma sin __init__ para no conectarse a los servicios reales
+        processor = self.procesor.DocumentProcessor.__new__(self.procesor.DocumentProcessor)
+        processor.profiles = self.procesor.load_profiles()
+        processor.es = self.es
+        processor.s3_client = self.s3
+        processor.mariadb_connection = self.db
+        processor.mariadb_cursor = self.db.cursor()
+        self.processor = processor
+
+    def consume(self, base_queue, callback, upstream_done):
+        """Consume los carriles de una cola hasta que el servicio anterior terminó y quedaron vacíos.
+
+        Los carriles se atienden en orden de prioridad (nuevos primero).
+        """
+        channel = self.broker.channel()
+        queues = [lane.queue for lane in lanes.configured(base_queue)]
+        consumed = 0
+        while True:
+            delivery = next((item for item in (self.broker.get(queue) for queue in queues) if item), None)
+            if delivery is None:
+                if upstream_done.is_set() and not any(self.broker.depth(queue) for queue in queues):
+                    return consumed
+                time.sleep(0.01)
+                continue
+            method, properties, body = delivery
+            callback(channel, method, properties, body)
+            consumed += 1
+
+    def run(self):
+        """Ejecuta los tres servicios en hilos concurrentes, como en el clúster"""
+        spider_done, downloader_done = threading.Event(), threading.Event()
+        rabbitmq = self.config.rabbitmq
+        counts = {}
+        timings = {}
+
+        def run_spider():
+            started = time.perf_counter()
+            try:
+                with metrics.service_context(self.spider.SERVICE):
+                    self.spider.main()
+            finally:
+                timings['spider'] = time.perf_counter() - started
+                spider_done.set()
+
+        def run_downloader():
+            started = time.perf_counter()
+            try:
+                with metrics.service_context('downloader'):
+                    counts['downloader'] = self.consume(rabbitmq.queue, self.downloader.callback, spider_done)
+            finally:
+                timings['downloader'] = time.perf_counter() - started
+                downloader_done.set()
+
+        def run_procesor():
+            started = time.perf_counter()
+            with metrics.service_context(self.procesor.SERVICE):
+                counts['procesor'] = self.consume(rabbitmq.queue_dst, self.processor.process_message, downloader_done)
+            timings['procesor'] = time.perf_counter() - started
+
+        threads = [threading.Thread(target=target, name=name) for name, target in
+                   (('spider', run_spider), ('downloader', run_downloader), ('procesor', run_procesor))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, counts, timings
+
+
+def stage_means():
+    """Duración media en ms de cada etapa instrumentada con metrics.stage"""
+    return {f"{service}/{stage}": round(total / count * 1000, 3)
+            for (service, stage), (count, total) in sorted(metrics.stage_totals().items()) if count}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--structured-ratio', type=float, default=0.5,
+                        help='fracción de páginas con JSON-LD (el resto requiere el DOM)')
+    parser.add_argument('--filler-kb', type=int, default=40, help='tamaño aproximado del relleno de cada página')
+    parser.add_argument('--json', help='archivo donde guardar los resultados')
+    parser.add_argument('--min-docs-per-second', type=float, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        trace_file = os.path.join(workdir, 'traces.jsonl')
+        tracing.configure_export(trace_file)
+        harness = Harness(workdir)
+        names = seed_pages(harness.s3, harness.config.s3.bucket, harness.config.s3.key, args.documents,
+                           args.seed, args.structured_ratio, args.filler_kb)
+        try:
+            elapsed, counts, timings = harness.run()
+        finally:
+            tracing.configure_export('')
+            for file_name in names:
+                # El downloader deja una copia local de cada archivo
+                try:
+                    os.remove(f"/tmp/{file_name}")
+                except OSError:
+                    pass
+        stages, lag = trace_report.summarize(trace_report.load_records([trace_file]))
+        statuses = harness.db.count_by_status()
+        indexed = len(harness.es.indices_data[harness.config.elasticsearch.index_dst])
+
+    result = {
+        'documents': args.documents,
+        'processed': indexed,
+        'statuses': statuses,
+        'elapsed_seconds': round(elapsed, 3),
+        'docs_per_second': round(indexed / elapsed, 2) if elapsed else 0,
+        'service_seconds': {name: round(value, 3) for name, value in timings.items()},
+        'consumed': counts,
+        'trace_stages_ms': {f"{service}/{stage}": summary for (service, stage), summary in stages.items()},
+        'stage_mean_ms': stage_means(),
+        'freshness_lag_ms': lag,
+    }
+
+    print(f"Documentos: {indexed}/{args.documents} procesados en {elapsed:.2f}s "
+          f"({result['docs_per_second']} docs/s)")
+    print(f"{'etapa':<24}{'n':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, summary in result['trace_stages_ms'].items():
+        print(f"{name:<24}{summary['count']:>6}{summary['p50']:>9}{summary['p95']:>9}{summary['p99']:>9}")
+    print(f"\n{'etapa (media)':<30}{'ms':>9}")
+    for name, mean in result['stage_mean_ms'].items():
+        print(f"{name:<30}{mean:>9}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+
+    if indexed != args.documents:
+        print(f"ERROR: se esperaban {args.documents} documentos procesados y hay {indexed}")
+        return 1
+    if args.min_docs_per_second and result['docs_per_second'] < args.min_docs_per_second:
+        print(f"ERROR: {result['docs_per_second']} docs/s está por debajo del mínimo {args.min_docs_per_second}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
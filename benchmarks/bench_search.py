@@ -0,0 +1,84 @@
+"""Benchmark de la latencia del servicio de búsqueda con la caché de consultas.
+
+Uso: python benchmarks/bench_search.py [--iterations 10000] [--writes-per-second 0]
+
+Mide SearchService.search con Elasticsearch simulado (respuesta inmediata), así
+el número es el costo propio del servicio: normalizar la consulta, buscar en la
+caché y, en un fallo, serializar la página. Con --writes-per-second se simulan
+los eventos del procesador entre consultas para ver la tasa de aciertos con
+ingesta continua.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from unittest.mock import MagicMock
+from urllib.parse import parse_qs
+
+os.environ.setdefault('ELASTICSEARCH_INDEX_DST', 'processed_documents')
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'search', 'app')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'common')))
+
+from app import SearchService, apply_write_event
+from query_cache import QueryCache
+
+QUERIES = ['q=wireless+mouse', 'q=Wireless%20Mouse&size=20', 'category=Electronics', 'min=10&max=50']
+ENDPOINTS = ['search', 'search', 'category', 'price']
+
+
+def es_response(size=20):
+    return {'hits': {'total': {'value': 500}, 'hits': [
+        {'_id': str(doc_id), '_source': {'product_name': f"Producto {doc_id}", 'price_value': 10.0 + doc_id,
+                                         'categories': ['Electronics']},
+         'sort': [1.5, str(doc_id)]} for doc_id in range(size)]}}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def bench(iterations, writes_per_second=0.0, settle=1.0):
+    """Retorna latencias en microsegundos por resultado de la caché"""
+    es = MagicMock()
+    es.search.return_value = es_response()
+    # Reloj simulado: cada consulta avanza 1 ms, así las ventanas de refresco son reproducibles
+    clock = [0.0]
+    cache = QueryCache(max_entries=1024, ttl=30, settle=settle, clock=lambda: clock[0])
+    service = SearchService(es, 'processed_documents', cache)
+    params = [(endpoint, parse_qs(query)) for endpoint, query in zip(ENDPOINTS, QUERIES)]
+    write_every = int(1000 / writes_per_second) if writes_per_second else 0
+
+    latencies = {'hit': [], 'miss': []}
+    for iteration in range(iterations):
+        if write_every and iteration % write_every == 0:
+            apply_write_event(cache, {'document_id': iteration, 'fields': ['product_name', 'price_value']})
+        endpoint, query = params[iteration % len(params)]
+        started = time.perf_counter()
+        _, result = service.search(endpoint, query)
+        latencies[result].append((time.perf_counter() - started) * 1e6)
+        clock[0] += 0.001
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--writes-per-second', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    latencies = bench(args.iterations, args.writes_per_second)
+    print(f"{'resultado':<10}{'consultas':>10}{'p50 µs':>10}{'p99 µs':>10}{'media µs':>10}")
+    for result, samples in latencies.items():
+        if samples:
+            print(f"{result:<10}{len(samples):>10}{percentile(samples, 0.5):>10.1f}"
+                  f"{percentile(samples, 0.99):>10.1f}{statistics.mean(samples):>10.1f}")
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"Tasa de aciertos: {len(latencies['hit']) / total:.1%}")
+    return latencies
+
+
+if __name__ == '__main__':
+    main()
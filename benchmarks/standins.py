@@ -0,0 +1,232 @@
+"""Reemplazos locales de S3, RabbitMQ, MariaDB y Elasticsearch para los benchmarks.
+
+Implementan solo la parte de cada cliente que usan los servicios del pipeline,
+en memoria o sobre SQLite, para medir el código real sin el stack de Kubernetes.
+"""
+import io
+import json
+import queue
+import sqlite3
+import hashlib
+import threading
+import datetime
+from collections import defaultdict
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+from elasticsearch import NotFoundError
+
+
+class FakeBody:
+    """Cuerpo de get_object con la interfaz de botocore StreamingBody"""
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, amount=None):
+        return self._stream.read(amount)
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self._stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class FakeS3:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        data = Body.encode('utf-8') if isinstance(Body, str) else Body
+        with self._lock:
+            self.objects[(Bucket, Key)] = (data, datetime.datetime.now(datetime.timezone.utc), kwargs)
+        return {'ETag': hashlib.md5(data).hexdigest()}
+
+    def list_objects_v2(self, Bucket, Prefix=''):
+        with self._lock:
+            items = [(key, value) for (bucket, key), value in self.objects.items()
+                     if bucket == Bucket and key.startswith(Prefix)]
+        return {'Contents': [{'Key': key, 'Size': len(data), 'LastModified': modified}
+                             for key, (data, modified, _) in sorted(items)]}
+
+    def _get(self, Bucket, Key):
+        try:
+            return self.objects[(Bucket, Key)]
+        except KeyError:
+            raise FileNotFoundError(f"s3://{Bucket}/{Key}")
+
+    def get_object(self, Bucket, Key):
+        data, modified, extra = self._get(Bucket, Key)
+        response = {'Body': FakeBody(data), 'ContentLength': len(data), 'LastModified': modified}
+        if extra.get('ContentEncoding'):
+            response['ContentEncoding'] = extra['ContentEncoding']
+        return response
+
+    def download_file(self, Bucket, Key, Filename):
+        data, _, _ = self._get(Bucket, Key)
+        with open(Filename, 'wb') as file:
+            file.write(data)
+
+
+class FakeElasticsearch:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.indices_data = defaultdict(dict)
+        self.indices = MagicMock()
+
+    def _not_found(self, index, id):
+        return NotFoundError(f"{index}/{id} no existe", MagicMock(status=404), {})
+
+    def index(self, index, document=None, body=None, id=None, **kwargs):
+        with self._lock:
+            if id is None:
+                self._next_id += 1
+                id = f"doc-{self._next_id}"
+            self.indices_data[index][str(id)] = json.loads(json.dumps(document if document is not None else body))
+        return {'_id': id, 'result': 'created'}
+
+    def get(self, index, id, _source_includes=None, **kwargs):
+        source = self.indices_data[index].get(str(id))
+        if source is None:
+            raise self._not_found(index, id)
+        if _source_includes:
+            source = {name: source[name] for name in _source_includes if name in source}
+        return {'_id': id, '_source': source}
+
+    def update(self, index, id, doc, **kwargs):
+        with self._lock:
+            source = self.indices_data[index].get(str(id))
+            if source is None:
+                raise self._not_found(index, id)
+            source.update(json.loads(json.dumps(doc)))
+        return {'_id': id, 'result': 'updated'}
+
+    def close(self):
+        pass
+
+
+class SQLiteCursor:
+    """Cursor que acepta los placeholders %s de pymysql"""
+
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(query.replace('%s', '?'), params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteDatabase:
+    """Base SQLite con la tabla de documentos de MariaDB; una conexión por hilo"""
+
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        connection = self._connect()
+        connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path_documento TEXT UNIQUE,
+                estado TEXT,
+                md5_hash TEXT
+            )
+        """)
+        connection.commit()
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit y WAL: los tres servicios escriben en paralelo como en MariaDB
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def cursor(self):
+        return SQLiteCursor(self._connect())
+
+    def commit(self):
+        self._connect().commit()
+
+    def ping(self, reconnect=True):
+        pass
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def connection(self):
+        """Mismo uso que pipeline.clients.db_connection()"""
+        yield self
+
+    def count_by_status(self):
+        cursor = self._connect().execute(f"SELECT estado, COUNT(*) FROM {self.table} GROUP BY estado")
+        return dict(cursor.fetchall())
+
+
+class FakeMethod:
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+
+
+class FakeBroker:
+    """Broker en proceso: una cola FIFO por routing key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queues = defaultdict(queue.Queue)
+        self._delivery_tag = 0
+        self.acked = 0
+
+    def channel(self):
+        return FakeChannel(self)
+
+    def publish(self, routing_key, body, properties):
+        self.queues[routing_key].put((body, properties))
+
+    def get(self, routing_key, timeout=None):
+        """Retorna (method, properties, body) o None si la cola está vacía"""
+        try:
+            body, properties = self.queues[routing_key].get(timeout=timeout) if timeout \
+                else self.queues[routing_key].get_nowait()
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._delivery_tag += 1
+            tag = self._delivery_tag
+        return FakeMethod(tag), properties, body
+
+    def depth(self, routing_key):
+        return self.queues[routing_key].qsize()
+
+
+class FakeChannel:
+    is_open = True
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def queue_declare(self, queue, durable=False, **kwargs):
+        return MagicMock(method=MagicMock(message_count=self.broker.depth(queue)))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.broker.publish(routing_key, body, properties)
+
+    def basic_ack(self, delivery_tag):
+        with self.broker._lock:
+            self.broker.acked += 1
+
+    def basic_qos(self, prefetch_count=None):
+        pass
@@ -0,0 +1,61 @@
+import os
+import time
+import signal
+import logging
+from pipeline.config import load_config
+from pipeline import metrics, autoscaling
+
+# Configuración de logging
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('autoscaler')
+SERVICE = 'autoscaler'
+metrics.configure(SERVICE)
+
+config = load_config()
+# Segundos entre consultas a la API de administración
+AUTOSCALER_INTERVAL = float(os.getenv('AUTOSCALER_INTERVAL', '15'))
+# Mensajes por segundo que sostiene una réplica de cada etapa
+DOWNLOADER_CAPACITY = float(os.getenv('AUTOSCALE_DOWNLOADER_CAPACITY', str(autoscaling.AUTOSCALE_REPLICA_CAPACITY)))
+PROCESOR_CAPACITY = float(os.getenv('AUTOSCALE_PROCESOR_CAPACITY', str(autoscaling.AUTOSCALE_REPLICA_CAPACITY)))
+
+
+def build_controller(client=None):
+    """Controlador de las etapas que consumen de RabbitMQ: el downloader y el procesador.
+
+    El spider es un job que lista el bucket una vez por ciclo: no se escala por
+    profundidad de cola, se frena con la contrapresión.
+    """
+    client = client or autoscaling.ManagementClient(user=config.rabbitmq.user, password=config.rabbitmq.password)
+    stages = [
+        autoscaling.stage_for('downloader', config.rabbitmq.queue, capacity=DOWNLOADER_CAPACITY),
+        autoscaling.stage_for('procesor', config.rabbitmq.queue_dst, capacity=PROCESOR_CAPACITY),
+    ]
+    return autoscaling.Controller(client, stages)
+
+
+def run(controller, interval=AUTOSCALER_INTERVAL, sleep=time.sleep, running=lambda: True):
+    while running():
+        result = controller.poll()
+        if result:
+            logger.info(", ".join(f"{name}: {stage['messages']} mensajes, {stage['current']} -> {stage['desired']} réplicas"
+                                  for name, stage in result.items()))
+        sleep(interval)
+
+
+def main():
+    controller = build_controller()
+    metrics.start_metrics_server(routes={'/backpressure': controller.route})
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+    logger.info(f"Consultando {controller.client.url} cada {AUTOSCALER_INTERVAL}s")
+    try:
+        run(controller, running=lambda: not stopped)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,21 @@
 # $1 is the username
 
 # Current directory is ~/Documents/Repositorios Bases II/Repositorio Grupal/2025-01-IC4302-PO/PO/docker
-# Navigate to the downloader directory
-cd downloader
-docker build -t $1/downloader .
+# The build context is this directory so every image can copy the shared code in common/
+docker build -t $1/downloader -f downloader/Dockerfile .
 docker push $1/downloader
 
-# Navigate back and then to s3-spider
-cd ../s3-spider
-docker build -t $1/s3-spider .
+docker build -t $1/s3-spider -f s3-spider/Dockerfile .
 docker push $1/s3-spider
 
-cd ../procesor
-docker build -t $1/procesor .
+docker build -t $1/procesor -f procesor/Dockerfile .
 docker push $1/procesor
 
+docker build -t $1/autoscaler -f autoscaler/Dockerfile .
+docker push $1/autoscaler
+
+docker build -t $1/search -f search/Dockerfile .
+docker push $1/search
+
 # View running containers
-docker ps
\ No newline at end of file
+docker ps
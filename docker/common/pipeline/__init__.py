@@ -0,0 +1 @@
+"""Código compartido por los servicios del pipeline"""
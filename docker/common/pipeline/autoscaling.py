@@ -0,0 +1,249 @@
+import os
+import json
+import math
+import time
+import base64
+import logging
+from dataclasses import dataclass
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+from prometheus_client import Counter, Gauge
+from pipeline import metrics, lanes
+
+logger = logging.getLogger('pipeline.autoscaling')
+
+# API de administración de RabbitMQ (plugin rabbitmq_management)
+RABBITMQ_MANAGEMENT = os.getenv('RABBITMQ_MANAGEMENT', 'http://databases-rabbitmq:15672')
+RABBITMQ_VHOST = os.getenv('RABBITMQ_VHOST', '/')
+# Segundos en los que se quiere vaciar el backlog de cada etapa
+AUTOSCALE_TARGET_SECONDS = float(os.getenv('AUTOSCALE_TARGET_SECONDS', '60'))
+AUTOSCALE_MIN_REPLICAS = int(os.getenv('AUTOSCALE_MIN_REPLICAS', '1'))
+AUTOSCALE_MAX_REPLICAS = int(os.getenv('AUTOSCALE_MAX_REPLICAS', '10'))
+# Mensajes por segundo que procesa una réplica de forma sostenida (medido con carga,
+# no la tasa observada: con la cola vacía las réplicas confirman lo poco que llega)
+AUTOSCALE_REPLICA_CAPACITY = float(os.getenv('AUTOSCALE_REPLICA_CAPACITY', '10'))
+# Con más mensajes que HIGH_WATER en una cola de etapa el spider deja de publicar
+# hasta que todas bajan de LOW_WATER (la histéresis evita pausas intermitentes)
+BACKPRESSURE_HIGH_WATER = int(os.getenv('BACKPRESSURE_HIGH_WATER', '5000'))
+BACKPRESSURE_LOW_WATER = int(os.getenv('BACKPRESSURE_LOW_WATER', str(BACKPRESSURE_HIGH_WATER // 2)))
+# Endpoint /backpressure del controlador que consulta el spider (vacío = sin freno)
+BACKPRESSURE_URL = os.getenv('BACKPRESSURE_URL', '')
+BACKPRESSURE_POLL = float(os.getenv('BACKPRESSURE_POLL', '5'))
+# Espera máxima por publicación: si el controlador no libera, el spider sigue igual
+BACKPRESSURE_MAX_WAIT = float(os.getenv('BACKPRESSURE_MAX_WAIT', '300'))
+
+QUEUE_MESSAGES = Gauge('pipeline_queue_messages', 'Mensajes en cada cola de etapa', ['queue'])
+QUEUE_RATE = Gauge('pipeline_queue_rate', 'Mensajes por segundo publicados y confirmados por cola',
+                   ['queue', 'kind'])
+CURRENT_REPLICAS = Gauge('pipeline_autoscaler_current_replicas', 'Consumidores activos por etapa', ['stage'])
+DESIRED_REPLICAS = Gauge('pipeline_autoscaler_desired_replicas', 'Réplicas deseadas por etapa', ['stage'])
+BACKPRESSURE = Gauge('pipeline_backpressure', '1 mientras el spider debe dejar de publicar')
+POLL_ERRORS = Counter('pipeline_autoscaler_errors_total', 'Consultas fallidas a la API de administración')
+THROTTLE_SECONDS = Counter('pipeline_backpressure_wait_seconds_total',
+                           'Tiempo que el productor esperó por contrapresión', ['service'])
+
+
+@dataclass(frozen=True)
+class QueueStats:
+    name: str
+    messages: int = 0
+    consumers: int = 0
+    publish_rate: float = 0.0
+    ack_rate: float = 0.0
+
+    @classmethod
+    def from_api(cls, item):
+        stats = item.get('message_stats') or {}
+
+        def rate(key):
+            return float((stats.get(key) or {}).get('rate') or 0)
+
+        return cls(
+            name=item['name'],
+            messages=int(item.get('messages') or 0),
+            consumers=int(item.get('consumers') or 0),
+            publish_rate=rate('publish_details'),
+            # Con auto_ack los mensajes se cuentan como deliver_no_ack
+            ack_rate=rate('ack_details') or rate('deliver_no_ack_details'),
+        )
+
+
+class ManagementClient:
+    """Cliente mínimo de la API HTTP de administración de RabbitMQ"""
+
+    def __init__(self, url=RABBITMQ_MANAGEMENT, user=None, password=None, vhost=RABBITMQ_VHOST, timeout=10,
+                 opener=urlopen):
+        self.url = url.rstrip('/')
+        self.vhost = vhost
+        self.timeout = timeout
+        self.opener = opener
+        self.auth = None
+        if user:
+            self.auth = base64.b64encode(f"{user}:{password or ''}".encode('utf-8')).decode('ascii')
+
+    def queues(self):
+        """Estadísticas de todas las colas del vhost en una sola consulta, por nombre"""
+        request = Request(f"{self.url}/api/queues/{quote(self.vhost, safe='')}")
+        if self.auth:
+            request.add_header('Authorization', f"Basic {self.auth}")
+        with self.opener(request, timeout=self.timeout) as response:
+            items = json.loads(response.read().decode('utf-8'))
+        return {item['name']: QueueStats.from_api(item) for item in items}
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    queues: tuple
+    min_replicas: int = AUTOSCALE_MIN_REPLICAS
+    max_replicas: int = AUTOSCALE_MAX_REPLICAS
+    target_seconds: float = AUTOSCALE_TARGET_SECONDS
+    capacity: float = AUTOSCALE_REPLICA_CAPACITY
+
+
+def stage_for(name, base_queue, **kwargs):
+    """Etapa que consume `base_queue` y sus carriles (las colas de reintento no cuentan)"""
+    return Stage(name, tuple(lane.queue for lane in lanes.configured(base_queue)), **kwargs)
+
+
+def desired_replicas(stage, stats):
+    """Réplicas necesarias para absorber lo que entra y vaciar el backlog en target_seconds.
+
+    Cada réplica aporta `stage.capacity` mensajes por segundo. Para subir se salta
+    directo a lo necesario; para bajar se quita una réplica por consulta, así una
+    caída momentánea de la tasa no vacía la etapa de golpe.
+    """
+    messages = sum(item.messages for item in stats)
+    publish_rate = sum(item.publish_rate for item in stats)
+    # Con carriles cada réplica tiene un consumidor por cola
+    current = max((item.consumers for item in stats), default=0)
+
+    needed = math.ceil((publish_rate + messages / stage.target_seconds) / stage.capacity)
+    desired = needed if needed >= current else max(needed, current - 1)
+    return current, min(max(desired, stage.min_replicas), stage.max_replicas)
+
+
+class Backpressure:
+    """Freno del productor con histéresis entre la marca alta y la baja"""
+
+    def __init__(self, high_water=BACKPRESSURE_HIGH_WATER, low_water=BACKPRESSURE_LOW_WATER):
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+        self.paused = False
+        self.deepest = None
+
+    def update(self, depths):
+        self.deepest = max(depths, key=depths.get) if depths else None
+        deepest = depths.get(self.deepest, 0)
+        if not self.paused and deepest > self.high_water:
+            self.paused = True
+            logger.warning(f"Contrapresión activada: {self.deepest} tiene {deepest} mensajes")
+        elif self.paused and deepest < self.low_water:
+            self.paused = False
+            logger.info(f"Contrapresión liberada: la cola más profunda tiene {deepest} mensajes")
+        BACKPRESSURE.set(1 if self.paused else 0)
+        return self.paused
+
+
+class Controller:
+    """Consulta la profundidad y tasas de las colas y calcula réplicas y contrapresión.
+
+    No escala nada por sí mismo: deja las réplicas deseadas como métrica para un
+    autoescalador (HPA con métricas externas o KEDA) y publica el estado del freno
+    en /backpressure para el spider.
+    """
+
+    def __init__(self, client, stages, backpressure=None, clock=time.time):
+        self.client = client
+        self.stages = stages
+        self.backpressure = backpressure or Backpressure()
+        self.clock = clock
+        self.last = {}
+        self.updated_at = None
+
+    def poll(self):
+        try:
+            queues = self.client.queues()
+        except Exception as e:
+            POLL_ERRORS.inc()
+            logger.error(f"No se pudo consultar la API de administración de RabbitMQ: {e}")
+            return None
+
+        depths, result = {}, {}
+        for stage in self.stages:
+            stats = [queues.get(name) or QueueStats(name) for name in stage.queues]
+            for item in stats:
+                depths[item.name] = item.messages
+                QUEUE_MESSAGES.labels(queue=item.name).set(item.messages)
+                QUEUE_RATE.labels(queue=item.name, kind='publish').set(item.publish_rate)
+                QUEUE_RATE.labels(queue=item.name, kind='ack').set(item.ack_rate)
+            current, desired = desired_replicas(stage, stats)
+            CURRENT_REPLICAS.labels(stage=stage.name).set(current)
+            DESIRED_REPLICAS.labels(stage=stage.name).set(desired)
+            result[stage.name] = {'current': current, 'desired': desired,
+                                  'messages': sum(item.messages for item in stats)}
+
+        self.backpressure.update(depths)
+        self.last = result
+        self.updated_at = self.clock()
+        return result
+
+    def state(self):
+        """Cuerpo JSON de /backpressure"""
+        return {
+            'paused': self.backpressure.paused,
+            'deepest_queue': self.backpressure.deepest,
+            'high_water': self.backpressure.high_water,
+            'low_water': self.backpressure.low_water,
+            'stages': self.last,
+            'updated_at': self.updated_at,
+        }
+
+    def route(self):
+        return 'application/json', json.dumps(self.state()).encode('utf-8')
+
+
+class Throttle:
+    """Lado del productor: espera antes de publicar mientras el controlador indique pausa.
+
+    El estado se consulta como mucho una vez cada `poll_interval` segundos. Si el
+    controlador no responde se sigue publicando (falla abierto) y ninguna espera
+    supera `max_wait`, así una caída del controlador no detiene al spider.
+    """
+
+    def __init__(self, url=BACKPRESSURE_URL, poll_interval=BACKPRESSURE_POLL, max_wait=BACKPRESSURE_MAX_WAIT,
+                 opener=urlopen, sleep=time.sleep, clock=time.monotonic):
+        self.url = url
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.opener = opener
+        self.sleep = sleep
+        self.clock = clock
+        self._paused = False
+        self._checked_at = None
+
+    def paused(self):
+        now = self.clock()
+        if self._checked_at is not None and now - self._checked_at < self.poll_interval:
+            return self._paused
+        self._checked_at = now
+        try:
+            with self.opener(self.url, timeout=self.poll_interval) as response:
+                self._paused = bool(json.loads(response.read().decode('utf-8')).get('paused'))
+        except Exception as e:
+            logger.warning(f"No se pudo consultar la contrapresión en {self.url}: {e}")
+            self._paused = False
+        return self._paused
+
+    def wait(self):
+        """Retorna los segundos esperados (0 si no hay freno configurado o activo)"""
+        if not self.url:
+            return 0
+        waited = 0
+        while waited < self.max_wait and self.paused():
+            self.sleep(self.poll_interval)
+            waited += self.poll_interval
+        if waited:
+            THROTTLE_SECONDS.labels(service=metrics.current_service()).inc(waited)
+            logger.info(f"Publicación frenada {waited:.0f}s por contrapresión")
+        return waited
@@ -0,0 +1,207 @@
+import os
+import time
+import uuid
+import socket
+import logging
+from elasticsearch import ConflictError, NotFoundError
+
+logger = logging.getLogger('pipeline.bulk_ingest')
+
+# Configuración del modo de carga masiva
+BULK_INGEST = os.getenv('BULK_INGEST', 'false').lower() == 'true'
+BULK_INGEST_THRESHOLD = int(os.getenv('BULK_INGEST_THRESHOLD', '0'))
+BULK_INGEST_CHECK_INTERVAL = int(os.getenv('BULK_INGEST_CHECK_INTERVAL', '30'))
+BULK_INGEST_REPLICAS = int(os.getenv('BULK_INGEST_REPLICAS', '0'))
+BULK_INGEST_MAX_SEGMENTS = int(os.getenv('BULK_INGEST_MAX_SEGMENTS', '0'))
+BULK_INGEST_STATE_INDEX = os.getenv('BULK_INGEST_STATE_INDEX', 'bulk_ingest_state')
+# Un participante sin latido en este tiempo se considera muerto
+BULK_INGEST_HEARTBEAT_TIMEOUT = int(os.getenv('BULK_INGEST_HEARTBEAT_TIMEOUT', str(BULK_INGEST_CHECK_INTERVAL * 4)))
+
+TUNED_SETTINGS = ['index.refresh_interval', 'index.number_of_replicas']
+
+
+class BulkIngestMode:
+    """Desactiva el refresh y reduce réplicas de los índices durante una carga masiva.
+
+    Los valores originales se guardan en el índice BULK_INGEST_STATE_INDEX antes de
+    modificarlos, junto con las réplicas del servicio que participan de la carga
+    (`owners`, con el último latido de cada una). Cada réplica se quita del registro
+    al salir y solo la última restaura los índices; al iniciar se restauran solo
+    los registros cuyos participantes dejaron de latir (workers que murieron).
+    Las escrituras del registro usan control de concurrencia optimista.
+    """
+
+    def __init__(self, es, indices, forced=BULK_INGEST, threshold=BULK_INGEST_THRESHOLD,
+                 replicas=BULK_INGEST_REPLICAS, max_segments=BULK_INGEST_MAX_SEGMENTS,
+                 state_index=BULK_INGEST_STATE_INDEX, heartbeat_timeout=BULK_INGEST_HEARTBEAT_TIMEOUT,
+                 owner=None, clock=time.time):
+        self.es = es
+        self.indices = [index for index in indices if index]
+        self.forced = forced
+        self.threshold = threshold
+        self.replicas = replicas
+        self.max_segments = max_segments
+        self.state_index = state_index
+        self.heartbeat_timeout = heartbeat_timeout
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.clock = clock
+        self.active = False
+
+    def _state(self, index):
+        """(registro, seq_no, primary_term) o None si el índice no está en carga masiva"""
+        try:
+            response = self.es.get(index=self.state_index, id=index)
+        except NotFoundError:
+            return None
+        return response['_source'], response['_seq_no'], response['_primary_term']
+
+    def _live_owners(self, state):
+        now = self.clock()
+        return {owner: beat for owner, beat in (state.get('owners') or {}).items()
+                if now - beat < self.heartbeat_timeout}
+
+    def _join(self, index):
+        """Registra (o renueva) a esta réplica; retorna True si creó el registro"""
+        while True:
+            current = self._state(index)
+            if current is None:
+                response = self.es.indices.get_settings(index=index, name=TUNED_SETTINGS, flat_settings=True)
+                settings = response.get(index, {}).get('settings', {})
+                state = {'index': index, 'settings': {name: settings.get(name) for name in TUNED_SETTINGS},
+                         'started_at': self.clock(), 'owners': {self.owner: self.clock()}}
+                try:
+                    self.es.index(index=self.state_index, id=index, document=state, op_type='create', refresh=True)
+                    return True
+                except ConflictError:
+                    # Otra réplica registró los valores originales al mismo tiempo
+                    continue
+            state, seq_no, primary_term = current
+            state['owners'] = {**self._live_owners(state), self.owner: self.clock()}
+            try:
+                self.es.index(index=self.state_index, id=index, document=state, if_seq_no=seq_no,
+                              if_primary_term=primary_term, refresh=True)
+                return False
+            except ConflictError:
+                continue
+
+    def _tune(self, index):
+        self.es.indices.put_settings(index=index, settings={
+            'index.refresh_interval': '-1',
+            'index.number_of_replicas': self.replicas
+        })
+
+    def enter(self):
+        if self.active:
+            return
+        for index in self.indices:
+            if not self._join(index):
+                logger.info(f"Configuración original de {index} ya registrada, se conserva")
+            self._tune(index)
+            logger.info(f"Modo de carga masiva activado en {index}")
+        self.active = True
+
+    def heartbeat(self):
+        """Renueva el latido de esta réplica en cada índice mientras la carga sigue activa"""
+        if not self.active:
+            return
+        for index in self.indices:
+            if self._join(index):
+                # El registro se había restaurado como abandonado: volver a ajustar el índice
+                logger.warning(f"Registro de carga masiva de {index} perdido, se vuelve a activar")
+                self._tune(index)
+
+    def _restore(self, index, state, seq_no, primary_term):
+        """Restaura la configuración original; False si otra réplica se sumó mientras tanto"""
+        settings = state['settings']
+        # None restablece el valor por defecto del clúster
+        self.es.indices.put_settings(index=index, settings={name: settings.get(name) for name in TUNED_SETTINGS})
+        try:
+            self.es.delete(index=self.state_index, id=index, if_seq_no=seq_no, if_primary_term=primary_term,
+                           refresh=True)
+        except ConflictError:
+            # La réplica que se sumó sigue cargando: el índice vuelve al modo masivo
+            self._tune(index)
+            return False
+        except NotFoundError:
+            return True
+        self.es.indices.refresh(index=index)
+        if self.max_segments:
+            self.es.indices.forcemerge(index=index, max_num_segments=self.max_segments, wait_for_completion=False)
+        logger.info(f"Configuración original de {index} restaurada")
+        return True
+
+    def _leave(self, index):
+        while True:
+            current = self._state(index)
+            if current is None:
+                return
+            state, seq_no, primary_term = current
+            owners = self._live_owners(state)
+            owners.pop(self.owner, None)
+            if not owners:
+                if self._restore(index, state, seq_no, primary_term):
+                    return
+                continue
+            state['owners'] = owners
+            try:
+                self.es.index(index=self.state_index, id=index, document=state, if_seq_no=seq_no,
+                              if_primary_term=primary_term, refresh=True)
+                logger.info(f"Otras {len(owners)} réplicas siguen cargando {index}, no se restaura")
+                return
+            except ConflictError:
+                continue
+
+    def exit(self):
+        for index in self.indices:
+            self._leave(index)
+        self.active = False
+
+    def restore_pending(self):
+        """Restaura configuraciones que quedaron registradas por workers que murieron"""
+        if self.forced:
+            return
+        for index in self.indices:
+            current = self._state(index)
+            if current is None:
+                continue
+            state, seq_no, primary_term = current
+            if self._live_owners(state):
+                # Otra réplica sigue en carga masiva: no se le restaura el índice
+                continue
+            logger.warning(f"Se encontró un modo de carga masiva pendiente en {index}, restaurando")
+            self._restore(index, state, seq_no, primary_term)
+
+    def check(self, queue_depth):
+        """Entra o sale del modo según la profundidad de la cola de entrada"""
+        try:
+            if not self.active and (self.forced or (self.threshold and queue_depth >= self.threshold)):
+                logger.info(f"Cola con {queue_depth} mensajes, entrando en modo de carga masiva")
+                self.enter()
+            elif self.active and queue_depth == 0:
+                logger.info("Cola vacía, saliendo del modo de carga masiva")
+                self.exit()
+                # El modo forzado aplica solo al backlog con el que se inició
+                self.forced = False
+            else:
+                self.heartbeat()
+        except Exception as e:
+            logger.error(f"Error al ajustar el modo de carga masiva: {e}")
+
+    def schedule(self, connection, channel, queue):
+        """Revisa la profundidad de la cola (o la suma de varias) periódicamente dentro del loop de pika"""
+        queues = [queue] if isinstance(queue, str) else list(queue)
+
+        def check_queue():
+            try:
+                depth = sum(channel.queue_declare(queue=name, durable=True, passive=True).method.message_count
+                            for name in queues)
+                self.check(depth)
+            except Exception as e:
+                logger.error(f"Error al consultar la profundidad de {queues}: {e}")
+            connection.call_later(BULK_INGEST_CHECK_INTERVAL, check_queue)
+
+        try:
+            self.restore_pending()
+        except Exception as e:
+            logger.error(f"Error al restaurar modo de carga masiva pendiente: {e}")
+        connection.call_later(0, check_queue)
@@ -0,0 +1,160 @@
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+import pika
+from pipeline.config import load_config
+
+logger = logging.getLogger('pipeline.clients')
+
+# Los clientes se crean la primera vez que se usan y se reutilizan en todo el
+# proceso; importar un servicio no abre ninguna conexión.
+
+
+@lru_cache(maxsize=1)
+def get_s3_client():
+    """Cliente de S3 compartido (boto3 es seguro entre hilos y mantiene su pool)"""
+    import boto3
+    from botocore.config import Config
+    config = load_config().s3
+    return boto3.client(
+        's3',
+        aws_access_key_id=config.access_key,
+        aws_secret_access_key=config.secret_key,
+        region_name=config.region,
+        config=Config(max_pool_connections=config.max_pool_connections)
+    )
+
+
+@lru_cache(maxsize=1)
+def get_elasticsearch():
+    """Cliente de Elasticsearch compartido, con su propio pool de conexiones por nodo"""
+    from elasticsearch import Elasticsearch
+    config = load_config().elasticsearch
+    return Elasticsearch(
+        config.url,
+        basic_auth=(config.user, config.password),
+        verify_certs=config.verify_certs,
+        connections_per_node=config.connections_per_node
+    )
+
+
+def create_db_connection():
+    import pymysql
+    config = load_config().mariadb
+    return pymysql.connect(
+        host=config.host, user=config.user, password=config.password, database=config.database
+    )
+
+
+class ConnectionPool:
+    """Pool de conexiones a MariaDB; conserva hasta `size` conexiones libres."""
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def _checkout(self):
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            return self.factory()
+        try:
+            # Reconecta si el servidor cerró la conexión por inactividad
+            connection.ping(reconnect=True)
+            return connection
+        except Exception:
+            self._close(connection)
+            return self.factory()
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """Uso: with pool.connection() as conn: ..."""
+        connection = self._checkout()
+        try:
+            yield connection
+        except Exception:
+            # No se devuelve al pool una conexión con una transacción a medias
+            self._close(connection)
+            raise
+        if self._idle.qsize() < self.size:
+            self._idle.put(connection)
+        else:
+            self._close(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(connection)
+
+
+@lru_cache(maxsize=1)
+def get_db_pool():
+    return ConnectionPool(create_db_connection, load_config().mariadb.pool_size)
+
+
+def db_connection():
+    """Conexión del pool compartido: with db_connection() as conn: ..."""
+    return get_db_pool().connection()
+
+
+def amqp_parameters():
+    config = load_config().rabbitmq
+    return pika.ConnectionParameters(
+        host=config.host,
+        credentials=pika.PlainCredentials(config.user, config.password),
+        connection_attempts=config.connection_attempts,
+        retry_delay=config.retry_delay
+    )
+
+
+_amqp = threading.local()
+
+
+def get_amqp_connection():
+    """Conexión a RabbitMQ del hilo actual (BlockingConnection no es segura entre hilos)"""
+    connection = getattr(_amqp, 'connection', None)
+    if connection is None or not connection.is_open:
+        connection = pika.BlockingConnection(amqp_parameters())
+        _amqp.connection = connection
+        _amqp.channel = None
+    return connection
+
+
+def get_amqp_channel():
+    """Canal reutilizado del hilo actual para publicar mensajes"""
+    connection = get_amqp_connection()
+    channel = getattr(_amqp, 'channel', None)
+    if channel is None or not channel.is_open:
+        channel = connection.channel()
+        _amqp.channel = channel
+    return channel
+
+
+def close_all():
+    """Cierra las conexiones abiertas por este módulo"""
+    connection = getattr(_amqp, 'connection', None)
+    if connection is not None and connection.is_open:
+        try:
+            connection.close()
+        except Exception as e:
+            logger.warning(f"Error al cerrar la conexión a RabbitMQ: {e}")
+    _amqp.connection = None
+    _amqp.channel = None
+    if get_db_pool.cache_info().currsize:
+        get_db_pool().close()
+    if get_elasticsearch.cache_info().currsize:
+        get_elasticsearch().close()
+        get_elasticsearch.cache_clear()
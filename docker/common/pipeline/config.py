@@ -0,0 +1,134 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+def env_str(name, default=None):
+    value = os.getenv(name)
+    return value if value not in (None, '') else default
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_bool(name, default=False):
+    value = os.getenv(name)
+    return value.lower() == 'true' if value not in (None, '') else default
+
+
+@dataclass(frozen=True)
+class S3Config:
+    bucket: str
+    key: str
+    access_key: str
+    secret_key: str
+    region: str
+    max_pool_connections: int
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            bucket=env_str('BUCKET'),
+            key=env_str('KEY', '2023395931'),  # Carpeta dentro del bucket
+            access_key=env_str('ACCESS_KEY'),
+            secret_key=env_str('SECRET_KEY'),
+            region=env_str('AWS_REGION', 'us-east-1'),
+            max_pool_connections=env_int('S3_MAX_POOL_CONNECTIONS', 10),
+        )
+
+
+@dataclass(frozen=True)
+class ElasticsearchConfig:
+    url: str
+    user: str
+    password: str
+    index: str
+    index_dst: str
+    verify_certs: bool
+    connections_per_node: int
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            url=env_str('ELASTICSEARCH', 'http://ic4302-es-http:9200'),
+            user=env_str('ELASTICSEARCH_USER'),
+            password=env_str('ELASTICSEARCH_PASS'),
+            index=env_str('ELASTICSEARCH_INDEX'),
+            index_dst=env_str('ELASTICSEARCH_INDEX_DST'),
+            verify_certs=env_bool('ELASTICSEARCH_VERIFY_CERTS', False),
+            connections_per_node=env_int('ELASTICSEARCH_CONNECTIONS', 10),
+        )
+
+
+@dataclass(frozen=True)
+class MariaDBConfig:
+    host: str
+    user: str
+    password: str
+    database: str
+    table: str
+    pool_size: int
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            host=env_str('MARIADB'),
+            user=env_str('MARIADB_USER'),
+            password=env_str('MARIADB_PASS'),
+            database=env_str('MARIADB_DB'),
+            table=env_str('MARIADB_TABLE'),
+            pool_size=env_int('MARIADB_POOL_SIZE', 4),
+        )
+
+
+@dataclass(frozen=True)
+class RabbitMQConfig:
+    host: str
+    user: str
+    password: str
+    queue: str
+    queue_dst: str
+    events_exchange: str
+    prefetch: int
+    connection_attempts: int
+    retry_delay: int
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            host=env_str('RABBITMQ'),
+            user=env_str('RABBITMQ_USER'),
+            password=env_str('RABBITMQ_PASS'),
+            queue=env_str('RABBITMQ_QUEUE'),
+            queue_dst=env_str('RABBITMQ_QUEUE_DST'),
+            # Exchange fanout con las escrituras del procesador (vacío = no se publican)
+            events_exchange=env_str('RABBITMQ_EVENTS_EXCHANGE', 'processed_documents.events'),
+            prefetch=env_int('RABBITMQ_PREFETCH', 1),
+            connection_attempts=env_int('RABBITMQ_CONNECTION_ATTEMPTS', 5),
+            retry_delay=env_int('RABBITMQ_RETRY_DELAY', 5),
+        )
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    s3: S3Config
+    elasticsearch: ElasticsearchConfig
+    mariadb: MariaDBConfig
+    rabbitmq: RabbitMQConfig
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            s3=S3Config.from_env(),
+            elasticsearch=ElasticsearchConfig.from_env(),
+            mariadb=MariaDBConfig.from_env(),
+            rabbitmq=RabbitMQConfig.from_env(),
+        )
+
+
+@lru_cache(maxsize=1)
+def load_config():
+    """Configuración del servicio leída una sola vez de las variables de entorno"""
+    return PipelineConfig.from_env()
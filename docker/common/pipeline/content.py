@@ -0,0 +1,53 @@
+import zlib
+import gzip
+import itertools
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional; sin la librería solo se soporta gzip
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def detect_encoding(data, content_encoding=None):
+    """Determina la compresión por el header Content-Encoding o por los bytes iniciales"""
+    if content_encoding:
+        return content_encoding.lower()
+    if data.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if data.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def decode_body(data, content_encoding=None):
+    """Descomprime (si aplica) y decodifica un documento HTML guardado en S3"""
+    encoding = detect_encoding(data, content_encoding)
+    if encoding == 'gzip':
+        data = gzip.decompress(data)
+    elif encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("El documento usa zstd pero la librería zstandard no está instalada")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data.decode('utf-8', errors='replace')
+
+
+def iter_decompressed(chunks, content_encoding=None):
+    """Descomprime un stream de fragmentos sin cargarlo completo en memoria"""
+    chunks = iter(chunks)
+    first = next(chunks, b'')
+    encoding = detect_encoding(first, content_encoding)
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(wbits=31)
+    elif encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("El documento usa zstd pero la librería zstandard no está instalada")
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        decompressor = None
+
+    for chunk in itertools.chain([first], chunks):
+        if chunk:
+            yield decompressor.decompress(chunk) if decompressor else chunk
@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+from collections import deque
+from functools import partial
+from prometheus_client import Counter, Gauge, Histogram
+from pipeline import metrics
+
+logger = logging.getLogger('pipeline.lanes')
+
+# Carriles de prioridad: los documentos nuevos no esperan detrás de una tormenta
+# de actualizaciones. Con PRIORITY_LANES=0 todo viaja por la cola base como antes.
+PRIORITY_LANES = os.getenv('PRIORITY_LANES', '1').lower() in ('1', 'true', 'yes')
+# Peso de cada carril en el consumo ponderado: con new=4,updated=1 se despachan
+# hasta cuatro nuevos por cada actualización mientras ambos tengan mensajes
+LANE_WEIGHTS = os.getenv('LANE_WEIGHTS', 'new=4,updated=1')
+
+NEW = 'new'
+UPDATED = 'updated'
+LANE_HEADER = 'lane'
+PUBLISHED_HEADER = 'published_ms'
+
+LANE_WAIT = Histogram(
+    'pipeline_lane_wait_seconds',
+    'Tiempo en cola de cada mensaje hasta que se despacha, por carril',
+    ['service', 'lane'],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600)
+)
+LANE_LAG = Gauge(
+    'pipeline_lane_lag_seconds', 'Tiempo en cola del último mensaje despachado por carril', ['service', 'lane']
+)
+LANE_MESSAGES = Counter('pipeline_lane_messages_total', 'Mensajes despachados por carril', ['service', 'lane'])
+
+
+def parse_weights(value=LANE_WEIGHTS):
+    """'new=4,updated=1' -> {'new': 4, 'updated': 1}"""
+    weights = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        name, weight = item.split('=', 1)
+        weights[name.strip()] = max(int(weight), 1)
+    return weights or {NEW: 1}
+
+
+def lane_for_status(status):
+    """Carril de un documento según el estado detectado por el spider"""
+    return UPDATED if status == UPDATED else NEW
+
+
+def queue_for(base_queue, lane, enabled=None):
+    """Cola de un carril; el carril de nuevos usa la cola base para no perder mensajes en vuelo"""
+    enabled = PRIORITY_LANES if enabled is None else enabled
+    if not enabled or lane == NEW:
+        return base_queue
+    return f"{base_queue}.{lane}"
+
+
+def lane_of(properties):
+    headers = getattr(properties, 'headers', None)
+    if isinstance(headers, dict) and headers.get(LANE_HEADER):
+        return headers[LANE_HEADER]
+    return NEW
+
+
+def lane_headers(lane):
+    return {LANE_HEADER: lane, PUBLISHED_HEADER: int(time.time() * 1000)}
+
+
+class Lane:
+    def __init__(self, name, queue, weight=1):
+        self.name = name
+        self.queue = queue
+        self.weight = weight
+        self.pending = deque()
+        self.current = 0
+
+
+def configured(base_queue, weights=None, enabled=None):
+    """Carriles a consumir para una cola base (uno solo si los carriles están deshabilitados)"""
+    enabled = PRIORITY_LANES if enabled is None else enabled
+    if not enabled:
+        return [Lane(NEW, base_queue, 1)]
+    weights = weights or parse_weights()
+    return [Lane(name, queue_for(base_queue, name, enabled), weight) for name, weight in weights.items()]
+
+
+class LaneConsumer:
+    """Consume varias colas con pesos sobre un mismo canal de pika.
+
+    Cada carril tiene su consumidor con prefetch = prefetch * peso, así RabbitMQ
+    nunca entrega más de esa cantidad sin confirmar y el resto espera en la cola.
+    Los mensajes recibidos quedan en un buffer por carril y se despachan con
+    round robin ponderado suave entre los carriles que tienen mensajes: si solo
+    uno tiene trabajo, lo recibe todo.
+
+    Siempre se consume con ack manual; con `auto_ack=True` el consumidor confirma
+    el mensaje cuando el callback termina sin error (el servicio no llama a
+    basic_ack). Si el callback falla, incluso al publicar el reintento, el mensaje
+    se devuelve a la cola con basic_nack; sin `auto_ack` la excepción se propaga
+    y el mensaje sin confirmar se vuelve a entregar al cerrarse el canal.
+    """
+
+    def __init__(self, connection, channel, callback, lanes, auto_ack=False, prefetch=1, poll_interval=1.0):
+        self.connection = connection
+        self.channel = channel
+        self.callback = callback
+        self.lanes = lanes
+        self.auto_ack = auto_ack
+        self.prefetch = prefetch
+        self.poll_interval = poll_interval
+        self._running = False
+
+    @property
+    def queues(self):
+        return [lane.queue for lane in self.lanes]
+
+    def start(self):
+        for lane in self.lanes:
+            self.channel.queue_declare(queue=lane.queue, durable=True)
+            # basic_qos sin global aplica a los consumidores creados después
+            self.channel.basic_qos(prefetch_count=self.prefetch * lane.weight)
+            self.channel.basic_consume(queue=lane.queue, on_message_callback=partial(self._receive, lane),
+                                       auto_ack=False)
+            logger.info(f"Consumiendo el carril {lane.name} de {lane.queue} con peso {lane.weight}")
+
+    def _receive(self, lane, channel, method, properties, body):
+        lane.pending.append((method, properties, body))
+
+    def next_lane(self):
+        """Round robin ponderado suave entre los carriles con mensajes pendientes"""
+        ready = [lane for lane in self.lanes if lane.pending]
+        if not ready:
+            return None
+        total = sum(lane.weight for lane in ready)
+        for lane in ready:
+            lane.current += lane.weight
+        chosen = max(ready, key=lambda lane: lane.current)
+        chosen.current -= total
+        return chosen
+
+    def dispatch(self, lane):
+        method, properties, body = lane.pending.popleft()
+        service = metrics.current_service()
+        headers = getattr(properties, 'headers', None)
+        published = headers.get(PUBLISHED_HEADER) if isinstance(headers, dict) else None
+        if published:
+            wait = max(time.time() * 1000 - published, 0) / 1000
+            LANE_WAIT.labels(service=service, lane=lane.name).observe(wait)
+            LANE_LAG.labels(service=service, lane=lane.name).set(wait)
+        LANE_MESSAGES.labels(service=service, lane=lane.name).inc()
+        try:
+            self.callback(self.channel, method, properties, body)
+        except Exception as e:
+            if not self.auto_ack:
+                raise
+            # Ni el trabajo ni el reintento quedaron hechos: confirmar perdería el mensaje
+            logger.error(f"Error en el callback del carril {lane.name}, el mensaje vuelve a la cola: {e}")
+            self.channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        if self.auto_ack:
+            self.channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def run(self):
+        """Loop de consumo hasta stop(); también atiende los call_later de la conexión"""
+        self._running = True
+        while self._running:
+            lane = self.next_lane()
+            if lane is None:
+                self.connection.process_data_events(time_limit=self.poll_interval)
+                continue
+            self.dispatch(lane)
+            self.connection.process_data_events(time_limit=0)
+
+    def stop(self):
+        self._running = False
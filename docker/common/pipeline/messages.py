@@ -0,0 +1,110 @@
+import os
+import json
+import pika
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional; sin la librería solo se usa JSON
+    msgpack = None
+
+# Formato con el que se publican los mensajes: json (compatible con consumidores
+# anteriores) o msgpack. Los consumidores aceptan ambos.
+MESSAGE_FORMAT = os.getenv('MESSAGE_FORMAT', 'json').lower()
+
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_MSGPACK = 'application/msgpack'
+VERSION_HEADER = 'schema_version'
+
+# Tipos de mensaje del pipeline
+DOCUMENT_DISCOVERED = 'document.discovered'  # spider -> downloader
+DOCUMENT_STORED = 'document.stored'          # downloader -> procesador
+DOCUMENT_PROCESSED = 'document.processed'    # procesador -> búsqueda (invalidación de caché)
+
+# Campos de cada versión del esquema, en el orden en que se codifican con msgpack.
+# Una versión nueva agrega una entrada; nunca se modifica una existente.
+SCHEMAS = {
+    DOCUMENT_DISCOVERED: {
+        1: ('file_name', 'status', 'path', 'document_id'),
+    },
+    DOCUMENT_STORED: {
+        1: ('document_id', 'elasticsearch_id'),
+    },
+    DOCUMENT_PROCESSED: {
+        1: ('document_id', 'fields'),
+    },
+}
+CURRENT_VERSIONS = {message_type: max(versions) for message_type, versions in SCHEMAS.items()}
+
+
+class MessageError(ValueError):
+    """El mensaje no se pudo decodificar o no cumple el esquema."""
+
+
+def encode_message(message_type, fields, message_format=None, headers=None):
+    """Codifica un mensaje del tipo indicado; retorna (body, pika.BasicProperties).
+
+    Con msgpack el cuerpo es una lista con los valores en el orden del esquema; el
+    tipo y la versión viajan en las propiedades del mensaje. Con JSON el cuerpo es
+    el diccionario de siempre más `schema_version`, así los consumidores viejos lo
+    siguen leyendo. `headers` agrega headers AMQP (por ejemplo el trace).
+    """
+    message_format = (message_format or MESSAGE_FORMAT).lower()
+    version = CURRENT_VERSIONS[message_type]
+    names = SCHEMAS[message_type][version]
+    missing = [name for name in names if name not in fields]
+    if missing:
+        raise MessageError(f"Faltan campos para {message_type}: {missing}")
+
+    if message_format == 'msgpack':
+        if msgpack is None:
+            raise RuntimeError("MESSAGE_FORMAT=msgpack requiere la librería msgpack")
+        body = msgpack.packb([fields[name] for name in names], use_bin_type=True)
+        content_type = CONTENT_TYPE_MSGPACK
+    else:
+        payload = {name: fields[name] for name in names}
+        payload[VERSION_HEADER] = version
+        body = json.dumps(payload, separators=(',', ':'))
+        content_type = CONTENT_TYPE_JSON
+
+    properties = pika.BasicProperties(
+        content_type=content_type,
+        type=message_type,
+        headers={**(headers or {}), VERSION_HEADER: version}
+    )
+    return body, properties
+
+
+def decode_message(body, properties=None, message_type=None):
+    """Decodifica un mensaje en JSON (con o sin versión) o msgpack; retorna un dict.
+
+    `message_type` es el tipo esperado cuando el mensaje no lo trae en sus
+    propiedades (mensajes publicados antes del esquema).
+    """
+    content_type = getattr(properties, 'content_type', None)
+    headers = getattr(properties, 'headers', None) or {}
+    message_type = getattr(properties, 'type', None) or message_type
+
+    if content_type == CONTENT_TYPE_MSGPACK:
+        if msgpack is None:
+            raise MessageError("Mensaje msgpack recibido pero la librería msgpack no está instalada")
+        version = headers.get(VERSION_HEADER)
+        names = SCHEMAS.get(message_type, {}).get(version)
+        if names is None:
+            raise MessageError(f"Esquema desconocido: {message_type} v{version}")
+        try:
+            values = msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise MessageError(f"Cuerpo msgpack inválido: {e}") from e
+        if not isinstance(values, (list, tuple)) or len(values) != len(names):
+            raise MessageError(f"El mensaje no coincide con {message_type} v{version}")
+        return dict(zip(names, values))
+
+    try:
+        message = json.loads(body)
+    except ValueError as e:
+        raise MessageError(f"Cuerpo JSON inválido: {e}") from e
+    if not isinstance(message, dict):
+        raise MessageError("El mensaje JSON debe ser un objeto")
+    # Los mensajes sin versión son los publicados antes del esquema (versión 0)
+    message.setdefault(VERSION_HEADER, headers.get(VERSION_HEADER, 0))
+    return message
@@ -0,0 +1,154 @@
+import os
+import random
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, make_wsgi_app, start_http_server
+from prometheus_client.exposition import ThreadingWSGIServer
+
+logger = logging.getLogger('pipeline.metrics')
+
+# Puerto del endpoint /metrics (0 = deshabilitado)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+# Archivo en formato de texto de Prometheus para procesos que terminan (por ejemplo el spider)
+METRICS_FILE = os.getenv('METRICS_FILE', '')
+# Fracción de los mensajes del camino crítico que se registran en modo debug
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Métricas comunes de los servicios del pipeline
+STAGE_SECONDS = Histogram('pipeline_stage_seconds', 'Duración de cada etapa', ['service', 'stage'],
+                          buckets=STAGE_BUCKETS)
+MESSAGES = Counter('pipeline_messages_total', 'Mensajes consumidos por resultado', ['service', 'result'])
+DOCUMENT_STATUS = Counter('pipeline_document_status_total', 'Documentos por estado final', ['service', 'status'])
+IN_FLIGHT = Gauge('pipeline_in_flight_messages', 'Mensajes en proceso', ['service'])
+
+_service = {'name': os.getenv('PIPELINE_SERVICE', 'pipeline')}
+_thread_service = threading.local()
+
+
+def configure(service):
+    """Nombre del servicio usado como label en todas las métricas comunes"""
+    _service['name'] = service
+
+
+def current_service():
+    return getattr(_thread_service, 'name', None) or _service['name']
+
+
+@contextmanager
+def service_context(service):
+    """Label de servicio solo para el hilo actual (varios servicios en un proceso, p. ej. benchmarks)"""
+    previous = getattr(_thread_service, 'name', None)
+    _thread_service.name = service
+    try:
+        yield
+    finally:
+        _thread_service.name = previous
+
+
+def stage(name):
+    """Uso: with metrics.stage('s3_get'): ..."""
+    return STAGE_SECONDS.labels(service=current_service(), stage=name).time()
+
+
+def timed(name):
+    """Decorador equivalente a `stage` para una función completa"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_status(status):
+    DOCUMENT_STATUS.labels(service=current_service(), status=status).inc()
+
+
+def track_message(function):
+    """Decorador para el callback de consumo: mensajes en proceso, duración y resultado"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        service = current_service()
+        with IN_FLIGHT.labels(service=service).track_inprogress(), stage('message'):
+            try:
+                result = function(*args, **kwargs)
+            except Exception:
+                MESSAGES.labels(service=service, result='error').inc()
+                raise
+        MESSAGES.labels(service=service, result='ok').inc()
+        return result
+    return wrapper
+
+
+def sampled(rate=None, logger=None):
+    """True para una fracción LOG_SAMPLE_RATE de las llamadas (logs del camino crítico).
+
+    Con `logger` también exige que el nivel DEBUG esté habilitado, así el mensaje
+    ni siquiera se formatea cuando no se va a registrar.
+    """
+    if logger is not None and not logger.isEnabledFor(logging.DEBUG):
+        return False
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def stage_totals():
+    """{(servicio, etapa): (cantidad, suma en segundos)} de las etapas, para reportes fuera de /metrics"""
+    totals = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            key = (sample.labels['service'], sample.labels['stage'])
+            count, total = totals.get(key, (0, 0.0))
+            if sample.name.endswith('_count'):
+                totals[key] = (int(sample.value), total)
+            elif sample.name.endswith('_sum'):
+                totals[key] = (count, sample.value)
+    return totals
+
+
+class _SilentHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _with_routes(routes, registry):
+    """App WSGI: las rutas propias del servicio y, en el resto, la exposición de prometheus_client"""
+    metrics_app = make_wsgi_app(registry)
+
+    def app(environ, start_response):
+        route = routes.get(environ.get('PATH_INFO'))
+        if route is None:
+            return metrics_app(environ, start_response)
+        content_type, body = route()
+        start_response('200 OK', [('Content-Type', content_type), ('Content-Length', str(len(body)))])
+        return [body]
+    return app
+
+
+def start_metrics_server(port=None, routes=None, addr='0.0.0.0', registry=REGISTRY):
+    """Expone /metrics en un hilo de fondo; retorna el servidor o None si está deshabilitado.
+
+    `routes` agrega rutas propias del servicio en el mismo puerto: {ruta: función
+    sin argumentos que retorna (content_type, cuerpo en bytes)}.
+    """
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    try:
+        if routes:
+            server = make_server(addr, port, _with_routes(dict(routes), registry), ThreadingWSGIServer,
+                                 handler_class=_SilentHandler)
+            threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        else:
+            server, _ = start_http_server(port, addr=addr, registry=registry)
+    except OSError as e:
+        logger.warning(f"No se pudo abrir el endpoint de métricas en el puerto {port}: {e}")
+        return None
+    logger.info(f"Métricas disponibles en :{port}/metrics")
+    return server
@@ -0,0 +1,168 @@
+import os
+import io
+import time
+import pstats
+import signal
+import cProfile
+import logging
+import threading
+import tracemalloc
+from functools import wraps
+from pipeline import metrics
+
+logger = logging.getLogger('pipeline.profiling')
+
+# Mensajes a perfilar apenas arranca el servicio (0 = solo con la señal)
+PROFILE_MESSAGES = int(os.getenv('PROFILE_MESSAGES', '0'))
+# Mensajes que se perfilan cada vez que llega la señal
+PROFILE_SIGNAL_MESSAGES = int(os.getenv('PROFILE_SIGNAL_MESSAGES', '100'))
+# Señal que activa una ventana de perfilado (vacío = sin señal)
+PROFILE_SIGNAL = os.getenv('PROFILE_SIGNAL', 'SIGUSR1')
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/profiles')
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', '25'))
+# Segundos entre snapshots de tracemalloc durante la ventana (0 = sin tracemalloc)
+TRACEMALLOC_INTERVAL = float(os.getenv('TRACEMALLOC_INTERVAL', '30'))
+TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', '5'))
+
+
+class Profiler:
+    """Perfila los próximos N mensajes con cProfile y tracemalloc.
+
+    Apagado, el costo por mensaje es una comparación de enteros: cProfile y
+    tracemalloc solo se activan mientras hay mensajes pendientes en la ventana.
+    Al cerrar la ventana deja en `output_dir` el .prof (para pstats o snakeviz)
+    y un resumen de texto con las funciones y sitios de asignación principales.
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR, top=PROFILE_TOP, tracemalloc_interval=TRACEMALLOC_INTERVAL,
+                 clock=time.monotonic):
+        self.output_dir = output_dir
+        self.top = top
+        self.tracemalloc_interval = tracemalloc_interval
+        self.clock = clock
+        self.remaining = 0
+        self._lock = threading.Lock()
+        self._profile = None
+        self._messages = 0
+        self._started_tracemalloc = False
+        self._snapshots = []
+        self._last_snapshot = 0
+        self.reports = []
+
+    def arm(self, messages):
+        """Abre una ventana de `messages` mensajes (también desde un manejador de señal)"""
+        if messages <= 0:
+            return
+        self.remaining = max(self.remaining, messages)
+        logger.info(f"Perfilado activado para los próximos {messages} mensajes")
+
+    def _start(self):
+        self._profile = cProfile.Profile()
+        self._messages = 0
+        self._snapshots = []
+        if self.tracemalloc_interval > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._last_snapshot = self.clock()
+        self._snapshot('inicio')
+
+    def _snapshot(self, label):
+        if tracemalloc.is_tracing():
+            self._snapshots.append((label, tracemalloc.take_snapshot()))
+            self._last_snapshot = self.clock()
+
+    def wrap(self, function):
+        """Decorador para el callback de cada mensaje"""
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not self.remaining:
+                return function(*args, **kwargs)
+            return self._run_profiled(function, args, kwargs)
+        return wrapper
+
+    def _run_profiled(self, function, args, kwargs):
+        with self._lock:
+            if self._profile is None:
+                self._start()
+            profile = self._profile
+        profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._messages += 1
+                self.remaining = max(self.remaining - 1, 0)
+                if self.tracemalloc_interval > 0 and self.clock() - self._last_snapshot >= self.tracemalloc_interval:
+                    self._snapshot(f"mensaje {self._messages}")
+                if not self.remaining and self._profile is profile:
+                    self._finish()
+
+    def _finish(self):
+        self._snapshot('final')
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        profile, self._profile = self._profile, None
+        try:
+            self.reports.append(self.dump(profile, self._messages, self._snapshots))
+        except Exception as e:
+            logger.error(f"No se pudo guardar el perfil: {e}")
+        self._snapshots = []
+
+    def dump(self, profile, messages, snapshots):
+        """Escribe el .prof y el resumen de texto; retorna la ruta base"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{metrics.current_service()}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}")
+        profile.dump_stats(f"{base}.prof")
+
+        text = io.StringIO()
+        text.write(f"Perfil de {messages} mensajes\n\n")
+        stats = pstats.Stats(profile, stream=text)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        stats.sort_stats('tottime').print_stats(self.top)
+        text.write(self.allocation_report(snapshots))
+        with open(f"{base}.txt", 'w', encoding='utf-8') as file:
+            file.write(text.getvalue())
+
+        top = [f"{pstats.func_std_string(func)} {cumulative:.3f}s"
+               for func, (_, _, _, cumulative, _) in
+               sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:5]]
+        logger.info(f"Perfil de {messages} mensajes guardado en {base}.prof; principales: {top}")
+        return base
+
+    def allocation_report(self, snapshots):
+        if not snapshots:
+            return ''
+        text = io.StringIO()
+        label, last = snapshots[-1]
+        text.write(f"\nAsignaciones vivas ({label}), top {self.top} por línea:\n")
+        for stat in last.statistics('lineno')[:self.top]:
+            text.write(f"  {stat}\n")
+        if len(snapshots) > 1:
+            first_label, first = snapshots[0]
+            text.write(f"\nCrecimiento entre {first_label} y {label}:\n")
+            for stat in last.compare_to(first, 'lineno')[:self.top]:
+                text.write(f"  {stat}\n")
+        return text.getvalue()
+
+
+PROFILER = Profiler()
+
+
+def profiled(function):
+    """Uso: @profiling.profiled sobre el callback de mensajes del servicio"""
+    return PROFILER.wrap(function)
+
+
+def install(profiler=PROFILER, messages=PROFILE_MESSAGES, signal_name=PROFILE_SIGNAL,
+            signal_messages=PROFILE_SIGNAL_MESSAGES):
+    """Activa el perfilado inicial y el manejador de la señal (llamar desde el hilo principal)"""
+    profiler.arm(messages)
+    if not signal_name:
+        return
+    signum = getattr(signal, signal_name, None)
+    if signum is None:
+        logger.warning(f"Señal desconocida para el perfilado: {signal_name}")
+        return
+    signal.signal(signum, lambda received, frame: profiler.arm(signal_messages))
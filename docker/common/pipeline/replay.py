@@ -0,0 +1,76 @@
+"""Reinyecta los mensajes de una cola de muertos en lotes espaciados.
+
+Uso: python -m pipeline.replay documents.dead [--batch 50] [--interval 10]
+                               [--limit 1000] [--reason texto] [--dry-run]
+
+Cada mensaje vuelve a su cola original (header original_queue) con el contador
+de intentos en cero. Los lotes espaciados evitan que una caída ya resuelta se
+convierta en un pico de carga sobre S3 y Elasticsearch.
+"""
+import sys
+import time
+import argparse
+from collections import Counter
+from pipeline.clients import get_amqp_connection, close_all
+from pipeline.retry import ORIGINAL_QUEUE_HEADER, FAILURE_REASON_HEADER, replay_properties
+
+
+def original_queue(dead_queue, headers):
+    if headers.get(ORIGINAL_QUEUE_HEADER):
+        return headers[ORIGINAL_QUEUE_HEADER]
+    return dead_queue[:-len('.dead')] if dead_queue.endswith('.dead') else dead_queue
+
+
+def replay(channel, dead_queue, batch=50, interval=10.0, limit=None, reason=None, dry_run=False, sleep=time.sleep):
+    """Retorna (reinyectados, omitidos, Counter de motivos de falla)"""
+    if not dry_run:
+        # Con confirmaciones, un publish rechazado lanza una excepción y el mensaje queda en la cola
+        channel.confirm_delivery()
+    replayed, held, reasons = 0, [], Counter()
+    while limit is None or replayed + len(held) < limit:
+        method, properties, body = channel.basic_get(queue=dead_queue, auto_ack=False)
+        if method is None:
+            break
+        headers = getattr(properties, 'headers', None) or {}
+        failure = str(headers.get(FAILURE_REASON_HEADER, 'desconocido'))
+        reasons[failure[:80]] += 1
+        if dry_run or (reason and reason not in failure):
+            # Queda sin confirmar hasta el final para no volver a leerlo
+            held.append(method.delivery_tag)
+            continue
+        channel.basic_publish(exchange='', routing_key=original_queue(dead_queue, headers), body=body,
+                              properties=replay_properties(properties))
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        replayed += 1
+        if replayed % batch == 0:
+            print(f"{replayed} mensajes reinyectados, esperando {interval}s")
+            sleep(interval)
+    for delivery_tag in held:
+        channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+    return replayed, len(held), reasons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('queue', help='cola de muertos, por ejemplo documents.dead')
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=10.0, help='segundos entre lotes')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--reason', help='solo los mensajes cuyo motivo de falla contiene este texto')
+    parser.add_argument('--dry-run', action='store_true', help='solo resume los motivos de falla')
+    args = parser.parse_args(argv)
+
+    channel = get_amqp_connection().channel()
+    try:
+        replayed, skipped, reasons = replay(channel, args.queue, args.batch, args.interval, args.limit,
+                                            args.reason, args.dry_run)
+    finally:
+        close_all()
+    print(f"Reinyectados: {replayed}, omitidos: {skipped}")
+    for failure, count in reasons.most_common(20):
+        print(f"{count:>8}  {failure}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
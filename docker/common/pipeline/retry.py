@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+import pika
+from prometheus_client import Counter
+from pipeline import metrics
+
+logger = logging.getLogger('pipeline.retry')
+
+# Espera en segundos antes de cada reintento; al agotarlos el mensaje va a la cola de muertos
+RETRY_DELAYS = [int(delay) for delay in os.getenv('RETRY_DELAYS', '5,30,120,600').split(',') if delay.strip()]
+
+RETRY_COUNT_HEADER = 'retry_count'
+ORIGINAL_QUEUE_HEADER = 'original_queue'
+FAILURE_REASON_HEADER = 'failure_reason'
+FAILED_SERVICE_HEADER = 'failed_service'
+FAILED_AT_HEADER = 'failed_at_ms'
+
+RETRY = 'retry'
+DEAD = 'dead'
+
+RETRIES = Counter(
+    'pipeline_retries_total', 'Mensajes fallidos reprogramados o enviados a la cola de muertos',
+    ['service', 'outcome', 'error']
+)
+
+
+def delay_queue(queue, delay):
+    return f"{queue}.retry.{delay}s"
+
+
+def dead_letter_queue(queue):
+    return f"{queue}.dead"
+
+
+def retry_count(properties):
+    headers = getattr(properties, 'headers', None)
+    if isinstance(headers, dict):
+        try:
+            return int(headers.get(RETRY_COUNT_HEADER) or 0)
+        except (TypeError, ValueError):
+            return 0
+    return 0
+
+
+def declare_delay_queue(channel, queue, delay):
+    """Cola sin consumidores: al vencer el TTL RabbitMQ devuelve el mensaje a `queue`.
+
+    Hay una cola por nivel de espera (y no un TTL por mensaje) para que un mensaje
+    con espera larga no bloquee a los que vencen antes.
+    """
+    name = delay_queue(queue, delay)
+    channel.queue_declare(queue=name, durable=True, arguments={
+        'x-message-ttl': delay * 1000,
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': queue,
+    })
+    return name
+
+
+def _properties(properties, headers):
+    return pika.BasicProperties(
+        content_type=getattr(properties, 'content_type', None),
+        type=getattr(properties, 'type', None),
+        headers=headers,
+        delivery_mode=2
+    )
+
+
+def schedule_retry(channel, queue, body, properties, reason, delays=None, permanent=False):
+    """Reprograma un mensaje fallido con espera exponencial o lo envía a la cola de muertos.
+
+    `queue` es la cola de la que se consumió el mensaje y a la que vuelve tras la
+    espera. Con `permanent=True` (por ejemplo un mensaje inválido) no se reintenta.
+    Retorna RETRY o DEAD; el llamador confirma el mensaje original después.
+    """
+    delays = RETRY_DELAYS if delays is None else delays
+    attempt = retry_count(properties) + 1
+    service = metrics.current_service()
+    headers = dict(getattr(properties, 'headers', None) or {})
+    headers.update({
+        RETRY_COUNT_HEADER: attempt,
+        ORIGINAL_QUEUE_HEADER: headers.get(ORIGINAL_QUEUE_HEADER) or queue,
+        FAILURE_REASON_HEADER: str(reason)[:500],
+        FAILED_SERVICE_HEADER: service,
+        FAILED_AT_HEADER: int(time.time() * 1000),
+    })
+    error = type(reason).__name__ if isinstance(reason, BaseException) else str(reason).split(':')[0][:40]
+
+    if not permanent and attempt <= len(delays):
+        target = declare_delay_queue(channel, queue, delays[attempt - 1])
+        outcome = RETRY
+    else:
+        target = dead_letter_queue(queue)
+        channel.queue_declare(queue=target, durable=True)
+        outcome = DEAD
+    channel.basic_publish(exchange='', routing_key=target, body=body, properties=_properties(properties, headers))
+    RETRIES.labels(service=service, outcome=outcome, error=error).inc()
+    if outcome == DEAD:
+        logger.warning(f"Mensaje enviado a {target} después de {attempt} intentos: {reason}")
+    elif metrics.sampled(logger=logger):
+        logger.debug(f"Reintento {attempt} en {delays[attempt - 1]}s vía {target}: {reason}")
+    return outcome
+
+
+def replay_properties(properties):
+    """Propiedades para reinyectar un mensaje muerto: reinicia el contador de intentos"""
+    headers = dict(getattr(properties, 'headers', None) or {})
+    headers['replayed'] = int(headers.get('replayed') or 0) + 1
+    headers[RETRY_COUNT_HEADER] = 0
+    return _properties(properties, headers)
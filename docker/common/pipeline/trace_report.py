@@ -0,0 +1,75 @@
+"""Resumen de los traces exportados en TRACE_FILE.
+
+Uso: python -m pipeline.trace_report traces.jsonl [otro.jsonl ...]
+"""
+import sys
+import json
+import math
+from collections import defaultdict
+
+
+def percentile(values, fraction):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not values:
+        return None
+    index = max(0, min(len(values), math.ceil(fraction * len(values))) - 1)
+    return values[index]
+
+
+def load_records(paths):
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(records):
+    """Retorna (etapas, lag): percentiles en ms por (servicio, etapa) y del lag de frescura"""
+    durations = defaultdict(list)
+    lags = []
+    for record in records:
+        if record.get('type') == 'span':
+            durations[(record['service'], record['stage'])].append(record['end_ms'] - record['start_ms'])
+        elif record.get('type') == 'trace' and record.get('status') == 'processed':
+            if record.get('freshness_lag_ms') is not None:
+                lags.append(record['freshness_lag_ms'])
+
+    def describe(values):
+        values = sorted(values)
+        return {
+            'count': len(values),
+            'p50': percentile(values, 0.50),
+            'p95': percentile(values, 0.95),
+            'p99': percentile(values, 0.99),
+            'max': values[-1] if values else None,
+        }
+
+    stages = {key: describe(values) for key, values in sorted(durations.items())}
+    return stages, describe(lags)
+
+
+def main(argv=None):
+    paths = (argv if argv is not None else sys.argv[1:])
+    if not paths:
+        print(__doc__.strip())
+        return 1
+    stages, lag = summarize(load_records(paths))
+    print(f"{'servicio':<12} {'etapa':<12} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for (service, stage), summary in stages.items():
+        print(f"{service:<12} {stage:<12} {summary['count']:>7} {summary['p50']:>9} {summary['p95']:>9} {summary['p99']:>9}")
+    if lag['count']:
+        print(f"\nLag de frescura (S3 -> processed_documents), {lag['count']} documentos: "
+              f"p50 {lag['p50'] / 1000:.1f}s, p95 {lag['p95'] / 1000:.1f}s, p99 {lag['p99'] / 1000:.1f}s")
+    else:
+        print("\nSin documentos procesados con lag de frescura")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from prometheus_client import Histogram
+
+# Archivo JSONL donde cada servicio exporta sus tramos (vacío = no se exporta)
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+
+# Headers de RabbitMQ; AMQP no admite floats, los tiempos van en milisegundos
+TRACE_ID_HEADER = 'trace_id'
+SOURCE_MODIFIED_HEADER = 'source_modified_ms'
+STAGES_HEADER = 'trace_stages'
+
+FRESHNESS_LAG = Histogram(
+    'pipeline_freshness_lag_seconds',
+    'Tiempo desde que el HTML se subió a S3 hasta que se escribió en processed_documents',
+    ['service'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+)
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def to_ms(value):
+    """Convierte un datetime (por ejemplo LastModified de S3) o epoch en segundos a milisegundos"""
+    if value is None:
+        return None
+    if hasattr(value, 'timestamp'):
+        return int(value.timestamp() * 1000)
+    return int(float(value) * 1000)
+
+
+class TraceContext:
+    """Identificador de correlación y tramos de un documento a lo largo del pipeline"""
+
+    def __init__(self, trace_id=None, source_modified_ms=None, stages=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.source_modified_ms = source_modified_ms
+        # Cada tramo: [servicio, etapa, inicio_ms, fin_ms]
+        self.stages = stages or []
+
+    @classmethod
+    def from_properties(cls, properties):
+        """Contexto recibido en un mensaje; uno nuevo si el mensaje no trae trace"""
+        headers = getattr(properties, 'headers', None)
+        if not isinstance(headers, dict) or not headers.get(TRACE_ID_HEADER):
+            return cls()
+        try:
+            stages = json.loads(headers.get(STAGES_HEADER) or '[]')
+        except ValueError:
+            stages = []
+        return cls(headers[TRACE_ID_HEADER], headers.get(SOURCE_MODIFIED_HEADER), stages)
+
+    def headers(self):
+        headers = {
+            TRACE_ID_HEADER: self.trace_id,
+            STAGES_HEADER: json.dumps(self.stages, separators=(',', ':'))
+        }
+        if self.source_modified_ms is not None:
+            headers[SOURCE_MODIFIED_HEADER] = int(self.source_modified_ms)
+        return headers
+
+    def add_stage(self, service, stage, started_ms, ended_ms):
+        self.stages.append([service, stage, started_ms, ended_ms])
+        _exporter.write({
+            'type': 'span', 'trace_id': self.trace_id, 'service': service, 'stage': stage,
+            'start_ms': started_ms, 'end_ms': ended_ms
+        })
+
+    @contextmanager
+    def span(self, service, stage):
+        """Registra el inicio y fin de una etapa (también si termina con error)"""
+        started = now_ms()
+        try:
+            yield self
+        finally:
+            self.add_stage(service, stage, started, now_ms())
+
+    def finish(self, service, status, finished_ms=None, observe_lag=True):
+        """Cierra el trace: registra el lag de frescura y exporta el recorrido completo"""
+        finished_ms = finished_ms or now_ms()
+        lag_ms = None
+        if self.source_modified_ms is not None:
+            lag_ms = finished_ms - int(self.source_modified_ms)
+            if observe_lag:
+                FRESHNESS_LAG.labels(service=service).observe(max(lag_ms, 0) / 1000)
+        _exporter.write({
+            'type': 'trace', 'trace_id': self.trace_id, 'status': status,
+            'source_modified_ms': self.source_modified_ms, 'finished_ms': finished_ms,
+            'freshness_lag_ms': lag_ms, 'stages': self.stages
+        })
+        return lag_ms
+
+
+class TraceExporter:
+    """Agrega registros JSON por línea a un archivo local para análisis offline"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        if not self.path:
+            return
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock, open(self.path, 'a', encoding='utf-8') as file:
+            file.write(line)
+
+
+_exporter = TraceExporter(TRACE_FILE)
+
+
+def configure_export(path):
+    """Cambia el archivo de exportación (por ejemplo en pruebas o herramientas)"""
+    _exporter.path = path
@@ -0,0 +1,61 @@
+import signal
+import logging
+from pipeline.config import load_config
+from pipeline.clients import get_amqp_connection, close_all
+from pipeline.lanes import LaneConsumer
+
+logger = logging.getLogger('pipeline.worker')
+
+
+def run_worker(callback, queue=None, prefetch=None, auto_ack=False, setup=None, lanes=None):
+    """Punto de entrada común de los consumidores de RabbitMQ.
+
+    Declara la cola, aplica el prefetch, llama a `setup(connection, channel)` antes
+    de consumir (por ejemplo para programar tareas periódicas) y cierra todas las
+    conexiones al terminar por CTRL+C o SIGTERM. Con `lanes` (pipeline.lanes.configured)
+    consume los carriles de prioridad con pesos en lugar de una sola cola.
+    """
+    config = load_config().rabbitmq
+    queue = queue or config.queue
+    connection = get_amqp_connection()
+    channel = connection.channel()
+    if lanes:
+        return _run_lanes(connection, channel, callback, lanes, prefetch or config.prefetch, auto_ack, setup)
+    channel.queue_declare(queue=queue, durable=True)
+    channel.basic_qos(prefetch_count=prefetch or config.prefetch)
+    channel.basic_consume(queue=queue, on_message_callback=callback, auto_ack=auto_ack)
+    if setup is not None:
+        setup(connection, channel)
+
+    def stop(signum, frame):
+        logger.info("Señal de terminación recibida, deteniendo el consumo")
+        channel.stop_consuming()
+
+    signal.signal(signal.SIGTERM, stop)
+    logger.info(f"Esperando mensajes en la cola {queue}")
+    try:
+        channel.start_consuming()
+    except KeyboardInterrupt:
+        channel.stop_consuming()
+    finally:
+        close_all()
+
+
+def _run_lanes(connection, channel, callback, lanes, prefetch, auto_ack, setup):
+    consumer = LaneConsumer(connection, channel, callback, lanes, auto_ack=auto_ack, prefetch=prefetch)
+    consumer.start()
+    if setup is not None:
+        setup(connection, channel)
+
+    def stop(signum, frame):
+        logger.info("Señal de terminación recibida, deteniendo el consumo")
+        consumer.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    logger.info(f"Esperando mensajes en las colas {consumer.queues}")
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        consumer.stop()
+    finally:
+        close_all()
@@ -1,115 +1,115 @@
-import os
-import json
-import hashlib
-import boto3
-import pika
-import pymysql
-from elasticsearch import Elasticsearch
-
-# Variables de entorno
-RABBITMQ_USER = os.getenv('RABBITMQ_USER')
-RABBITMQ_PASS = os.getenv('RABBITMQ_PASS')
-RABBITMQ_QUEUE = os.getenv('RABBITMQ_QUEUE')
-RABBITMQ_QUEUE_DST = os.getenv('RABBITMQ_QUEUE_DST')
-RABBITMQ = os.getenv('RABBITMQ')
-
-MARIADB_USER = os.getenv('MARIADB_USER')
-MARIADB_PASS = os.getenv('MARIADB_PASS')
-MARIADB = os.getenv('MARIADB')
-MARIADB_DB = os.getenv('MARIADB_DB')
-MARIADB_TABLE = os.getenv('MARIADB_TABLE')
-
-ELASTICSEARCH_INDEX = os.getenv('ELASTICSEARCH_INDEX')
-ELASTICSEARCH_USER = os.getenv('ELASTICSEARCH_USER')
-ELASTICSEARCH_PASS = os.getenv('ELASTICSEARCH_PASS')
-ELASTICSEARCH = os.getenv('ELASTICSEARCH')
-
-BUCKET = os.getenv('BUCKET')
-KEY = os.getenv('KEY')
-ACCESS_KEY = os.getenv('ACCESS_KEY')
-SECRET_KEY = os.getenv('SECRET_KEY')
-
-# Configurar cliente de S3
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=ACCESS_KEY,
-    aws_secret_access_key=SECRET_KEY
-)
-
-# Configurar cliente de Elasticsearch
-es = Elasticsearch(
-    "http://ic4302-es-http:9200",
-    basic_auth=(ELASTICSEARCH_USER, ELASTICSEARCH_PASS)
-)
-
-# Configurar conexión a MariaDB
+from pipeline.config import load_config
+from pipeline.clients import get_s3_client, get_elasticsearch, db_connection
+from pipeline.worker import run_worker
+from pipeline import metrics, profiling, lanes, retry
+from pipeline.tracing import TraceContext
+from pipeline.bulk_ingest import BulkIngestMode
+from pipeline.content import decode_body
+from pipeline.messages import encode_message, decode_message, MessageError, DOCUMENT_DISCOVERED, DOCUMENT_STORED
+
+# Configuración leída de las variables de entorno; los clientes se crean al primer uso
+config = load_config()
+metrics.configure('downloader')
+
 def get_db_connection():
-    return pymysql.connect(
-        host=MARIADB, user=MARIADB_USER, password=MARIADB_PASS, database=MARIADB_DB
-    )
+    """Conexión a MariaDB tomada del pool compartido (with get_db_connection() as conn)."""
+    return db_connection()
 
 def download_file_from_s3(file_name):
-    s3_key = f"{KEY}/{file_name}"
+    s3_key = f"{config.s3.key}/{file_name}"
     local_file_path = f"/tmp/{file_name}"
-    s3_client.download_file(BUCKET, s3_key, local_file_path)
-    print(f"Archivo descargado de S3: {local_file_path}")
+    with metrics.stage('s3_get'):
+        get_s3_client().download_file(config.s3.bucket, s3_key, local_file_path)
+    if metrics.sampled():
+        print(f"Archivo descargado de S3: {local_file_path}")
     return local_file_path
 
 def read_file_content(local_file_path):
-    with open(local_file_path, 'r', encoding='utf-8') as file:
-        return file.read()
+    # El scraper puede subir el HTML comprimido con gzip/zstd
+    with metrics.stage('decode'), open(local_file_path, 'rb') as file:
+        return decode_body(file.read())
 
 def store_document_in_elasticsearch(file_content):
-    es_response = es.index(index=ELASTICSEARCH_INDEX, document={'content': file_content})
+    with metrics.stage('es_index'):
+        es_response = get_elasticsearch().index(index=config.elasticsearch.index, document={'content': file_content})
     es_id = es_response['_id']
-    print(f"Documento almacenado en Elasticsearch con ID: {es_id}")
+    if metrics.sampled():
+        print(f"Documento almacenado en Elasticsearch con ID: {es_id}")
     return es_id
 
 def update_mariadb_status(file_name):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"UPDATE {MARIADB_TABLE} SET estado = 'downloaded' WHERE path_documento = %s", (file_name,))
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print(f"Estado actualizado en MariaDB para el archivo: {file_name}")
-
-def publish_message_to_rabbitmq(document_id, es_id):
-    message = json.dumps({
+    with metrics.stage('db_update'), get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"UPDATE {config.mariadb.table} SET estado = 'downloaded' WHERE path_documento = %s", (file_name,))
+        conn.commit()
+        cursor.close()
+    metrics.record_status('downloaded')
+    if metrics.sampled():
+        print(f"Estado actualizado en MariaDB para el archivo: {file_name}")
+
+def publish_message_to_rabbitmq(channel, document_id, es_id, trace=None, lane=lanes.NEW):
+    # El documento sigue en el mismo carril de prioridad hacia el procesador
+    body, properties = encode_message(DOCUMENT_STORED, {
         'document_id': document_id,
         'elasticsearch_id': es_id
-    })
-    channel.basic_publish(exchange='', routing_key=RABBITMQ_QUEUE_DST, body=message)
-    print(f"Mensaje publicado en RabbitMQ: {message}")
+    }, headers={**(trace.headers() if trace else {}), **lanes.lane_headers(lane)})
+    queue = lanes.queue_for(config.rabbitmq.queue_dst, lane)
+    with metrics.stage('publish'):
+        channel.basic_publish(exchange='', routing_key=queue, body=body, properties=properties)
+    if metrics.sampled():
+        print(f"Mensaje publicado en RabbitMQ: {document_id} - {es_id}")
 
 # Función para procesar mensajes de RabbitMQ
+@metrics.track_message
+@profiling.profiled
 def callback(ch, method, properties, body):
-    json_object = json.loads(body)
-    file_name = json_object['file_name']
-    document_id = json_object['document_id']
-
-    # Descargar el archivo de S3
-    local_file_path = download_file_from_s3(file_name)
-    
-    # Leer el contenido del archivo
-    file_content = read_file_content(local_file_path)
-    
-    # Almacenar el documento en Elasticsearch
-    es_id = store_document_in_elasticsearch(file_content)
-    
-    # Actualizar el estado en MariaDB
-    update_mariadb_status(file_name)
-    
-    # Publicar un mensaje en RabbitMQ
-    publish_message_to_rabbitmq(document_id, es_id)
-
-# Configurar conexión a RabbitMQ
-credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-parameters = pika.ConnectionParameters(host=RABBITMQ, credentials=credentials)
-connection = pika.BlockingConnection(parameters)
-channel = connection.channel()
-channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-channel.basic_consume(queue=RABBITMQ_QUEUE, on_message_callback=callback, auto_ack=True)
-
-print(' [*] Waiting for messages. To exit press CTRL+C')
-channel.start_consuming()
\ No newline at end of file
+    # Acepta JSON (también sin versión) y msgpack durante la migración
+    try:
+        message = decode_message(body, properties, DOCUMENT_DISCOVERED)
+        file_name = message['file_name']
+        document_id = message['document_id']
+    except (MessageError, KeyError) as e:
+        # Un mensaje inválido no mejora con reintentos: va directo a la cola de muertos
+        print(f"Mensaje inválido enviado a la cola de muertos: {e!r}")
+        metrics.record_status('error_invalid_message')
+        retry.schedule_retry(ch, method.routing_key or config.rabbitmq.queue, body, properties, e, permanent=True)
+        return
+    # El trace creado por el spider continúa en el mensaje hacia el procesador
+    trace = TraceContext.from_properties(properties)
+
+    try:
+        with trace.span('downloader', 'download'):
+            # Descargar el archivo de S3
+            local_file_path = download_file_from_s3(file_name)
+
+            # Leer el contenido del archivo
+            file_content = read_file_content(local_file_path)
+
+            # Almacenar el documento en Elasticsearch
+            es_id = store_document_in_elasticsearch(file_content)
+
+            # Actualizar el estado en MariaDB
+            update_mariadb_status(file_name)
+
+        # Publicar un mensaje en RabbitMQ por el mismo canal del consumo
+        publish_message_to_rabbitmq(ch, document_id, es_id, trace, lanes.lane_of(properties))
+    except Exception as e:
+        # Error transitorio de S3/ES/MariaDB: se reintenta con espera en lugar de perder el documento
+        outcome = retry.schedule_retry(ch, method.routing_key or config.rabbitmq.queue, body, properties, e)
+        print(f"Error al procesar {file_name} ({outcome}): {e}")
+        metrics.record_status(f'error_{outcome}')
+
+def schedule_bulk_ingest(connection, channel):
+    # Modo de carga masiva del índice de documentos según el backlog de la cola
+    bulk_ingest = BulkIngestMode(get_elasticsearch(), [config.elasticsearch.index])
+    bulk_ingest.schedule(connection, channel, [lane.queue for lane in lanes.configured(config.rabbitmq.queue)])
+
+def main():
+    metrics.start_metrics_server()
+    profiling.install()
+    print(' [*] Waiting for messages. To exit press CTRL+C')
+    # Consumo ponderado de los carriles de nuevos y actualizados (LANE_WEIGHTS)
+    run_worker(callback, auto_ack=True, setup=schedule_bulk_ingest, lanes=lanes.configured(config.rabbitmq.queue))
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,61 @@
 import os
-import json
 import time
 import logging
-import boto3
 from bs4 import BeautifulSoup
-import pika
-import pymysql
-from elasticsearch import Elasticsearch
+from elasticsearch import NotFoundError
 import requests
 from requests.auth import HTTPBasicAuth
-import tempfile
+from pipeline.config import load_config
+from pipeline.clients import get_s3_client, get_elasticsearch, create_db_connection, get_amqp_connection, close_all
+from pipeline.bulk_ingest import BulkIngestMode
+from pipeline import metrics, profiling, lanes, retry
+from pipeline.tracing import TraceContext, now_ms
+from pipeline.content import iter_decompressed
+from pipeline.messages import encode_message, decode_message, MessageError, DOCUMENT_STORED, DOCUMENT_PROCESSED
+from site_profiles import load_profiles
+from structured_data import extract_structured_data, extract_title, extract_source_url
+from streaming import STREAM_CHUNK_SIZE, read_until_complete
+from product_mapping import (
+    TEMPLATE_VERSION, normalize_price, processed_documents_template, field_hashes, changed_fields
+)
 
 # Configuración de logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger('document_processor')
+SERVICE = 'procesor'
+metrics.configure(SERVICE)
+
+# Configuración leída de las variables de entorno; los clientes se crean al conectar
+config = load_config()
+RABBITMQ_QUEUE = config.rabbitmq.queue
+RABBITMQ = config.rabbitmq.host
+EVENTS_EXCHANGE = config.rabbitmq.events_exchange
 
-# Obtener variables de entorno
-RABBITMQ_USER = os.getenv('RABBITMQ_USER')
-RABBITMQ_PASS = os.getenv('RABBITMQ_PASS')
-RABBITMQ_QUEUE = os.getenv('RABBITMQ_QUEUE')
-RABBITMQ = os.getenv('RABBITMQ')
+MARIADB = config.mariadb.host
+MARIADB_TABLE = config.mariadb.table
 
-MARIADB_USER = os.getenv('MARIADB_USER')
-MARIADB_PASS = os.getenv('MARIADB_PASS')
-MARIADB = os.getenv('MARIADB')
-MARIADB_DB = os.getenv('MARIADB_DB')
-MARIADB_TABLE = os.getenv('MARIADB_TABLE')
+ELASTICSEARCH_INDEX = config.elasticsearch.index
+ELASTICSEARCH_INDEX_DST = config.elasticsearch.index_dst
+ELASTICSEARCH = config.elasticsearch.url
 
-ELASTICSEARCH_INDEX = os.getenv('ELASTICSEARCH_INDEX')
-ELASTICSEARCH_INDEX_DST = os.getenv('ELASTICSEARCH_INDEX_DST')
-ELASTICSEARCH_USER = os.getenv('ELASTICSEARCH_USER')
-ELASTICSEARCH_PASS = os.getenv('ELASTICSEARCH_PASS')
-ELASTICSEARCH = os.getenv('ELASTICSEARCH')
+BUCKET = config.s3.bucket
+KEY = config.s3.key
 
-BUCKET = os.getenv('BUCKET')
-KEY = os.getenv('KEY')
-ACCESS_KEY = os.getenv('ACCESS_KEY')
-SECRET_KEY = os.getenv('SECRET_KEY')
+# Campos del producto que pueden venir de los datos estructurados
+STRUCTURED_FIELDS = ["product_name", "price", "description", "categories", "images"]
 
 
 
 class DocumentProcessor:
+    # Canal donde se avisan las escrituras al servicio de búsqueda (None = no se avisan)
+    events_channel = None
+
     def __init__(self):
+        # Los perfiles de extracción se compilan una sola vez al iniciar
+        self.profiles = load_profiles()
         self.connect_rabbitmq()
         self.connect_mariadb()
         self.connect_elasticsearch()
@@ -52,27 +63,18 @@ class DocumentProcessor:
 
     def connect_rabbitmq(self):
         logger.info(f"Conectando a RabbitMQ en {RABBITMQ}")
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        parameters = pika.ConnectionParameters(
-            host=RABBITMQ,
-            credentials=credentials,
-            connection_attempts=5,
-            retry_delay=5
-        )
-        self.rabbitmq_connection = pika.BlockingConnection(parameters)
+        self.rabbitmq_connection = get_amqp_connection()
         self.rabbitmq_channel = self.rabbitmq_connection.channel()
         self.rabbitmq_channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
+        if EVENTS_EXCHANGE:
+            self.rabbitmq_channel.exchange_declare(exchange=EVENTS_EXCHANGE, exchange_type='fanout', durable=True)
+            self.events_channel = self.rabbitmq_channel
         logger.info("Conexión a RabbitMQ establecida")
 
     def connect_mariadb(self):
         logger.info(f"Conectando a MariaDB en {MARIADB}")
-        self.mariadb_connection = pymysql.connect(
-            host=MARIADB,
-            user=MARIADB_USER,
-            password=MARIADB_PASS,
-            database=MARIADB_DB,
-            # No necesitas especificar collation con pymysql
-        )
+        # El procesador mantiene una conexión propia durante toda su vida
+        self.mariadb_connection = create_db_connection()
         self.mariadb_cursor = self.mariadb_connection.cursor()
         
         # El resto del código puede permanecer igual
@@ -88,20 +90,44 @@ class DocumentProcessor:
 
     def connect_elasticsearch(self):
         logger.info(f"Conectando a Elasticsearch en {ELASTICSEARCH}")
-        self.es = Elasticsearch(
-            [ELASTICSEARCH],
-            http_auth=(ELASTICSEARCH_USER, ELASTICSEARCH_PASS),
-            verify_certs=False
-        )
+        self.es = get_elasticsearch()
         logger.info("Conexión a Elasticsearch establecida")
+        self.ensure_index_template()
+
+    def ensure_index_template(self):
+        """Crea o actualiza el template con el mapping explícito del índice destino"""
+        template_name = f"{ELASTICSEARCH_INDEX_DST}-template"
+        try:
+            installed_version = None
+            if self.es.indices.exists_index_template(name=template_name):
+                current = self.es.indices.get_index_template(name=template_name)
+                meta = current["index_templates"][0]["index_template"].get("_meta", {})
+                installed_version = meta.get("version")
+            
+            if installed_version != TEMPLATE_VERSION:
+                self.es.indices.put_index_template(
+                    name=template_name,
+                    **processed_documents_template(ELASTICSEARCH_INDEX_DST)
+                )
+                logger.info(f"Template {template_name} instalado (versión {TEMPLATE_VERSION})")
+            
+            # Un índice creado antes del template conserva el mapping dinámico
+            if self.es.indices.exists(index=ELASTICSEARCH_INDEX_DST):
+                mapping = self.es.indices.get_mapping(index=ELASTICSEARCH_INDEX_DST)
+                properties = mapping[ELASTICSEARCH_INDEX_DST]["mappings"].get("properties", {})
+                if properties.get("price_value", {}).get("type") != "scaled_float":
+                    logger.warning(f"El índice {ELASTICSEARCH_INDEX_DST} no usa el mapping del template; "
+                                   f"es necesario reindexarlo para filtrar por price_value")
+                # Agregar un campo no requiere reindexar; los documentos viejos lo reciben al reprocesarse
+                if "document_id" not in properties:
+                    self.es.indices.put_mapping(index=ELASTICSEARCH_INDEX_DST,
+                                                properties={"document_id": {"type": "keyword"}})
+        except Exception as e:
+            logger.error(f"Error al validar el template de {ELASTICSEARCH_INDEX_DST}: {e}")
 
     def connect_s3(self):
         logger.info("Configurando cliente S3")
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=ACCESS_KEY,
-            aws_secret_access_key=SECRET_KEY
-        )
+        self.s3_client = get_s3_client()
         logger.info("Cliente S3 configurado")
 
     def get_document_status(self, doc_id):
@@ -113,6 +139,7 @@ class DocumentProcessor:
             return result[0]
         return None
 
+    @metrics.timed('db_update')
     def update_document_status(self, doc_id, status):
         """Actualiza el estado de un documento en MariaDB"""
         # Siempre usar "processed" como estado
@@ -124,12 +151,14 @@ class DocumentProcessor:
             self.mariadb_cursor.execute(f"UPDATE {MARIADB_TABLE} SET estado = %s WHERE id = %s", (status, int(doc_id)))
             
             self.mariadb_connection.commit()
-            logger.info(f"Estado del documento {doc_id} actualizado a: {status}")
+            if metrics.sampled(logger=logger):
+                logger.debug(f"Estado del documento {doc_id} actualizado a: {status}")
         except Exception as e:
             logger.error(f"Error al actualizar estado del documento {doc_id}: {e}")
             # Intenta reconectar si la conexión se perdió
             self.connect_mariadb()
 
+    @metrics.timed('es_get')
     def get_document_from_elasticsearch(self, doc_elasticsearch_id):
         """Obtiene el documento desde Elasticsearch"""
         try:
@@ -140,204 +169,207 @@ class DocumentProcessor:
             logger.error(f"Error al obtener documento de Elasticsearch: {e}")
             return None
 
+    @metrics.timed('es_get_hashes')
+    def get_stored_field_hashes(self, doc_id):
+        """Obtiene los hashes por campo del documento ya procesado, o None si no existe"""
+        try:
+            result = self.es.get(index=ELASTICSEARCH_INDEX_DST, id=doc_id, _source_includes=["field_hashes"])
+            return result["_source"].get("field_hashes", {})
+        except NotFoundError:
+            return None
+
+    @metrics.timed('es_index')
     def save_document_to_elasticsearch(self, doc_id, document_data):
-        """Guarda el documento procesado en Elasticsearch"""
+        """Guarda el documento procesado en Elasticsearch enviando solo los campos que cambiaron"""
         try:
-            self.es.index(
+            hashes = field_hashes(document_data)
+            stored_hashes = self.get_stored_field_hashes(doc_id)
+            
+            if stored_hashes is None:
+                self.es.index(
+                    index=ELASTICSEARCH_INDEX_DST,
+                    id=doc_id,
+                    body={**document_data, "document_id": doc_id, "field_hashes": hashes}
+                )
+                if metrics.sampled(logger=logger):
+                    logger.debug(f"Documento {doc_id} guardado en {ELASTICSEARCH_INDEX_DST}")
+                self.publish_write_event(doc_id, document_data)
+                return True
+            
+            changes = changed_fields(document_data, hashes, stored_hashes)
+            if not changes:
+                if metrics.sampled(logger=logger):
+                    logger.debug(f"Documento {doc_id} sin cambios, se omite la escritura")
+                return True
+            
+            self.es.update(
                 index=ELASTICSEARCH_INDEX_DST,
                 id=doc_id,
-                body=document_data
+                doc={**changes, "document_id": doc_id, "field_hashes": hashes}
             )
-            logger.info(f"Documento {doc_id} guardado en {ELASTICSEARCH_INDEX_DST}")
+            if metrics.sampled(logger=logger):
+                logger.debug(f"Documento {doc_id} actualizado en {ELASTICSEARCH_INDEX_DST}: {sorted(changes)}")
+            self.publish_write_event(doc_id, changes)
             return True
         except Exception as e:
             logger.error(f"Error al guardar documento en Elasticsearch: {e}")
             return False
 
-    def parse_html_with_beautifulsoup(self, html_content):
-        """Parsea el contenido HTML con BeautifulSoup para extraer información básica del producto de eBay"""
-        soup = BeautifulSoup(html_content, 'html.parser')
+    def publish_write_event(self, doc_id, fields):
+        """Avisa la escritura a las réplicas del servicio de búsqueda para que invaliden su caché"""
+        if self.events_channel is None:
+            return
+        try:
+            body, properties = encode_message(DOCUMENT_PROCESSED, {'document_id': doc_id, 'fields': sorted(fields)})
+            self.events_channel.basic_publish(exchange=EVENTS_EXCHANGE, routing_key='', body=body,
+                                              properties=properties)
+        except Exception as e:
+            # La caché de búsqueda igual expira por TTL; no se reintenta el documento por esto
+            logger.error(f"No se pudo publicar el evento de escritura de {doc_id}: {e}")
+
+    @metrics.timed('parse')
+    def parse_html_with_beautifulsoup(self, html_content, url=None):
+        """Parsea el contenido HTML usando primero los datos estructurados (JSON-LD)
+        y BeautifulSoup con el perfil de la tienda solo para los campos faltantes"""
+        profile = self.profiles.route(html_content, url)
         
         # Inicializar el diccionario de información del producto 
         product_info = {
-            "title": soup.title.string if soup.title else "Sin título",
+            "title": extract_title(html_content),
             "product_name": "",
             "price": "",
             "description": "",
             "categories": [],
-            "images": []
+            "images": [],
+            "site_profile": profile.label
         }
         
         try:
-            # 1. NOMBRE DEL PRODUCTO 
-            product_name_candidates = [
-                soup.find('h1', {'class': 'x-item-title__mainTitle'}),
-                soup.find('h1', {'id': 'itemTitle'}),
-                soup.find('h1', {'class': 'product-title'})
-            ]
-            
-            for candidate in product_name_candidates:
-                if candidate:
-                    name_text = candidate.get_text(strip=True)
-                    # Limpiar prefijos comunes de eBay como "Details about"
-                    if name_text.startswith("Details about"):
-                        name_text = name_text.replace("Details about", "").strip()
-                    product_info["product_name"] = name_text
-                    break
-                    
-            # Si no se encontró el nombre, usar el título
-            if not product_info["product_name"] and product_info["title"]:
-                clean_title = product_info["title"].replace(" | eBay", "").strip()
-                product_info["product_name"] = clean_title
-            
-            # 2. PRECIO - Buscar el precio principal
-            price_candidates = [
-                soup.find(class_=lambda x: x and 'x-price-primary' in x),
-                soup.find(class_=lambda x: x and 'displayPrice' in x),
-                soup.find('span', {'id': 'prcIsum'}),
-                soup.find('span', {'itemprop': 'price'})
-            ]
-            
-            for candidate in price_candidates:
-                if candidate:
-                    product_info["price"] = candidate.get_text(strip=True)
-                    break
+            # 0. DATOS ESTRUCTURADOS - Ruta rápida sin construir el DOM
+            product_info.update(extract_structured_data(html_content))
+        except Exception as e:
+            # Un JSON-LD mal formado no debe impedir la extracción con el perfil
+            logger.error(f"Error al leer los datos estructurados: {str(e)}")
+        
+        try:
+            missing = [field for field in STRUCTURED_FIELDS if not product_info[field]]
+            if not missing:
+                logger.debug("Todos los campos obtenidos de JSON-LD, se omite el DOM")
+            else:
+                soup = BeautifulSoup(html_content, 'html.parser')
+                self.fill_missing_fields(product_info, profile, soup, missing)
             
+        except Exception as e:
+            logger.error(f"Error al parsear HTML: {str(e)}")
+        
+        # 6. PRECIO NORMALIZADO - Monto numérico y moneda para filtros por rango
+        product_info.update(normalize_price(product_info["price"]))
+        
+        # Depuración para ver qué se extrajo
+        if metrics.sampled(logger=logger):
+            logger.debug(f"Información extraída ({profile.label}): Nombre={product_info['product_name'][:30]}..., " +
+                         f"Precio={product_info['price']}, Categorías={product_info['categories']}, " +
+                         f"Imágenes={len(product_info['images'])}")
+        
+        return product_info
+
+    def fill_missing_fields(self, product_info, profile, soup, missing):
+        """Completa con el DOM solo los campos que no vinieron en los datos estructurados"""
+        # 1. NOMBRE DEL PRODUCTO 
+        if "product_name" in missing:
+            product_info["product_name"] = profile.extract_product_name(soup, product_info["title"])
+        
+        # 2. PRECIO - Buscar el precio principal
+        if "price" in missing:
+            product_info["price"] = profile.extract_price(soup)
+        
+        # 3. DESCRIPCIÓN
+        if "description" in missing:
             description_found = False
             
             # Primero buscar si hay un iframe de descripción (común en eBay)
-            iframe = soup.find('iframe', {'id': 'desc_ifr'})
-            if iframe and 'src' in iframe.attrs:
-                iframe_url = iframe['src']
-                logger.info(f"Encontrado iframe de descripción con URL: {iframe_url}")
+            iframe_url = profile.find_description_iframe(soup)
+            if iframe_url:
+                if metrics.sampled(logger=logger):
+                    logger.debug(f"Encontrado iframe de descripción con URL: {iframe_url}")
                 
                 try:
-                    iframe_response = requests.get(iframe_url, timeout=10)
+                    with metrics.stage('iframe_fetch'):
+                        iframe_response = requests.get(iframe_url, timeout=10)
                     if iframe_response.status_code == 200:
                         iframe_soup = BeautifulSoup(iframe_response.text, 'html.parser')
                         
                         if iframe_soup.body:
                             product_info["description"] = iframe_soup.body.get_text(strip=True)
                             description_found = True
-                            logger.info("Descripción extraída del iframe correctamente")
+                            if metrics.sampled(logger=logger):
+                                logger.debug("Descripción extraída del iframe correctamente")
                 except Exception as iframe_error:
                     logger.error(f"Error al obtener contenido del iframe: {iframe_error}")
             
             # Si no se encontró descripción en el iframe, buscar en el HTML principal
             if not description_found:
-                desc_elem = soup.find(id='desc_div') or soup.find(class_=lambda x: x and 'description' in x)
-                if desc_elem:
-                    product_info["description"] = desc_elem.get_text(strip=True)
-                    description_found = True
-                else:
-                    desc_container = soup.find('div', {'data-marko-key': '@container s0-14', 'class': 'x-item-description-child'})
-                    if desc_container:
-                        product_info["description"] = desc_container.get_text(strip=True)
-                        description_found = True
-                    else:
-                        item_desc = soup.find('div', {'class': 'item-desc'}) or soup.find('div', {'class': 'prodDetailSec'})
-                        if item_desc:
-                            product_info["description"] = item_desc.get_text(strip=True)
-                            description_found = True
-            
-            # 4. CATEGORÍAS - Extraer categorías 
-            seo_breadcrumbs = soup.find_all('a', {'class': 'seo-breadcrumb-text'})
-            if seo_breadcrumbs:
-                for breadcrumb in seo_breadcrumbs:
-                    
-                    span = breadcrumb.find('span')
-                    if span:
-                        cat_text = span.get_text(strip=True)
-                    else:
-                        cat_text = breadcrumb.get_text(strip=True)
-                        
-                    if cat_text and cat_text not in product_info["categories"]:
-                        product_info["categories"].append(cat_text)
-                logger.info(f"Categorías extraídas de seo-breadcrumb-text: {product_info['categories']}")
-            
-            # Si no se encontraron categorías con seo-breadcrumb-text, buscar en breadcrumbs regulares
-            if not product_info["categories"]:
-                breadcrumb = soup.find('nav', {'class': 'breadcrumb'}) or soup.find('ul', {'class': 'breadcrumbs'})
-                if breadcrumb:
-                    category_elements = breadcrumb.find_all('a') or breadcrumb.find_all('li')
-                    for cat in category_elements:
-                        cat_text = cat.get_text(strip=True)
-                        if cat_text and cat_text not in ["Home", "Back to home page"]:
-                            product_info["categories"].append(cat_text)
-            
-            # 5. IMÁGENES - Extraer imágenes del producto
-            image_containers = [
-                soup.find('div', {'id': 'mainImgHldr'}),
-                soup.find('div', {'class': 'ux-image-carousel'})
-            ]
-            
-            for container in image_containers:
-                if container:
-                    images = container.find_all('img')
-                    for img in images:
-                        for attr in ['src', 'data-src', 'data-img-src', 'data-zoom-src']:
-                            if attr in img.attrs:
-                                img_src = img[attr]
-                                # Convertir URLs relativas a absolutas
-                                if img_src.startswith('//'):
-                                    img_src = 'https:' + img_src
-                                # Ignorar imágenes muy pequeñas o iconos
-                                if 'gif' not in img_src.lower() and 'icon' not in img_src.lower():
-                                    product_info["images"].append(img_src)
-                                    break
-            
-            # Si no se encontraron imágenes, buscar alternativas
-            if not product_info["images"]:
-                ebay_images = soup.find_all('img', src=lambda src: src and 'i.ebayimg.com' in src)
-                for img in ebay_images:
-                    img_src = img['src']
-                    if 's-l64' not in img_src and 's-l32' not in img_src:
-                        if img_src.startswith('//'):
-                            img_src = 'https:' + img_src
-                        product_info["images"].append(img_src)
-            
-            # Mejorar URLs de imágenes para obtener tamaños más grandes
-            for i, img_url in enumerate(product_info["images"]):
-                # Reemplazar versiones pequeñas con versiones grandes cuando sea posible
-                for size in ['140', '225', '300']:
-                    if f's-l{size}' in img_url:
-                        product_info["images"][i] = img_url.replace(f's-l{size}', 's-l500')
-            
-            # Deduplicar imágenes
-            product_info["images"] = list(dict.fromkeys(product_info["images"]))
-            
-        except Exception as e:
-            logger.error(f"Error al parsear HTML: {str(e)}")
+                product_info["description"] = profile.extract_description(soup)
         
-        # Depuración para ver qué se extrajo
-        logger.info(f"Información extraída: Nombre={product_info['product_name'][:30]}..., " +
-                    f"Precio={product_info['price']}, Categorías={product_info['categories']}, " +
-                    f"Imágenes={len(product_info['images'])}")
+        # 4. CATEGORÍAS - Extraer categorías 
+        if "categories" in missing:
+            product_info["categories"] = profile.extract_categories(soup)
         
-        return product_info
+        # 5. IMÁGENES - Extraer imágenes del producto
+        if "images" in missing:
+            product_info["images"] = profile.extract_images(soup)
 
+    @metrics.timed('s3_get')
     def download_file_from_s3(self, doc_id):
-        """Descarga un archivo de S3"""
+        """Lee el archivo de S3 por fragmentos y deja de leer cuando ya están los campos necesarios"""
         try:
             file_path = os.path.join(KEY, f"{doc_id}.html")
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                self.s3_client.download_file(BUCKET, file_path, temp_file.name)
-                temp_file_path = temp_file.name
-            
-            with open(temp_file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
+            response = self.s3_client.get_object(Bucket=BUCKET, Key=file_path)
+            body = response['Body']
+            try:
+                # El scraper puede subir el HTML comprimido con gzip/zstd
+                content, bytes_read = read_until_complete(
+                    iter_decompressed(body.iter_chunks(chunk_size=STREAM_CHUNK_SIZE), response.get('ContentEncoding')),
+                    self.profiles.stream_stop,
+                    field_elements=self.profiles.stream_fields
+                )
+            finally:
+                # Cerrar el stream descarta el resto del cuerpo sin descargarlo
+                body.close()
             
-            os.unlink(temp_file_path)
+            if metrics.sampled(logger=logger):
+                logger.debug(f"Leídos {bytes_read} de {response.get('ContentLength', '?')} bytes de {file_path}")
             return content
         except Exception as e:
             logger.error(f"Error al descargar archivo de S3: {e}")
             return None
 
+    def finish_trace(self, trace, started, status):
+        """Registra el tramo del procesador y cierra el trace del documento"""
+        metrics.record_status(status)
+        trace.add_stage(SERVICE, "process", started, now_ms())
+        trace.finish(SERVICE, status, observe_lag=status == "processed")
+
+    def retry_later(self, ch, method, properties, body, reason, permanent=False):
+        """Reprograma el mensaje con espera exponencial o lo envía a la cola de muertos.
+
+        Si la publicación falla la excepción se propaga: el original no se confirma
+        y RabbitMQ lo vuelve a entregar al cerrarse el canal.
+        """
+        return retry.schedule_retry(ch, method.routing_key or RABBITMQ_QUEUE, body, properties, reason,
+                                    permanent=permanent)
+
+    @metrics.track_message
+    @profiling.profiled
     def process_message(self, ch, method, properties, body):
         """Procesa un mensaje de RabbitMQ"""
+        started = now_ms()
+        trace = TraceContext.from_properties(properties)
         try:
-            message = json.loads(body)
-            logger.info(f"Contenido completo del mensaje recibido: {message}")
+            # Acepta JSON (también sin versión) y msgpack durante la migración
+            message = decode_message(body, properties, DOCUMENT_STORED)
+            if metrics.sampled(logger=logger):
+                logger.debug(f"Contenido completo del mensaje recibido: {message}")
             
             # Obtener el ID del documento y convertirlo a string
             doc_id = message.get('document_id')
@@ -348,10 +380,13 @@ class DocumentProcessor:
             
             if not doc_id or not elasticsearch_id:
                 logger.error(f"Mensaje sin IDs requeridos. document_id: {doc_id}, elasticsearch_id: {elasticsearch_id}")
+                metrics.record_status("error_invalid_message")
+                self.retry_later(ch, method, properties, body, "Mensaje sin IDs requeridos", permanent=True)
                 ch.basic_ack(delivery_tag=method.delivery_tag)
                 return
             
-            logger.info(f"Procesando documento {doc_id} con elasticsearch_id {elasticsearch_id}")
+            if metrics.sampled(logger=logger):
+                logger.debug(f"Procesando documento {doc_id} con elasticsearch_id {elasticsearch_id}")
             
             self.update_document_status(doc_id, "processed")
             
@@ -364,27 +399,41 @@ class DocumentProcessor:
                 html_content = self.download_file_from_s3(doc_id)
                 if not html_content:
                     self.update_document_status(doc_id, "error_not_found")
+                    self.finish_trace(trace, started, "error_not_found")
+                    # S3 o Elasticsearch pueden estar caídos momentáneamente
+                    self.retry_later(ch, method, properties, body, f"Documento {doc_id} no encontrado en Elasticsearch ni S3")
                     ch.basic_ack(delivery_tag=method.delivery_tag)
                     return
             else:
                 html_content = es_doc.get('content', '')
             
-            # Parsear el contenido HTML
-            product_info = self.parse_html_with_beautifulsoup(html_content)
+            # Parsear el contenido HTML; la URL de origen elige el perfil de la tienda
+            product_info = self.parse_html_with_beautifulsoup(html_content, extract_source_url(html_content))
             
             # Guardar información extraída en Elasticsearch
             if self.save_document_to_elasticsearch(doc_id, product_info):
                 self.update_document_status(doc_id, "processed")
+                self.finish_trace(trace, started, "processed")
             else:
                 self.update_document_status(doc_id, "error_saving")
+                self.finish_trace(trace, started, "error_saving")
+                self.retry_later(ch, method, properties, body, f"Error al guardar el documento {doc_id}")
             
             # Confirmar mensaje procesado
             ch.basic_ack(delivery_tag=method.delivery_tag)
-            logger.info(f"Documento {doc_id} procesado correctamente")
+            if metrics.sampled(logger=logger):
+                logger.debug(f"Documento {doc_id} procesado correctamente")
             
         except Exception as e:
             logger.error(f"Error al procesar mensaje: {e}")
-            # Confirmar el mensaje para no reprocesarlo continuamente
+            self.finish_trace(trace, started, "error_processing")
+            # El mensaje se reprograma con espera (o va a la cola de muertos) en lugar de
+            # reprocesarlo continuamente; el original se confirma solo si eso se publicó
+            try:
+                self.retry_later(ch, method, properties, body, e, permanent=isinstance(e, MessageError))
+            except Exception as retry_error:
+                logger.error(f"No se pudo reprogramar el mensaje, queda sin confirmar: {retry_error}")
+                raise
             ch.basic_ack(delivery_tag=method.delivery_tag)
             # Si se pudo identificar el documento, actualizar su estado
             if locals().get('doc_id'):
@@ -393,18 +442,25 @@ class DocumentProcessor:
     def start_consuming(self):
         """Inicia el consumo de mensajes de RabbitMQ"""
         logger.info(f"Iniciando consumo de mensajes de la cola {RABBITMQ_QUEUE}")
-        self.rabbitmq_channel.basic_qos(prefetch_count=1)
-        self.rabbitmq_channel.basic_consume(
-            queue=RABBITMQ_QUEUE,
-            on_message_callback=self.process_message
+        # Carriles de prioridad: nuevos y actualizados se consumen con pesos (LANE_WEIGHTS)
+        self.consumer = lanes.LaneConsumer(
+            self.rabbitmq_connection,
+            self.rabbitmq_channel,
+            self.process_message,
+            lanes.configured(RABBITMQ_QUEUE),
+            prefetch=1
         )
+        self.consumer.start()
+        # Modo de carga masiva del índice destino según el backlog de las colas
+        self.bulk_ingest = BulkIngestMode(self.es, [ELASTICSEARCH_INDEX_DST])
+        self.bulk_ingest.schedule(self.rabbitmq_connection, self.rabbitmq_channel, self.consumer.queues)
         try:
-            self.rabbitmq_channel.start_consuming()
+            self.consumer.run()
         except KeyboardInterrupt:
-            self.rabbitmq_channel.stop_consuming()
+            self.consumer.stop()
         except Exception as e:
             logger.error(f"Error en consumo de mensajes: {e}")
-            self.rabbitmq_channel.stop_consuming()
+            self.consumer.stop()
         
         self.cleanup()
 
@@ -421,11 +477,14 @@ class DocumentProcessor:
                 self.mariadb_connection.close()
             except:
                 pass
+        close_all()
         
         logger.info("Conexiones cerradas")
 
 # Función principal
 def main():
+    metrics.start_metrics_server()
+    profiling.install()
     try:
         processor = DocumentProcessor()
         processor.start_consuming()
@@ -0,0 +1,113 @@
+import re
+import json
+import hashlib
+
+# Versión del template; al cambiar el mapping se debe incrementar para que se reinstale
+TEMPLATE_VERSION = 3
+
+# Prefijos/símbolos de moneda más comunes en eBay y Amazon (los más largos primero)
+CURRENCY_SYMBOLS = [
+    ("US $", "USD"), ("C $", "CAD"), ("AU $", "AUD"), ("HK $", "HKD"), ("NZ $", "NZD"),
+    ("R$", "BRL"), ("MX$", "MXN"), ("$", "USD"), ("£", "GBP"), ("€", "EUR"),
+    ("¥", "JPY"), ("₹", "INR"), ("CHF", "CHF"),
+]
+ISO_CURRENCY_PATTERN = re.compile(r'\b([A-Z]{3})\b')
+AMOUNT_PATTERN = re.compile(r'\d[\d.,]*')
+
+
+def parse_amount(text):
+    """Convierte "1,234.56", "1.234,56" o "12,99" en float"""
+    amount = text.rstrip('.,')
+    if ',' in amount and '.' in amount:
+        # El último separador es el decimal
+        if amount.rfind(',') > amount.rfind('.'):
+            amount = amount.replace('.', '').replace(',', '.')
+        else:
+            amount = amount.replace(',', '')
+    elif ',' in amount:
+        integer, _, decimals = amount.rpartition(',')
+        if len(decimals) == 2 and ',' not in integer:
+            amount = f"{integer}.{decimals}"
+        else:
+            amount = amount.replace(',', '')
+    elif amount.count('.') > 1:
+        amount = amount.replace('.', '')
+    return float(amount)
+
+
+def normalize_price(price_text):
+    """Obtiene el monto numérico y la moneda a partir del precio mostrado.
+
+    Para rangos ("US $10.00 to US $20.00") se usa el primer monto.
+    """
+    result = {"price_value": None, "currency": None}
+    if not price_text:
+        return result
+
+    match = AMOUNT_PATTERN.search(price_text)
+    if match:
+        try:
+            result["price_value"] = parse_amount(match.group(0))
+        except ValueError:
+            pass
+
+    prefix = price_text[:match.start()] if match else price_text
+    iso = ISO_CURRENCY_PATTERN.search(prefix) or ISO_CURRENCY_PATTERN.search(price_text)
+    for symbol, code in CURRENCY_SYMBOLS:
+        if symbol in prefix:
+            result["currency"] = code
+            break
+    else:
+        if iso:
+            result["currency"] = iso.group(1)
+    return result
+
+
+def field_hashes(document_data):
+    """Calcula el hash MD5 de cada campo del documento procesado"""
+    return {
+        field: hashlib.md5(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        for field, value in document_data.items()
+        if field != "field_hashes"
+    }
+
+
+def changed_fields(document_data, hashes, stored_hashes):
+    """Retorna solo los campos cuyo hash difiere del almacenado"""
+    return {
+        field: document_data[field]
+        for field, digest in hashes.items()
+        if stored_hashes.get(field) != digest
+    }
+
+
+def processed_documents_template(index_pattern):
+    """Template del índice de documentos procesados con tipos explícitos"""
+    return {
+        "index_patterns": [index_pattern],
+        "template": {
+            "mappings": {
+                # Los campos no declarados se guardan en _source pero no se indexan
+                "dynamic": False,
+                "properties": {
+                    # Desempate único para paginar con search_after
+                    "document_id": {"type": "keyword"},
+                    "title": {"type": "text"},
+                    "product_name": {
+                        "type": "text",
+                        "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}
+                    },
+                    "price": {"type": "keyword", "index": False},
+                    "price_value": {"type": "scaled_float", "scaling_factor": 100},
+                    "currency": {"type": "keyword"},
+                    "description": {"type": "text"},
+                    "categories": {"type": "keyword"},
+                    "images": {"type": "keyword", "index": False, "doc_values": False},
+                    "site_profile": {"type": "keyword"},
+                    # Hash por campo para las actualizaciones parciales; solo se guarda en _source
+                    "field_hashes": {"type": "object", "enabled": False}
+                }
+            }
+        },
+        "_meta": {"version": TEMPLATE_VERSION}
+    }
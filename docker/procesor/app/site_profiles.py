@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import logging
+import soupsieve
+from streaming import parse_simple_selector, parse_marker
+
+logger = logging.getLogger('document_processor')
+
+# Directorio por defecto con los perfiles de extracción (uno por tienda)
+PROFILES_DIR = os.getenv(
+    'SITE_PROFILES_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+SITE_PROFILE_DEFAULT = os.getenv('SITE_PROFILE_DEFAULT', 'ebay')
+
+
+def compile_selectors(selectors):
+    """Compila una lista de selectores CSS una sola vez"""
+    return [soupsieve.compile(selector) for selector in selectors or []]
+
+
+class SiteProfile:
+    """Reglas de extracción de una tienda, compiladas a partir de su definición JSON"""
+
+    def __init__(self, definition):
+        self.name = definition['name']
+        self.version = definition.get('version', 1)
+
+        match = definition.get('match', {})
+        self.url_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in match.get('url_patterns', [])]
+        self.markers = match.get('markers', [])
+        self.title_suffixes = definition.get('title_suffixes', [])
+
+        fields = definition.get('fields', {})
+
+        name = fields.get('product_name', {})
+        self.name_selectors = compile_selectors(name.get('selectors'))
+        self.name_strip_prefixes = name.get('strip_prefixes', [])
+
+        price = fields.get('price', {})
+        self.price_selectors = compile_selectors(price.get('selectors'))
+
+        description = fields.get('description', {})
+        iframe = description.get('iframe')
+        self.description_iframe = soupsieve.compile(iframe) if iframe else None
+        self.description_selectors = compile_selectors(description.get('selectors'))
+
+        categories = fields.get('categories', {})
+        self.category_selectors = compile_selectors(categories.get('selectors'))
+        text_selector = categories.get('text_selector')
+        self.category_text_selector = soupsieve.compile(text_selector) if text_selector else None
+        self.category_containers = compile_selectors(categories.get('containers'))
+        self.category_items = compile_selectors(categories.get('container_items'))
+        self.category_exclude = set(categories.get('exclude', []))
+
+        images = fields.get('images', {})
+        self.image_containers = compile_selectors(images.get('containers'))
+        self.image_attributes = images.get('attributes', ['src'])
+        self.image_exclude = images.get('exclude', [])
+        fallback = images.get('fallback')
+        self.image_fallback = soupsieve.compile(fallback) if fallback else None
+        self.image_fallback_exclude = images.get('fallback_exclude', [])
+        self.image_rewrites = [tuple(rewrite) for rewrite in images.get('rewrites', [])]
+
+        # Elementos tras cuyo cierre la descripción ya está leída
+        self.stream_stop = [parse_simple_selector(selector) for selector in definition.get('stream_stop', [])]
+        # Marcadores del resto de los campos para la lectura por fragmentos; los
+        # selectores que no se pueden evaluar sin DOM se omiten
+        self.stream_fields = {}
+        for field in ('product_name', 'price', 'categories', 'images'):
+            definition_field = fields.get(field, {})
+            selectors = definition_field.get('selectors', []) + definition_field.get('containers', [])
+            markers = [marker for marker in map(parse_marker, selectors) if marker]
+            if markers:
+                self.stream_fields[field] = markers
+
+    @property
+    def label(self):
+        return f"{self.name}@{self.version}"
+
+    def matches_url(self, url):
+        return any(pattern.search(url) for pattern in self.url_patterns)
+
+    def matches_markup(self, html_content):
+        return any(marker in html_content for marker in self.markers)
+
+    @staticmethod
+    def _first(selectors, soup):
+        for selector in selectors:
+            element = selector.select_one(soup)
+            if element:
+                return element
+        return None
+
+    def extract_product_name(self, soup, title):
+        """Nombre del producto; si no hay candidato se usa el título sin el sufijo de la tienda"""
+        element = self._first(self.name_selectors, soup)
+        if element:
+            name_text = element.get_text(strip=True)
+            # Limpiar prefijos comunes como "Details about"
+            for prefix in self.name_strip_prefixes:
+                if name_text.startswith(prefix):
+                    name_text = name_text.replace(prefix, "").strip()
+            return name_text
+
+        if title:
+            clean_title = title
+            for suffix in self.title_suffixes:
+                clean_title = clean_title.replace(suffix, "")
+            return clean_title.strip()
+        return ""
+
+    def extract_price(self, soup):
+        element = self._first(self.price_selectors, soup)
+        return element.get_text(strip=True) if element else ""
+
+    def find_description_iframe(self, soup):
+        """Retorna la URL del iframe de descripción si el perfil lo define"""
+        if self.description_iframe is None:
+            return None
+        iframe = self.description_iframe.select_one(soup)
+        if iframe and 'src' in iframe.attrs:
+            return iframe['src']
+        return None
+
+    def extract_description(self, soup):
+        element = self._first(self.description_selectors, soup)
+        return element.get_text(strip=True) if element else ""
+
+    def extract_categories(self, soup):
+        categories = []
+        for selector in self.category_selectors:
+            for breadcrumb in selector.select(soup):
+                text_element = self.category_text_selector.select_one(breadcrumb) if self.category_text_selector else None
+                cat_text = (text_element or breadcrumb).get_text(strip=True)
+                if cat_text and cat_text not in categories:
+                    categories.append(cat_text)
+            if categories:
+                return categories
+
+        # Si no se encontraron categorías, buscar en breadcrumbs regulares
+        container = self._first(self.category_containers, soup)
+        if container:
+            for item_selector in self.category_items:
+                items = item_selector.select(container)
+                if items:
+                    for item in items:
+                        cat_text = item.get_text(strip=True)
+                        if cat_text and cat_text not in self.category_exclude:
+                            categories.append(cat_text)
+                    break
+        return categories
+
+    def extract_images(self, soup):
+        images = []
+        for container_selector in self.image_containers:
+            container = container_selector.select_one(soup)
+            if not container:
+                continue
+            for img in container.find_all('img'):
+                for attr in self.image_attributes:
+                    if attr in img.attrs:
+                        img_src = img[attr]
+                        # Convertir URLs relativas a absolutas
+                        if img_src.startswith('//'):
+                            img_src = 'https:' + img_src
+                        # Ignorar imágenes muy pequeñas o iconos
+                        if not any(token in img_src.lower() for token in self.image_exclude):
+                            images.append(img_src)
+                            break
+
+        # Si no se encontraron imágenes, buscar alternativas
+        if not images and self.image_fallback is not None:
+            for img in self.image_fallback.select(soup):
+                img_src = img.get('src', '')
+                if img_src and not any(token in img_src for token in self.image_fallback_exclude):
+                    if img_src.startswith('//'):
+                        img_src = 'https:' + img_src
+                    images.append(img_src)
+
+        # Mejorar URLs de imágenes para obtener tamaños más grandes
+        for i, img_url in enumerate(images):
+            for old, new in self.image_rewrites:
+                if old in img_url:
+                    images[i] = img_url.replace(old, new)
+
+        # Deduplicar imágenes
+        return list(dict.fromkeys(images))
+
+
+class ProfileRegistry:
+    """Conjunto de perfiles cargados al iniciar; enruta cada página a su perfil"""
+
+    def __init__(self, profiles, default=SITE_PROFILE_DEFAULT):
+        self.profiles = profiles
+        self.default = next((p for p in profiles if p.name == default), profiles[0] if profiles else None)
+        # Se usan los elementos de corte de todos los perfiles porque al leer por
+        # fragmentos todavía no se conoce la tienda
+        self.stream_stop = [element for profile in profiles for element in profile.stream_stop]
+        self.stream_fields = {}
+        for profile in profiles:
+            for field, markers in profile.stream_fields.items():
+                self.stream_fields.setdefault(field, []).extend(markers)
+
+    def route(self, html_content, url=None):
+        """Selecciona el perfil por URL o, si no hay URL, por huella del marcado"""
+        if url:
+            for profile in self.profiles:
+                if profile.matches_url(url):
+                    return profile
+        for profile in self.profiles:
+            if profile.matches_markup(html_content):
+                return profile
+        return self.default
+
+
+def load_profiles(profiles_dir=PROFILES_DIR, default=SITE_PROFILE_DEFAULT):
+    """Carga y compila todos los perfiles *.json del directorio"""
+    profiles = []
+    for file_name in sorted(os.listdir(profiles_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(profiles_dir, file_name), 'r', encoding='utf-8') as file:
+            profile = SiteProfile(json.load(file))
+        profiles.append(profile)
+        logger.info(f"Perfil de extracción cargado: {profile.label}")
+    return ProfileRegistry(profiles, default)
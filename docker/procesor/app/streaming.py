@@ -0,0 +1,186 @@
+import os
+import re
+import codecs
+import logging
+from html.parser import HTMLParser
+from structured_data import extract_structured_data
+
+logger = logging.getLogger('document_processor')
+
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', str(64 * 1024)))
+# Límite de bytes leídos por documento aunque falten campos requeridos
+STREAM_MAX_BYTES = int(os.getenv('STREAM_MAX_BYTES', str(8 * 1024 * 1024)))
+
+SIMPLE_SELECTOR_PATTERN = re.compile(r'^(?P<tag>[a-zA-Z0-9]*)(?:#(?P<id>[\w-]+))?(?:\.(?P<cls>[\w-]+))?$')
+# Marcador de campo: primer elemento de un selector CSS (tag, #id, .clase, [atributo])
+MARKER_PATTERN = re.compile(r'^(?P<tag>[a-zA-Z0-9]*)(?P<rest>(?:#[\w-]+|\.[\w-]+|\[[^\]]+\])*)$')
+MARKER_PART_PATTERN = re.compile(r'#(?P<id>[\w-]+)|\.(?P<cls>[\w-]+)|\[(?P<attr>[^\]]+)\]')
+ATTRIBUTE_PATTERN = re.compile(r'^\s*(?P<name>[\w-]+)\s*(?:(?P<op>[*^$~]?=)\s*["\']?(?P<value>[^"\']*)["\']?)?\s*$')
+VOID_TAGS = {'img', 'meta', 'link', 'br', 'hr', 'input', 'source'}
+# Sin DOM solo se puede confirmar la descripción con los elementos de corte
+DESCRIPTION = 'description'
+LD_JSON_TYPE = 'application/ld+json'
+
+
+def parse_simple_selector(selector):
+    """Convierte "tag", "tag#id", "#id" o "tag.clase" en una tupla (tag, id, clase)"""
+    match = SIMPLE_SELECTOR_PATTERN.match(selector.strip())
+    if not match:
+        raise ValueError(f"Selector de corte no soportado: {selector}")
+    return (match.group('tag') or None, match.group('id'), match.group('cls'))
+
+
+def parse_marker(selector):
+    """Marcador (tag, id, clases, atributos) del primer elemento del selector, o None si no se soporta.
+
+    Se usa el primer elemento (el contenedor): cuando se cierra, el campo ya se leyó.
+    """
+    compound = selector.strip().split()[0] if selector.strip() else ''
+    match = MARKER_PATTERN.match(compound)
+    if not match or not compound:
+        return None
+    element_id, classes, attributes = None, [], []
+    for part in MARKER_PART_PATTERN.finditer(match.group('rest')):
+        if part.group('id'):
+            element_id = part.group('id')
+        elif part.group('cls'):
+            classes.append(part.group('cls'))
+        else:
+            attribute = ATTRIBUTE_PATTERN.match(part.group('attr'))
+            if not attribute:
+                return None
+            attributes.append((attribute.group('name'), attribute.group('op'), attribute.group('value') or ''))
+    return (match.group('tag') or None, element_id, tuple(classes), tuple(attributes))
+
+
+def _as_marker(element):
+    """Acepta también las tuplas (tag, id, clase) de parse_simple_selector"""
+    if len(element) == 3:
+        tag, element_id, cls = element
+        return (tag, element_id, (cls,) if cls else (), ())
+    return element
+
+
+def _attribute_matches(actual, op, expected):
+    if actual is None:
+        return False
+    if not op:
+        return True
+    if op == '=':
+        return actual == expected
+    if op == '*=':
+        return expected in actual
+    if op == '^=':
+        return actual.startswith(expected)
+    if op == '$=':
+        return actual.endswith(expected)
+    return expected in actual.split()
+
+
+def marker_matches(marker, tag, attributes):
+    marker_tag, marker_id, marker_classes, marker_attributes = marker
+    if marker_tag and marker_tag != tag:
+        return False
+    if marker_id and attributes.get('id') != marker_id:
+        return False
+    classes = (attributes.get('class') or '').split()
+    if any(cls not in classes for cls in marker_classes):
+        return False
+    return all(_attribute_matches(attributes.get(name), op, value) for name, op, value in marker_attributes)
+
+
+class StopScanner(HTMLParser):
+    """Parser incremental que registra qué campos requeridos ya se leyeron completos.
+
+    La descripción se da por leída al cerrar un elemento de corte; cada campo de
+    `field_elements` ({campo: [marcadores]}) al cerrar uno de sus marcadores. Un
+    bloque JSON-LD cerrado cuenta para todos los campos que trae, así un JSON-LD
+    al final de la página se sigue leyendo si el DOM anterior no tenía todo.
+    """
+
+    def __init__(self, stop_elements, field_elements=None):
+        super().__init__(convert_charrefs=False)
+        self.markers = {DESCRIPTION: [_as_marker(element) for element in stop_elements]}
+        for field, markers in (field_elements or {}).items():
+            self.markers.setdefault(field, []).extend(_as_marker(marker) for marker in markers)
+        self.required = set(self.markers)
+        self.seen = set()
+        self.open = []
+        self._script = None
+
+    @property
+    def done(self):
+        return self.required <= self.seen
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        attributes = dict(attrs)
+        if tag == 'script' and (attributes.get('type') or '').strip().lower() == LD_JSON_TYPE:
+            self._script = []
+            return
+        for entry in self.open:
+            if entry[1] == tag:
+                entry[2] += 1
+        opened = {entry[0] for entry in self.open}
+        for field, markers in self.markers.items():
+            if field in self.seen or field in opened:
+                continue
+            if any(marker_matches(marker, tag, attributes) for marker in markers):
+                if tag in VOID_TAGS:
+                    self.seen.add(field)
+                else:
+                    self.open.append([field, tag, 1])
+
+    def handle_data(self, data):
+        if self._script is not None:
+            self._script.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'script' and self._script is not None:
+            self._structured_fields(''.join(self._script))
+            self._script = None
+            return
+        for entry in list(self.open):
+            if entry[1] == tag:
+                entry[2] -= 1
+                if entry[2] == 0:
+                    self.seen.add(entry[0])
+                    self.open.remove(entry)
+
+    def _structured_fields(self, text):
+        try:
+            fields = extract_structured_data(f'<script type="{LD_JSON_TYPE}">{text}</script>')
+        except Exception as e:
+            logger.debug(f"JSON-LD ilegible durante la lectura por fragmentos: {e}")
+            return
+        self.seen.update(field for field, value in fields.items() if value)
+
+
+def read_until_complete(chunks, stop_elements, max_bytes=STREAM_MAX_BYTES, field_elements=None):
+    """Lee fragmentos de bytes hasta tener todos los campos requeridos o llegar a max_bytes.
+
+    Sin `field_elements` el único campo requerido es la descripción (cierre de
+    un elemento de corte). Retorna el HTML leído y la cantidad de bytes consumidos.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    scanner = StopScanner(stop_elements, field_elements)
+    parts = []
+    bytes_read = 0
+
+    for chunk in chunks:
+        bytes_read += len(chunk)
+        text = decoder.decode(chunk)
+        parts.append(text)
+        scanner.feed(text)
+        if scanner.done:
+            logger.debug(f"Campos requeridos completos tras {bytes_read} bytes")
+            break
+        if bytes_read >= max_bytes:
+            logger.warning(f"Se alcanzó el límite de {max_bytes} bytes sin todos los campos "
+                           f"(faltan {sorted(scanner.required - scanner.seen)})")
+            break
+    else:
+        parts.append(decoder.decode(b'', final=True))
+
+    return ''.join(parts), bytes_read
@@ -0,0 +1,148 @@
+import re
+import json
+import html
+import logging
+
+logger = logging.getLogger('document_processor')
+
+# Escaneo barato sobre el texto crudo, sin construir el DOM
+LD_JSON_PATTERN = re.compile(
+    r'<script[^>]+type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+TITLE_PATTERN = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+# URL de origen de la página: <link rel="canonical"> o <meta property="og:url">
+SOURCE_URL_PATTERNS = [
+    re.compile(r'<link\b(?=[^>]*\brel\s*=\s*["\']canonical["\'])[^>]*\bhref\s*=\s*["\']([^"\']+)["\']',
+               re.IGNORECASE),
+    re.compile(r'<meta\b(?=[^>]*\bproperty\s*=\s*["\']og:url["\'])[^>]*\bcontent\s*=\s*["\']([^"\']+)["\']',
+               re.IGNORECASE),
+]
+
+
+def extract_title(html_content):
+    """Obtiene el <title> del documento sin parsearlo completo"""
+    match = TITLE_PATTERN.search(html_content)
+    if not match:
+        return "Sin título"
+    return html.unescape(match.group(1))
+
+
+def extract_source_url(html_content):
+    """URL de origen declarada en la página (el mensaje solo trae la ruta en S3), o None"""
+    for pattern in SOURCE_URL_PATTERNS:
+        match = pattern.search(html_content)
+        if match:
+            return html.unescape(match.group(1)).strip()
+    return None
+
+
+def _types(node):
+    node_type = node.get('@type', [])
+    return node_type if isinstance(node_type, list) else [node_type]
+
+
+def _walk(data):
+    """Recorre los nodos JSON-LD, incluyendo listas y @graph"""
+    if isinstance(data, list):
+        for item in data:
+            yield from _walk(item)
+    elif isinstance(data, dict):
+        yield data
+        if '@graph' in data:
+            yield from _walk(data['@graph'])
+
+
+def _image_urls(image):
+    if isinstance(image, str):
+        return [image]
+    if isinstance(image, dict):
+        return _image_urls(image.get('url') or image.get('contentUrl'))
+    if isinstance(image, list):
+        urls = []
+        for item in image:
+            urls.extend(_image_urls(item))
+        return urls
+    return []
+
+
+def _offer_price(offers):
+    """Retorna el precio como texto "<moneda> <monto>" a partir de Offer/AggregateOffer"""
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    if not isinstance(offers, dict):
+        return ""
+    price = offers.get('price', offers.get('lowPrice'))
+    if price is None and isinstance(offers.get('priceSpecification'), dict):
+        price = offers['priceSpecification'].get('price')
+        offers = offers['priceSpecification']
+    if price is None:
+        return ""
+    currency = offers.get('priceCurrency')
+    return f"{currency} {price}" if currency else str(price)
+
+
+def _text(value):
+    """Texto limpio de un valor JSON-LD; los valores que no son texto se ignoran"""
+    if not isinstance(value, str):
+        return ""
+    return html.unescape(value).strip()
+
+
+def _position(item):
+    # position puede venir como número o como texto ("2")
+    try:
+        return int(item.get('position', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _breadcrumbs(node):
+    categories = []
+    elements = node.get('itemListElement', [])
+    items = sorted(
+        (item for item in (elements if isinstance(elements, list) else []) if isinstance(item, dict)),
+        key=_position
+    )
+    for item in items:
+        name = _text(item.get('name'))
+        if not name and isinstance(item.get('item'), dict):
+            name = _text(item['item'].get('name'))
+        if name and name not in categories:
+            categories.append(name)
+    return categories
+
+
+def extract_structured_data(html_content):
+    """Extrae los campos del producto desde los bloques application/ld+json.
+
+    Solo retorna los campos encontrados; el resto queda para el recorrido del DOM.
+    """
+    fields = {}
+    for match in LD_JSON_PATTERN.finditer(html_content):
+        try:
+            data = json.loads(match.group(1).strip())
+        except ValueError as e:
+            logger.debug(f"Bloque JSON-LD inválido: {e}")
+            continue
+
+        for node in _walk(data):
+            node_types = _types(node)
+            if 'Product' in node_types:
+                name = _text(node.get('name'))
+                if name and 'product_name' not in fields:
+                    fields['product_name'] = name
+                price = _offer_price(node.get('offers'))
+                if price and 'price' not in fields:
+                    fields['price'] = price
+                description = _text(node.get('description'))
+                if description and 'description' not in fields:
+                    fields['description'] = description
+                images = _image_urls(node.get('image'))
+                if images and 'images' not in fields:
+                    fields['images'] = list(dict.fromkeys(images))
+            elif 'BreadcrumbList' in node_types and 'categories' not in fields:
+                categories = _breadcrumbs(node)
+                if categories:
+                    fields['categories'] = categories
+    return fields
@@ -1,6 +1,7 @@
-import time
 import os
+import gzip
 import boto3
+from botocore.config import Config
 import random
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium import webdriver
@@ -10,8 +11,23 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from datetime import datetime
+from functools import lru_cache
 import sys
+import re
+import argparse
+try:
+    import zstandard
+except ImportError:  # zstd es opcional
+    zstandard = None
+from urllib.parse import quote_plus
+from browser_pool import BrowserPool
+from batch import run_batch, SkipProduct
+from timing import StepTimings
+from http_fetcher import HttpFetcher, is_blocked
+from rate_limiter import DomainRateLimiter
+from frontier import CrawlFrontier, item_key
 
 # Configura credenciales de AWS
 AWS_ACCESS_KEY = "############"
@@ -25,49 +41,195 @@ SEARCH_TERMS = [
     "portable charger", "earbuds", "CPU"
 ]
 
-def configure_selenium():
+# Sitio a recorrer; se puede apuntar a un sitio local de prueba (tests/fixtures/ebay_site)
+BASE_URL = os.getenv("SCRAPER_BASE_URL", "https://www.ebay.com").rstrip("/")
+
+# Tiempo máximo de espera (segundos) de cada paso
+TIMEOUT_HOME = int(os.getenv("SCRAPER_TIMEOUT_HOME", "10"))
+TIMEOUT_RESULTS = int(os.getenv("SCRAPER_TIMEOUT_RESULTS", "10"))
+TIMEOUT_PRODUCT = int(os.getenv("SCRAPER_TIMEOUT_PRODUCT", "15"))
+
+RESULTS_SELECTOR = "li.s-item a.s-item__link"
+PRODUCT_READY_SELECTOR = "h1.x-item-title__mainTitle, h1#itemTitle, div.x-price-primary, span#prcIsum"
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+# Intentar primero HTTP simple y usar el navegador solo si la página no es válida
+HTTP_FAST_PATH = os.getenv("SCRAPER_HTTP_FAST_PATH", "true").lower() == "true"
+
+# Perfil liviano del navegador: headless, sin imágenes/medios/fuentes ni dominios de terceros
+LEAN_BROWSER = os.getenv("SCRAPER_LEAN_BROWSER", "true").lower() == "true"
+HEADLESS = os.getenv("SCRAPER_HEADLESS", "true").lower() == "true"
+BLOCKED_RESOURCES = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4", "*.webm", "*.m3u8", "*.mp3"
+]
+BLOCKED_DOMAINS = [
+    domain.strip() for domain in os.getenv(
+        "SCRAPER_BLOCKED_DOMAINS",
+        "doubleclick.net,googlesyndication.com,googletagmanager.com,google-analytics.com,"
+        "googleadservices.com,facebook.net,facebook.com,scorecardresearch.com,criteo.com,"
+        "adnxs.com,casalemedia.com,rubiconproject.com,pubmatic.com,bing.com,tiktok.com,"
+        "pinterest.com,hotjar.com,qualtrics.com"
+    ).split(",") if domain.strip()
+]
+
+# Compresión del HTML subido a S3: none, gzip o zstd
+S3_COMPRESSION = os.getenv("SCRAPER_COMPRESSION", "none").lower()
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("SCRAPER_S3_POOL", "10"))
+
+timings = StepTimings()
+# Compartido por todos los workers del proceso (y entre pods con SCRAPER_RATE_STORE)
+rate_limiter = DomainRateLimiter()
+
+@lru_cache(maxsize=1)
+def get_driver_path():
+    """Resuelve el binario de chromedriver una sola vez por proceso."""
+    return ChromeDriverManager().install()
+
+def lean_browser_options(chrome_options, headless=HEADLESS):
+    """Perfil liviano: solo se guarda el HTML, así que no se descargan imágenes, medios ni fuentes."""
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--mute-audio")
+    chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+    chrome_options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.media_stream": 2,
+        "profile.default_content_setting_values.notifications": 2
+    })
+    # El DOM está listo antes de que terminen de cargar los recursos
+    chrome_options.page_load_strategy = "eager"
+    return chrome_options
+
+def block_resources(driver):
+    """Bloquea por CDP los recursos pesados y los dominios de terceros (anuncios y tracking)."""
+    patterns = BLOCKED_RESOURCES + [f"*{domain}*" for domain in BLOCKED_DOMAINS]
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception as e:
+        print(f"No se pudieron bloquear recursos: {e}")
+
+def configure_selenium(lean=LEAN_BROWSER):
     """Configura Selenium para Chrome."""
     chrome_options = Options()
     chrome_options.add_argument("--window-size=1920x1080")
-    chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64)")
-    service = Service(ChromeDriverManager().install())
+    chrome_options.add_argument(f"--user-agent={USER_AGENT}")
+    if lean:
+        lean_browser_options(chrome_options)
+    service = Service(get_driver_path())
     driver = webdriver.Chrome(service=service, options=chrome_options)
+    if lean:
+        block_resources(driver)
     return driver
 
-def search_product(driver, search_term):
+PAGE_WEIGHT_SCRIPT = """
+const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+return entries.reduce((total, entry) => total + (entry.transferSize || entry.encodedBodySize || 0), 0);
+"""
+
+def page_weight(driver):
+    """Bytes transferidos por la página actual (documento y recursos), 0 si no se puede medir."""
+    try:
+        weight = driver.execute_script(PAGE_WEIGHT_SCRIPT)
+    except Exception:
+        return 0
+    return int(weight) if isinstance(weight, (int, float)) else 0
+
+def throttle(url):
+    """Espera el turno del dominio antes de que el navegador haga una solicitud."""
+    with timings.step("rate_wait"):
+        rate_limiter.acquire(url)
+
+def document_ready(driver):
+    """Condición de espera: el DOM ya está disponible (con carga eager no se esperan los recursos)."""
+    return driver.execute_script("return document.readyState") in ("interactive", "complete")
+
+def search_product(driver, search_term, base_url=BASE_URL):
     """Busca un producto en eBay."""
-    driver.get("https://www.ebay.com")
-    time.sleep(3)
     try:
-        search_box = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='search']"))
-        )
-        search_box.clear()
-        search_box.send_keys(search_term)
-        search_box.send_keys(Keys.RETURN)
-        time.sleep(5)
+        throttle(base_url)
+        with timings.step("home"):
+            driver.get(base_url)
+            search_box = WebDriverWait(driver, TIMEOUT_HOME).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='search']"))
+            )
+        throttle(base_url)
+        with timings.step("results"):
+            search_box.clear()
+            search_box.send_keys(search_term)
+            search_box.send_keys(Keys.RETURN)
+            # La navegación terminó cuando la caja de búsqueda anterior ya no existe
+            WebDriverWait(driver, TIMEOUT_RESULTS).until(EC.staleness_of(search_box))
+            WebDriverWait(driver, TIMEOUT_RESULTS).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, RESULTS_SELECTOR))
+            )
     except Exception as e:
         print(f"Error al buscar: {e}")
-        driver.get(f"https://www.ebay.com/sch/i.html?_nkw={search_term}")
-        time.sleep(5)
+        throttle(base_url)
+        with timings.step("results_fallback"):
+            driver.get(f"{base_url}/sch/i.html?_nkw={quote_plus(search_term)}")
+            WebDriverWait(driver, TIMEOUT_RESULTS).until(document_ready)
+
+def wait_for_product(driver):
+    """Espera a que aparezca el título o el precio que usa el procesador."""
+    try:
+        WebDriverWait(driver, TIMEOUT_PRODUCT).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, PRODUCT_READY_SELECTOR))
+        )
+    except TimeoutException:
+        print(f"El producto no mostró título ni precio en {TIMEOUT_PRODUCT}s, se guarda lo cargado")
 
-def select_random_product(driver):
+def open_product(driver, product_url):
+    """Abre directamente un producto cuya URL ya se conoce."""
+    throttle(product_url)
+    with timings.step("product"):
+        driver.get(product_url)
+        wait_for_product(driver)
+
+def choose_product(urls, frontier=None):
+    """Elige un producto de los resultados; con frontier prioriza los no visitados."""
+    if frontier is None:
+        return random.choice(urls[:10])
+    product_url = frontier.choose(urls)
+    if product_url is None:
+        raise SkipProduct("todos los productos de la búsqueda ya fueron visitados")
+    return product_url
+
+def select_random_product(driver, frontier=None):
     """Selecciona un producto aleatorio de la lista de búsqueda."""
     try:
-        product_links = WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "li.s-item a.s-item__link"))
+        product_links = WebDriverWait(driver, TIMEOUT_RESULTS).until(
+            EC.presence_of_all_elements_located((By.CSS_SELECTOR, RESULTS_SELECTOR))
         )
         if not product_links:
             raise Exception("No se encontraron productos")
-        random_product = random.choice(product_links[:10])
-        product_url = random_product.get_attribute('href')
+        if frontier is None:
+            random_product = random.choice(product_links[:10])
+            product_url = random_product.get_attribute('href')
+        else:
+            links_by_url = {}
+            for link in product_links:
+                links_by_url.setdefault(link.get_attribute('href'), link)
+            product_url = choose_product([url for url in links_by_url if url], frontier)
+            random_product = links_by_url[product_url]
         
         # Modificar el atributo target para que se abra en la misma ventana
         driver.execute_script("arguments[0].setAttribute('target', '_self');", random_product)
         
-        random_product.click()
-        time.sleep(5)
+        throttle(product_url or driver.current_url)
+        with timings.step("product"):
+            random_product.click()
+            try:
+                WebDriverWait(driver, TIMEOUT_PRODUCT).until(EC.staleness_of(random_product))
+            except TimeoutException:
+                pass
+            wait_for_product(driver)
         return product_url
+    except SkipProduct:
+        raise
     except Exception as e:
         print(f"Error al seleccionar producto: {e}")
         return None
@@ -76,52 +238,150 @@ def extract_html(driver):
     """Extrae el HTML de la página actual."""
     return driver.page_source
 
-def save_html_to_file(html_content, folder_name="PO/local_files"):
-    """Guarda el HTML en un archivo local."""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_name = f"ebay_product_{timestamp}.html"
-    os.makedirs(folder_name, exist_ok=True)
-    file_path = os.path.join(folder_name, file_name)
-    with open(file_path, "w", encoding="utf-8") as file:
-        file.write(html_content)
-    return file_path, file_name
-
-def upload_to_s3(file_path, file_name):
-    """Sube el archivo a S3."""
-    s3_client = boto3.client(
+@lru_cache(maxsize=1)
+def get_s3_client():
+    """Cliente de S3 compartido por todos los workers, con pool de conexiones."""
+    return boto3.client(
         "s3",
         aws_access_key_id=AWS_ACCESS_KEY,
         aws_secret_access_key=AWS_SECRET_KEY,
-        region_name="us-east-1"
+        region_name="us-east-1",
+        config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS)
     )
+
+def build_file_name(product_url=None):
+    """Nombre del archivo en S3.
+
+    Con la URL del producto se usa su id, así una nueva visita sobrescribe el mismo
+    objeto en lugar de crear un duplicado. Sin URL se usa la fecha con microsegundos
+    porque hay varios workers.
+    """
+    if product_url:
+        key = re.sub(r"[^A-Za-z0-9_-]+", "_", item_key(product_url)).strip("_")
+        return f"ebay_product_{key}.html"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return f"ebay_product_{timestamp}.html"
+
+def compress_html(html_content, compression=S3_COMPRESSION):
+    """Retorna el cuerpo a subir y el Content-Encoding correspondiente."""
+    body = html_content.encode("utf-8")
+    if compression == "gzip":
+        # mtime=0: el mismo HTML da los mismos bytes (y el mismo MD5) en cada re-scrape
+        return gzip.compress(body, compresslevel=6, mtime=0), "gzip"
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("SCRAPER_COMPRESSION=zstd requiere la librería zstandard")
+        return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    return body, None
+
+def upload_to_s3(html_content, file_name):
+    """Sube el HTML a S3 directamente desde memoria."""
+    body, content_encoding = compress_html(html_content)
+    extra = {"ContentEncoding": content_encoding} if content_encoding else {}
     s3_key = f"2023395931/{file_name}"
-    s3_client.upload_file(file_path, BUCKET_NAME, s3_key)
+    get_s3_client().put_object(
+        Bucket=BUCKET_NAME,
+        Key=s3_key,
+        Body=body,
+        ContentType="text/html; charset=utf-8",
+        **extra
+    )
     return s3_key
 
-def main():
-    """Ejecuta el flujo completo: búsqueda, extracción y carga en S3."""
+def fetch_with_http(fetcher, search_term, base_url=BASE_URL, frontier=None):
+    """Nivel HTTP: resultados y producto sin navegador.
+
+    Retorna (html, url_del_producto); html es None si hay que escalar al navegador.
+    """
+    with timings.step("http_results"):
+        links = fetcher.search_results(base_url, search_term)
+    if not links:
+        return None, None
+    product_url = choose_product(links, frontier)
+    with timings.step("http_product"):
+        html_content = fetcher.product_page(product_url)
+    return html_content, product_url
+
+def fetch_with_browser(pool, search_term, base_url=BASE_URL, product_url=None, frontier=None):
+    """Nivel navegador: se usa cuando la página obtenida por HTTP no fue válida."""
+    with pool.session() as driver:
+        if product_url:
+            open_product(driver, product_url)
+        else:
+            search_product(driver, search_term, base_url)
+            product_url = select_random_product(driver, frontier)
+        html_content = extract_html(driver)
+        weight = page_weight(driver)
+    if weight:
+        timings.increment("browser_page_bytes", weight)
+        timings.increment("browser_pages_measured")
+        print(f"Peso de la página: {weight / 1024:.0f} KB")
+    if is_blocked(html_content):
+        rate_limiter.penalize(product_url or base_url)
+        raise Exception("El sitio respondió con una página de bloqueo")
+    rate_limiter.succeed(product_url or base_url)
+    return html_content, product_url
+
+def scrape_product(pool, search_term, base_url=BASE_URL, fetcher=None, frontier=None):
+    """Busca un término, obtiene un producto y sube su HTML a S3.
+
+    Con frontier se evitan los productos visitados dentro del TTL; si la búsqueda
+    no tiene productos nuevos se lanza SkipProduct.
+    """
+    print(f"Búsqueda seleccionada: {search_term}")
+    timings.reset_last()
+    html_content, product_url, tier = None, None, "http"
+    try:
+        if fetcher is not None:
+            html_content, product_url = fetch_with_http(fetcher, search_term, base_url, frontier)
+        if html_content is None:
+            tier = "browser"
+            html_content, product_url = fetch_with_browser(pool, search_term, base_url, product_url, frontier)
+        if product_url:
+            print(f"Producto seleccionado ({tier}): {product_url}")
+        file_name = build_file_name(product_url)
+        with timings.step("upload"):
+            s3_key = upload_to_s3(html_content, file_name)
+    except SkipProduct:
+        timings.increment("skipped_seen")
+        raise
+    except Exception:
+        if frontier is not None and product_url:
+            frontier.release(product_url)
+        raise
+    if frontier is not None and product_url:
+        frontier.mark(product_url)
+    print(f"Subido a S3: s3://{BUCKET_NAME}/{s3_key}")
+    timings.increment(f"tier_{tier}")
+    print(f"Tiempos: {timings.format_last()}")
+    return s3_key
+
+def parse_args(argv=None):
+    """Parámetros del modo batch; cada uno puede venir también de una variable de entorno."""
+    parser = argparse.ArgumentParser(description="Scraper de productos de eBay")
+    parser.add_argument("--batch", action="store_true",
+                        default=os.getenv("SCRAPER_BATCH", "false").lower() == "true",
+                        help="Ejecuta sin interacción con varios navegadores en paralelo")
+    parser.add_argument("--terms", default=os.getenv("SCRAPER_TERMS", ",".join(SEARCH_TERMS)),
+                        help="Términos de búsqueda separados por coma")
+    parser.add_argument("--products", type=int, default=int(os.getenv("SCRAPER_PRODUCTS", "0")),
+                        help="Cantidad de productos a extraer (0 = sin límite)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("SCRAPER_CONCURRENCY", "2")),
+                        help="Cantidad de navegadores en paralelo")
+    parser.add_argument("--duration", type=int, default=int(os.getenv("SCRAPER_DURATION", "0")),
+                        help="Duración máxima en segundos (0 = sin límite)")
+    parser.add_argument("--base-url", default=BASE_URL, help="URL base del sitio a recorrer")
+    return parser.parse_args(argv)
+
+def run_interactive(pool, base_url=BASE_URL, fetcher=None, frontier=None):
+    """Modo original: un producto por iteración, preguntando si continuar."""
     while True:
-        driver = configure_selenium()
-        file_path = None
         try:
-            random_search = random.choice(SEARCH_TERMS)
-            print(f"Búsqueda seleccionada: {random_search}")
-            search_product(driver, random_search)
-            product_url = select_random_product(driver)
-            if product_url:
-                print(f"Producto seleccionado: {product_url}")
-            html_content = extract_html(driver)
-            file_path, file_name = save_html_to_file(html_content)
-            print(f"Archivo guardado: {file_name}")
-            s3_key = upload_to_s3(file_path, file_name)
-            print(f"Subido a S3: s3://{BUCKET_NAME}/{s3_key}")
+            scrape_product(pool, random.choice(SEARCH_TERMS), base_url, fetcher, frontier)
+        except SkipProduct as e:
+            print(f"Sin productos nuevos: {e}")
         except Exception as e:
             print(f"Error: {e}")
-        finally:
-            driver.quit()
-            if file_path and "unittest" not in sys.modules:
-                os.remove(file_path)
-                print(f"Archivo eliminado: {file_name}")
 
         # Preguntar al usuario si desea realizar otro proceso
         continuar = input("¿Desea realizar otro proceso? (s/n): ").strip().lower()
@@ -129,5 +389,39 @@ def main():
             print("Proceso terminado.")
             break
 
+def main(argv=None):
+    """Ejecuta el flujo completo: búsqueda, extracción y carga en S3."""
+    args = parse_args(argv)
+    get_driver_path()
+    fetcher = HttpFetcher(USER_AGENT, pool_size=max(args.concurrency, 1), limiter=rate_limiter) if HTTP_FAST_PATH else None
+    frontier = CrawlFrontier()
+    if args.batch:
+        pool = BrowserPool(configure_selenium, size=args.concurrency)
+        terms = [term.strip() for term in args.terms.split(",") if term.strip()]
+        random.shuffle(terms)
+        try:
+            run_batch(
+                lambda term: scrape_product(pool, term, args.base_url, fetcher, frontier),
+                terms, target=args.products, concurrency=args.concurrency, duration=args.duration
+            )
+        finally:
+            pool.close()
+            frontier.save()
+        for step, stats in timings.summary().items():
+            print(f"[batch] {step}: {stats['count']} veces, promedio {stats['avg_seconds']}s, máximo {stats['max_seconds']}s")
+        counters = timings.counters()
+        for name, count in counters.items():
+            print(f"[batch] {name}: {count}")
+        if counters.get("browser_pages_measured"):
+            average = counters["browser_page_bytes"] / counters["browser_pages_measured"] / 1024
+            print(f"[batch] Peso promedio por página en el navegador: {average:.0f} KB")
+    else:
+        pool = BrowserPool(configure_selenium)
+        try:
+            run_interactive(pool, args.base_url, fetcher, frontier)
+        finally:
+            pool.close()
+            frontier.save()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
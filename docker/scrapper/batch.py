@@ -0,0 +1,123 @@
+import time
+import queue
+import threading
+
+
+class SkipProduct(Exception):
+    """El término no tiene productos nuevos; el intento no cuenta como error."""
+
+
+class BatchStats:
+    """Contadores compartidos por los workers del modo batch."""
+
+    def __init__(self, target):
+        self.target = target
+        self.claimed = 0
+        self.products = 0
+        self.errors = 0
+        self.skipped = 0
+        # Intentos seguidos sin productos nuevos
+        self.consecutive_skips = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def claim(self):
+        """Reserva un producto del objetivo; False si ya se alcanzó."""
+        with self._lock:
+            if self.target and self.claimed >= self.target:
+                return False
+            self.claimed += 1
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.products += 1
+                self.consecutive_skips = 0
+            else:
+                self.errors += 1
+                # El intento fallido no cuenta para el objetivo
+                self.claimed -= 1
+
+    def skip(self):
+        """Intento sin producto nuevo (todos ya visitados); no cuenta como error."""
+        with self._lock:
+            self.skipped += 1
+            self.consecutive_skips += 1
+            self.claimed -= 1
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "products": self.products,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 2),
+            "products_per_minute": round(self.products * 60 / elapsed, 2) if elapsed else 0.0
+        }
+
+
+def run_batch(scrape, search_terms, target=0, concurrency=1, duration=0, max_errors=50):
+    """Ejecuta `scrape(termino)` en paralelo hasta llegar al objetivo o al tiempo límite.
+
+    Cada worker toma un término de la cola compartida y lo devuelve al final para
+    que los términos se repartan de forma circular. target=0 o duration=0 desactivan
+    el límite correspondiente. Si `scrape` lanza SkipProduct el intento se cuenta
+    como omitido y no como error.
+    """
+    if not target and not duration:
+        raise ValueError("El modo batch necesita un objetivo de productos o una duración")
+
+    stats = BatchStats(target)
+    if not search_terms:
+        # Sin términos los workers esperarían para siempre en la cola
+        print("[batch] Sin términos de búsqueda, no hay nada que ejecutar")
+        return stats.report()
+
+    terms = queue.Queue()
+    for term in search_terms:
+        terms.put(term)
+
+    deadline = stats.started + duration if duration else None
+    stop = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            if deadline and time.monotonic() >= deadline:
+                break
+            if not stats.claim():
+                break
+            term = terms.get()
+            ok = False
+            skipped = False
+            try:
+                scrape(term)
+                ok = True
+            except SkipProduct as e:
+                skipped = True
+                print(f"[batch] Omitido '{term}': {e}")
+            except Exception as e:
+                print(f"[batch] Error con '{term}': {e}")
+            finally:
+                terms.put(term)
+                if skipped:
+                    stats.skip()
+                else:
+                    stats.record(ok)
+            if stats.errors >= max_errors:
+                print("[batch] Demasiados errores, deteniendo workers")
+                stop.set()
+            if stats.consecutive_skips >= max_errors:
+                print("[batch] No quedan productos nuevos, deteniendo workers")
+                stop.set()
+
+    threads = [threading.Thread(target=worker, name=f"scraper-{i}") for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report = stats.report()
+    print(f"[batch] Productos: {report['products']} - Errores: {report['errors']} - Omitidos: {report['skipped']} - "
+          f"Tiempo: {report['elapsed_seconds']}s - Throughput: {report['products_per_minute']} productos/min")
+    return report
@@ -0,0 +1,83 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from selenium.common.exceptions import WebDriverException
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+# Cantidad de páginas tras la cual se recicla el navegador para evitar fugas de memoria
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "50"))
+
+
+class BrowserPool:
+    """Pool de sesiones de navegador reutilizadas entre productos."""
+
+    def __init__(self, factory, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES):
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self._idle = queue.LifoQueue()
+        self._pages = {}
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Entrega un navegador libre, creando uno nuevo si el pool no está lleno."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        self._pages[id(driver)] = 0
+        return driver
+
+    def release(self, driver, broken=False):
+        """Devuelve el navegador al pool o lo cierra si falló o alcanzó el límite de páginas."""
+        pages = self._pages.get(id(driver), 0) + 1
+        self._pages[id(driver)] = pages
+        if broken or pages >= self.max_pages:
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+
+    def _discard(self, driver):
+        self._pages.pop(id(driver), None)
+        with self._lock:
+            self._created -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error al cerrar el navegador: {e}")
+
+    @contextmanager
+    def session(self):
+        """Uso: with pool.session() as driver: ..."""
+        driver = self.acquire()
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            # El navegador se cayó o la sesión quedó inválida: se reemplaza
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken)
+
+    def close(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
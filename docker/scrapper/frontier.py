@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import math
+import time
+import base64
+import random
+import hashlib
+import threading
+from urllib.parse import urlsplit
+
+FRONTIER_PATH = os.getenv("SCRAPER_FRONTIER_PATH", "PO/frontier.json")
+FRONTIER_CAPACITY = int(os.getenv("SCRAPER_FRONTIER_CAPACITY", "100000"))
+FRONTIER_ERROR_RATE = float(os.getenv("SCRAPER_FRONTIER_ERROR_RATE", "0.01"))
+# Tiempo tras el cual un producto visitado se puede volver a visitar
+REVISIT_TTL = int(os.getenv("SCRAPER_REVISIT_TTL", str(7 * 24 * 3600)))
+FRONTIER_GENERATIONS = 4
+FRONTIER_SAVE_EVERY = 20
+
+ITEM_ID_PATTERNS = [
+    re.compile(r'/itm/(?:[^/?#]+/)?(\d{9,})'),   # eBay
+    re.compile(r'/(?:dp|gp/product)/([A-Z0-9]{10})'),  # Amazon
+]
+
+
+def item_key(url):
+    """Identificador estable del producto: id del artículo o la URL sin query."""
+    for pattern in ITEM_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    parts = urlsplit(url)
+    return f"{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
+class BloomFilter:
+    """Filtro de Bloom simple sobre un bytearray con doble hashing."""
+
+    def __init__(self, size_bits, hashes, bits=None):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        size_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        hashes = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, hashes)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class CrawlFrontier:
+    """Registro persistente de productos visitados con expiración (TTL).
+
+    Usa varias generaciones de filtros de Bloom; cada una cubre TTL/N segundos y
+    la más antigua se descarta al rotar, así un producto vuelve a ser elegible
+    después de aproximadamente el TTL.
+    """
+
+    def __init__(self, path=FRONTIER_PATH, capacity=FRONTIER_CAPACITY, error_rate=FRONTIER_ERROR_RATE,
+                 ttl=REVISIT_TTL, generations=FRONTIER_GENERATIONS, clock=time.time):
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.generation_span = ttl / generations
+        self.max_generations = generations
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Productos elegidos por algún worker que todavía no terminan
+        self._in_flight = set()
+        self.generations = []
+        if path and os.path.exists(path):
+            self._load()
+        self._rotate()
+
+    def _new_generation(self, started):
+        return {"started": started, "filter": BloomFilter.for_capacity(self.capacity, self.error_rate)}
+
+    def _rotate(self):
+        now = self.clock()
+        ttl = self.generation_span * self.max_generations
+        self.generations = [generation for generation in self.generations if now - generation["started"] < ttl]
+        if not self.generations or now - self.generations[-1]["started"] >= self.generation_span:
+            self.generations.append(self._new_generation(now))
+        self.generations = self.generations[-self.max_generations:]
+
+    def _seen(self, key):
+        return key in self._in_flight or any(key in generation["filter"] for generation in self.generations)
+
+    def seen(self, url):
+        with self._lock:
+            self._rotate()
+            return self._seen(item_key(url))
+
+    def mark(self, url):
+        """Registra el producto como visitado tras subirlo."""
+        key = item_key(url)
+        with self._lock:
+            self._rotate()
+            self._in_flight.discard(key)
+            self.generations[-1]["filter"].add(key)
+            self._pending += 1
+            if self.path and self._pending >= FRONTIER_SAVE_EVERY:
+                self._save()
+
+    def release(self, url):
+        """Libera un producto elegido que no se pudo extraer."""
+        with self._lock:
+            self._in_flight.discard(item_key(url))
+
+    def choose(self, urls):
+        """Elige al azar un producto no visitado y lo reserva; None si todos se visitaron."""
+        with self._lock:
+            self._rotate()
+            unseen = [url for url in dict.fromkeys(urls) if not self._seen(item_key(url))]
+            if not unseen:
+                return None
+            url = random.choice(unseen)
+            self._in_flight.add(item_key(url))
+            return url
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            self.generations = [
+                {
+                    "started": generation["started"],
+                    "filter": BloomFilter(generation["size_bits"], generation["hashes"],
+                                          bytearray(base64.b64decode(generation["bits"])))
+                }
+                for generation in data["generations"]
+            ]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[frontier] No se pudo cargar {self.path}, se inicia vacío: {e}")
+            self.generations = []
+
+    def _save(self):
+        data = {"generations": [
+            {
+                "started": generation["started"],
+                "size_bits": generation["filter"].size_bits,
+                "hashes": generation["filter"].hashes,
+                "bits": base64.b64encode(bytes(generation["filter"].bits)).decode("ascii")
+            }
+            for generation in self.generations
+        ]}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.path)
+        self._pending = 0
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            self._save()
@@ -0,0 +1,96 @@
+import os
+import re
+import requests
+from urllib.parse import urljoin, quote_plus
+from requests.adapters import HTTPAdapter
+
+HTTP_TIMEOUT = int(os.getenv("SCRAPER_HTTP_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("SCRAPER_HTTP_POOL_SIZE", "10"))
+
+# Marcadores que debe tener una página de producto válida: al menos uno de cada grupo.
+# Corresponden a los selectores de título y precio que usa el procesador.
+TITLE_MARKERS = ["x-item-title__mainTitle", 'id="itemTitle"', '"@type":"Product"', '"@type": "Product"']
+PRICE_MARKERS = ["x-price-primary", 'id="prcIsum"', 'itemprop="price"', '"priceCurrency"']
+# Páginas de bloqueo que se deben tratar como fallidas
+BLOCK_MARKERS = ["Pardon Our Interruption", "/splashui/captcha", "g-recaptcha"]
+
+ANCHOR_PATTERN = re.compile(r'<a\b[^>]*>', re.IGNORECASE)
+CLASS_PATTERN = re.compile(r'\bclass\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+HREF_PATTERN = re.compile(r'\bhref\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def is_blocked(html_content):
+    """Detecta las páginas de bloqueo o captcha del sitio."""
+    return any(marker in html_content for marker in BLOCK_MARKERS)
+
+
+class HttpFetcher:
+    """Primer nivel de descarga: HTTP simple con conexiones reutilizadas."""
+
+    def __init__(self, user_agent, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, limiter=None):
+        self.timeout = timeout
+        self.limiter = limiter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": user_agent,
+            "Accept": "text/html,application/xhtml+xml",
+            "Accept-Language": "en-US,en;q=0.9"
+        })
+        self.last_status = None
+
+    def get(self, url):
+        """Retorna el HTML o None si la respuesta no es 200 o es una página de bloqueo."""
+        if self.limiter is not None:
+            self.limiter.acquire(url)
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"[http] Error al descargar {url}: {e}")
+            self.last_status = None
+            return None
+        self.last_status = response.status_code
+        if response.status_code == 429:
+            self._penalize(url)
+            return None
+        if response.status_code != 200:
+            return None
+        html_content = response.text
+        if is_blocked(html_content):
+            self.last_status = "blocked"
+            self._penalize(url)
+            return None
+        if self.limiter is not None:
+            self.limiter.succeed(url)
+        return html_content
+
+    def _penalize(self, url):
+        if self.limiter is not None:
+            self.limiter.penalize(url)
+
+    @staticmethod
+    def is_valid_product_page(html_content):
+        return (any(marker in html_content for marker in TITLE_MARKERS)
+                and any(marker in html_content for marker in PRICE_MARKERS))
+
+    def search_results(self, base_url, search_term, link_class="s-item__link"):
+        """Enlaces a productos de la página de resultados, sin navegador."""
+        html_content = self.get(f"{base_url}/sch/i.html?_nkw={quote_plus(search_term)}")
+        if not html_content:
+            return []
+        links = []
+        for anchor in ANCHOR_PATTERN.findall(html_content):
+            class_match = CLASS_PATTERN.search(anchor)
+            href_match = HREF_PATTERN.search(anchor)
+            if class_match and href_match and link_class in class_match.group(1).split():
+                links.append(urljoin(base_url + "/", href_match.group(1)))
+        return links
+
+    def product_page(self, url):
+        """HTML del producto solo si contiene los marcadores esperados."""
+        html_content = self.get(url)
+        if html_content and self.is_valid_product_page(html_content):
+            return html_content
+        return None
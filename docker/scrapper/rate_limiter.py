@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Solicitudes por segundo permitidas por dominio (0 = sin límite)
+RATE = float(os.getenv("SCRAPER_RATE", "1.0"))
+RATE_MIN = float(os.getenv("SCRAPER_RATE_MIN", "0.1"))
+# Aumento de la tasa por cada respuesta correcta después de un bloqueo
+RATE_STEP = float(os.getenv("SCRAPER_RATE_STEP", "0.05"))
+BURST = int(os.getenv("SCRAPER_BURST", "3"))
+BACKOFF_BASE = float(os.getenv("SCRAPER_BACKOFF_BASE", "5"))
+BACKOFF_MAX = float(os.getenv("SCRAPER_BACKOFF_MAX", "300"))
+# Archivo compartido entre pods (por ejemplo en un volumen común); vacío = solo en memoria
+RATE_STORE = os.getenv("SCRAPER_RATE_STORE", "")
+
+
+def domain_of(url):
+    host = urlsplit(url).hostname or url
+    host = host.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class MemoryBucketStore:
+    """Estado de los buckets compartido por los workers de un mismo proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    @contextmanager
+    def domain(self, name):
+        with self._lock:
+            yield self._state.setdefault(name, {})
+
+
+class FileBucketStore:
+    """Estado de los buckets en un archivo JSON con bloqueo, compartido entre pods."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @contextmanager
+    def domain(self, name):
+        with self._lock, open(self.path, "a+", encoding="utf-8") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                content = file.read()
+                try:
+                    data = json.loads(content) if content else {}
+                except ValueError:
+                    data = {}
+                state = data.setdefault(name, {})
+                yield state
+                file.seek(0)
+                file.truncate()
+                json.dump(data, file)
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+class DomainRateLimiter:
+    """Token bucket por dominio con backoff ante 429 o captcha.
+
+    Cada bloqueo pausa el dominio (backoff exponencial) y reduce la tasa a la
+    mitad; cada respuesta correcta la recupera de a poco hasta `rate`, así el
+    scraper se mantiene cerca de la tasa máxima que el sitio tolera.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, min_rate=RATE_MIN, rate_step=RATE_STEP,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, store=None,
+                 clock=time.time, sleep=time.sleep):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.min_rate = min(min_rate, rate) if rate > 0 else 0
+        self.rate_step = rate_step
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        if store is None:
+            store = FileBucketStore(RATE_STORE) if RATE_STORE else MemoryBucketStore()
+        self.store = store
+        self.clock = clock
+        self.sleep = sleep
+
+    def _defaults(self, state, now):
+        state.setdefault("tokens", float(self.burst))
+        state.setdefault("updated", now)
+        state.setdefault("rate", self.rate)
+        state.setdefault("cooldown_until", 0.0)
+        state.setdefault("failures", 0)
+
+    def _try_take(self, domain):
+        """Toma un token; retorna 0 o los segundos que hay que esperar."""
+        now = self.clock()
+        with self.store.domain(domain) as state:
+            self._defaults(state, now)
+            if now < state["cooldown_until"]:
+                return state["cooldown_until"] - now
+            elapsed = max(now - state["updated"], 0)
+            state["tokens"] = min(self.burst, state["tokens"] + elapsed * state["rate"])
+            state["updated"] = now
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0
+            return (1 - state["tokens"]) / state["rate"]
+
+    def acquire(self, url):
+        """Bloquea hasta que el dominio permita otra solicitud; retorna los segundos esperados."""
+        if self.rate <= 0:
+            return 0.0
+        domain = domain_of(url)
+        waited = 0.0
+        while True:
+            wait = self._try_take(domain)
+            if wait <= 0:
+                return waited
+            self.sleep(wait)
+            waited += wait
+
+    def penalize(self, url):
+        """El sitio respondió 429 o una página de captcha."""
+        if self.rate <= 0:
+            return
+        domain = domain_of(url)
+        now = self.clock()
+        with self.store.domain(domain) as state:
+            self._defaults(state, now)
+            state["failures"] += 1
+            cooldown = min(self.backoff_max, self.backoff_base * 2 ** (state["failures"] - 1))
+            state["cooldown_until"] = now + cooldown
+            state["rate"] = max(self.min_rate, state["rate"] / 2)
+            state["tokens"] = 0.0
+            state["updated"] = now + cooldown
+        print(f"[rate] {domain} bloqueado, pausa de {cooldown:.0f}s y tasa {state['rate']:.2f}/s")
+
+    def succeed(self, url):
+        """Respuesta correcta: se recupera la tasa gradualmente."""
+        if self.rate <= 0:
+            return
+        domain = domain_of(url)
+        with self.store.domain(domain) as state:
+            self._defaults(state, self.clock())
+            state["failures"] = 0
+            state["rate"] = min(self.rate, state["rate"] + self.rate_step)
+
+    def current_rate(self, url):
+        with self.store.domain(domain_of(url)) as state:
+            return state.get("rate", self.rate)
@@ -0,0 +1,62 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StepTimings:
+    """Acumula la duración de cada paso del scraper (compartido entre workers)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._steps = {}
+        self._counters = {}
+        self._local = threading.local()
+
+    def record(self, step, seconds):
+        with self._lock:
+            stats = self._steps.setdefault(step, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+        self.last[step] = seconds
+
+    def increment(self, name, amount=1):
+        """Cuenta eventos sin duración, por ejemplo el nivel de descarga usado o los bytes descargados."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    @property
+    def last(self):
+        """Duraciones del producto actual en este hilo."""
+        if not hasattr(self._local, "last"):
+            self._local.last = {}
+        return self._local.last
+
+    def reset_last(self):
+        self._local.last = {}
+
+    @contextmanager
+    def step(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started)
+
+    def format_last(self):
+        return " ".join(f"{step}={seconds:.2f}s" for step, seconds in self.last.items())
+
+    def summary(self):
+        with self._lock:
+            return {
+                step: {
+                    "count": stats["count"],
+                    "avg_seconds": round(stats["total"] / stats["count"], 3),
+                    "max_seconds": round(stats["max"], 3)
+                }
+                for step, stats in self._steps.items()
+            }
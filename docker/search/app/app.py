@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import base64
+import signal
+import logging
+import threading
+from dataclasses import dataclass
+from functools import partial
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from prometheus_client import Histogram
+from pipeline.config import load_config
+from pipeline.clients import get_elasticsearch, get_amqp_connection
+from pipeline.messages import decode_message, MessageError, DOCUMENT_PROCESSED
+from pipeline import metrics
+from query_cache import QueryCache
+
+# Configuración de logging
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('search')
+SERVICE = 'search'
+metrics.configure(SERVICE)
+
+config = load_config()
+SEARCH_PORT = int(os.getenv('SEARCH_PORT', '8080'))
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1024'))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '30'))
+# Segundos hasta que una escritura es visible (refresh_interval del índice)
+SEARCH_CACHE_SETTLE = float(os.getenv('SEARCH_CACHE_SETTLE', '1'))
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv('SEARCH_MAX_PAGE_SIZE', '100'))
+
+# Campos devueltos en cada resultado (la descripción y los hashes no viajan)
+SOURCE_FIELDS = ['product_name', 'title', 'price', 'price_value', 'currency', 'categories', 'images',
+                 'site_profile']
+TEXT_FIELDS = ['product_name^3', 'title^2', 'description']
+# Un cambio en estos campos puede sumar o quitar el documento de cualquier consulta
+SEARCHABLE_FIELDS = frozenset(['title', 'product_name', 'description', 'categories', 'price_value', 'currency',
+                               'site_profile', 'document_id'])
+# document_id es único: desempata los resultados para que search_after no salte ni repita
+TIEBREAKER = {'document_id': {'order': 'asc', 'unmapped_type': 'keyword'}}
+SORTS = {
+    'relevance': [{'_score': 'desc'}, TIEBREAKER],
+    'price_asc': [{'price_value': {'order': 'asc', 'missing': '_last'}}, TIEBREAKER],
+    'price_desc': [{'price_value': {'order': 'desc', 'missing': '_last'}}, TIEBREAKER],
+}
+# Parámetro obligatorio de cada endpoint
+ENDPOINTS = {
+    'search': 'q',
+    'category': 'category',
+    'price': 'min|max',
+}
+
+SEARCH_SECONDS = Histogram(
+    'search_request_seconds', 'Duración de cada búsqueda por endpoint y resultado de la caché',
+    ['endpoint', 'cache'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+
+class SearchError(ValueError):
+    """Parámetros de búsqueda inválidos (respuesta 400)."""
+
+
+def encode_cursor(sort_values):
+    return base64.urlsafe_b64encode(json.dumps(sort_values, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise SearchError(f"Cursor inválido: {e}") from e
+    if not isinstance(values, list):
+        raise SearchError("Cursor inválido")
+    return values
+
+
+def _number(params, name):
+    value = params.get(name, [None])[-1]
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise SearchError(f"{name} debe ser numérico")
+
+
+@dataclass(frozen=True)
+class Query:
+    """Consulta normalizada; es también la clave de la caché"""
+    q: str = None
+    categories: tuple = ()
+    min_price: float = None
+    max_price: float = None
+    sort: str = 'relevance'
+    size: int = SEARCH_PAGE_SIZE
+    after: str = None
+
+    @classmethod
+    def from_params(cls, endpoint, params):
+        """`params` es el resultado de parse_qs; `endpoint` define el parámetro obligatorio"""
+        q = ' '.join(params.get('q', [''])[-1].split()).lower() or None
+        categories = tuple(sorted({category.strip() for category in params.get('category', []) if category.strip()}))
+        min_price, max_price = _number(params, 'min'), _number(params, 'max')
+        if endpoint == 'search' and not q:
+            raise SearchError("El parámetro q es obligatorio")
+        if endpoint == 'category' and not categories:
+            raise SearchError("El parámetro category es obligatorio")
+        if endpoint == 'price' and min_price is None and max_price is None:
+            raise SearchError("Se requiere min o max")
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise SearchError("min no puede ser mayor que max")
+
+        sort = params.get('sort', ['relevance' if q else 'price_asc'])[-1]
+        if sort not in SORTS:
+            raise SearchError(f"sort debe ser uno de {sorted(SORTS)}")
+        try:
+            size = int(params.get('size', [SEARCH_PAGE_SIZE])[-1])
+        except ValueError:
+            raise SearchError("size debe ser entero")
+        after = params.get('after', [None])[-1] or None
+        if after:
+            decode_cursor(after)
+        return cls(q, categories, min_price, max_price, sort, min(max(size, 1), SEARCH_MAX_PAGE_SIZE), after)
+
+    def request(self):
+        """Argumentos de Elasticsearch.search para esta página"""
+        filters = []
+        if self.categories:
+            filters.append({'terms': {'categories': list(self.categories)}})
+        if self.min_price is not None or self.max_price is not None:
+            bounds = {}
+            if self.min_price is not None:
+                bounds['gte'] = self.min_price
+            if self.max_price is not None:
+                bounds['lte'] = self.max_price
+            filters.append({'range': {'price_value': bounds}})
+        must = [{'multi_match': {'query': self.q, 'fields': TEXT_FIELDS}}] if self.q else [{'match_all': {}}]
+        request = {
+            'query': {'bool': {'must': must, 'filter': filters}},
+            'sort': SORTS[self.sort],
+            'size': self.size,
+            'source_includes': SOURCE_FIELDS,
+        }
+        if self.after:
+            # Paginación con search_after en lugar de from/size: cada página cuesta
+            # lo mismo sin importar qué tan profunda sea
+            request['search_after'] = decode_cursor(self.after)
+        return request
+
+
+class SearchService:
+    """Búsquedas sobre el índice de documentos procesados con caché de resultados"""
+
+    def __init__(self, es, index, cache):
+        self.es = es
+        self.index = index
+        self.cache = cache
+
+    def search(self, endpoint, params):
+        """Retorna (cuerpo JSON en bytes, 'hit' o 'miss')"""
+        query = Query.from_params(endpoint, params)
+        body = self.cache.get(query)
+        if body is not None:
+            return body, 'hit'
+
+        version = self.cache.version
+        with metrics.stage('es_search'):
+            response = self.es.search(index=self.index, **query.request())
+        hits = response['hits']['hits']
+        next_cursor = encode_cursor(hits[-1]['sort']) if len(hits) == query.size else None
+        body = json.dumps({
+            'total': response['hits']['total']['value'],
+            'hits': [{'id': hit['_id'], **hit.get('_source', {})} for hit in hits],
+            'next': next_cursor,
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.cache.put(query, body, [hit['_id'] for hit in hits], version=version)
+        return body, 'miss'
+
+
+def apply_write_event(cache, message):
+    """Invalida la caché según los campos que escribió el procesador"""
+    fields = set(message.get('fields') or ())
+    if not fields or fields & SEARCHABLE_FIELDS:
+        # El documento puede entrar o salir de cualquier consulta
+        cache.clear()
+    else:
+        # Solo cambió lo que se muestra: basta con las páginas que lo contienen
+        cache.invalidate_documents([str(message['document_id'])])
+
+
+def on_write_event(cache, channel, method, properties, body):
+    try:
+        apply_write_event(cache, decode_message(body, properties, DOCUMENT_PROCESSED))
+    except (MessageError, KeyError) as e:
+        logger.error(f"Evento de escritura inválido, se vacía la caché: {e}")
+        cache.clear()
+
+
+def consume_write_events(cache, exchange, stopped, reconnect_delay=5):
+    """Hilo que escucha las escrituras del procesador en una cola exclusiva de esta réplica"""
+    while not stopped.is_set():
+        connection = None
+        try:
+            connection = get_amqp_connection()
+            channel = connection.channel()
+            channel.exchange_declare(exchange=exchange, exchange_type='fanout', durable=True)
+            queue = channel.queue_declare(queue='', exclusive=True, auto_delete=True).method.queue
+            channel.queue_bind(queue=queue, exchange=exchange)
+            # Los eventos de mientras no había conexión se perdieron
+            cache.clear()
+            channel.basic_consume(queue=queue, on_message_callback=partial(on_write_event, cache), auto_ack=True)
+            logger.info(f"Escuchando escrituras en el exchange {exchange}")
+            while not stopped.is_set():
+                connection.process_data_events(time_limit=1)
+        except Exception as e:
+            logger.error(f"Error en la conexión de eventos de escritura: {e}")
+            stopped.wait(reconnect_delay)
+        finally:
+            if connection is not None and connection.is_open:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    # Conexiones persistentes: un acierto de caché no paga el handshake TCP
+    protocol_version = 'HTTP/1.1'
+    service = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.strip('/')
+        if endpoint == 'health':
+            self._send(200, b'{"status":"ok"}')
+            return
+        if endpoint not in ENDPOINTS:
+            self._send(404, self._error(f"Endpoints disponibles: {sorted(ENDPOINTS)}"))
+            return
+
+        started = time.perf_counter()
+        cache = 'miss'
+        try:
+            body, cache = self.service.search(endpoint, parse_qs(url.query))
+            status = 200
+        except SearchError as e:
+            status, body = 400, self._error(str(e))
+        except Exception as e:
+            logger.error(f"Error en la búsqueda {self.path}: {e}")
+            status, body = 502, self._error("Error al consultar Elasticsearch")
+        SEARCH_SECONDS.labels(endpoint=endpoint, cache=cache).observe(time.perf_counter() - started)
+        self._send(status, body, cache)
+
+    @staticmethod
+    def _error(message):
+        return json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+
+    def _send(self, status, body, cache=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if cache:
+            self.send_header('X-Cache', cache)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(service, port=SEARCH_PORT, host='0.0.0.0'):
+    handler = type('Handler', (SearchHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    metrics.start_metrics_server()
+    cache = QueryCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_SETTLE)
+    service = SearchService(get_elasticsearch(), config.elasticsearch.index_dst, cache)
+    stopped = threading.Event()
+    if config.rabbitmq.events_exchange:
+        threading.Thread(target=consume_write_events, args=(cache, config.rabbitmq.events_exchange, stopped),
+                         name='write-events', daemon=True).start()
+    else:
+        logger.warning("Sin RABBITMQ_EVENTS_EXCHANGE la caché solo expira por TTL")
+
+    server = create_server(service)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    logger.info(f"Búsqueda sobre {service.index} en :{SEARCH_PORT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
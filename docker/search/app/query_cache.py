@@ -0,0 +1,130 @@
+import time
+import threading
+from collections import OrderedDict
+from prometheus_client import Counter, Gauge
+
+CACHE_REQUESTS = Counter('search_cache_requests_total', 'Consultas atendidas por resultado de la caché',
+                         ['result'])
+CACHE_INVALIDATIONS = Counter('search_cache_invalidations_total', 'Invalidaciones de la caché por tipo',
+                              ['kind'])
+CACHE_ENTRIES = Gauge('search_cache_entries', 'Resultados guardados en la caché')
+
+
+class QueryCache:
+    """Caché LRU con TTL de páginas de resultados ya serializadas.
+
+    Cada entrada recuerda los documentos que contiene para poder invalidar solo
+    las páginas afectadas por una escritura. `version` cambia con cada
+    invalidación: una consulta que empezó antes no guarda su resultado (podría
+    ser anterior a la escritura). `settle` es el refresh_interval de
+    Elasticsearch, lo que tarda una escritura en ser visible: durante ese tiempo
+    no se guardan páginas con los documentos invalidados, y tras clear() las
+    páginas que se guardan expiran al terminar la ventana en lugar de al TTL.
+    Con ingesta continua clear() recorre la caché como mucho una vez por
+    ventana y las demás llamadas solo la alargan: las consultas frecuentes se
+    siguen sirviendo desde la caché con un retraso acotado a `settle`.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0, settle=1.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.settle = settle
+        self.clock = clock
+        self.version = 0
+        self._entries = OrderedDict()
+        self._by_document = {}
+        self._unsettled_until = 0
+        self._cleared_at = None
+        self._settling = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                CACHE_REQUESTS.labels(result='miss').inc()
+                return None
+            expires_at, _, value = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                CACHE_REQUESTS.labels(result='expired').inc()
+                return None
+            self._entries.move_to_end(key)
+        CACHE_REQUESTS.labels(result='hit').inc()
+        return value
+
+    def put(self, key, value, document_ids=(), version=None):
+        """Guarda una página; `version` es la que tenía la caché al empezar la consulta"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return False
+            now = self.clock()
+            document_ids = frozenset(document_ids)
+            if any(self._settling.get(item, 0) > now for item in document_ids):
+                return False
+            expires_at = now + self.ttl
+            if now < self._unsettled_until:
+                # La página puede no incluir la última escritura todavía
+                expires_at = min(expires_at, self._unsettled_until)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, document_ids, value)
+            for document_id in document_ids:
+                self._by_document.setdefault(document_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            CACHE_ENTRIES.set(len(self._entries))
+            return True
+
+    def _remove(self, key):
+        _, document_ids, _ = self._entries.pop(key)
+        for document_id in document_ids:
+            keys = self._by_document.get(document_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[document_id]
+        CACHE_ENTRIES.set(len(self._entries))
+
+    def _invalidated(self, kind):
+        self.version += 1
+        CACHE_INVALIDATIONS.labels(kind=kind).inc()
+
+    def invalidate_documents(self, document_ids):
+        """Descarta las páginas que contienen alguno de los documentos; retorna cuántas"""
+        with self._lock:
+            keys = set()
+            for document_id in document_ids:
+                keys.update(self._by_document.get(document_id, ()))
+            for key in keys:
+                self._remove(key)
+            now = self.clock()
+            if len(self._settling) > self.max_entries:
+                self._settling = {item: until for item, until in self._settling.items() if until > now}
+            for document_id in document_ids:
+                self._settling[document_id] = now + self.settle
+            self._invalidated('documents')
+            return len(keys)
+
+    def clear(self):
+        """Descarta lo que podría seguir en caché después de que la escritura sea visible.
+
+        Retorna False si se agrupó con el vaciado anterior.
+        """
+        with self._lock:
+            now = self.clock()
+            self._unsettled_until = now + self.settle
+            if self._cleared_at is not None and now - self._cleared_at < self.settle:
+                # Lo guardado desde el último vaciado expira en menos de `settle` segundos
+                CACHE_INVALIDATIONS.labels(kind='coalesced').inc()
+                return False
+            self._cleared_at = now
+            # Las páginas guardadas durante la ventana anterior ya expiran antes que esta
+            for key in [key for key, (expires_at, _, _) in self._entries.items()
+                        if expires_at > self._unsettled_until]:
+                self._remove(key)
+            self._invalidated('all')
+            return True
@@ -0,0 +1,40 @@
+import unittest
+import os
+import sys
+
+# Añadir los benchmarks al path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import bench_parser
+
+
+class TestBenchParser(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.manifest = bench_parser.load_corpus()
+        cls.bench = bench_parser.ParserBench(cls.manifest)
+
+    def test_corpus_matches_golden(self):
+        print("[TEST] Probando que el parser mantiene los campos del corpus...")
+        self.assertEqual(bench_parser.main(['--iterations', '1']), 0)
+
+    def test_golden_detects_changes(self):
+        print("[TEST] Probando que un campo distinto se reporta...")
+        page = next(page for page in self.manifest['pages'] if page['name'] == 'ebay_small')
+        result, stats = self.bench.measure(page, 1)
+        self.assertEqual(bench_parser.check_golden(page, result, stats, self.manifest['version']), [])
+        result['price'] = 'US $0.00'
+        differences = bench_parser.check_golden(page, result, stats, self.manifest['version'])
+        self.assertEqual(len(differences), 1)
+        self.assertTrue(differences[0].startswith('price:'))
+
+    def test_extraction_paths(self):
+        print("[TEST] Probando el camino de extracción de cada página...")
+        paths = {page['name']: self.bench.measure(page, 1)[1]['path'] for page in self.manifest['pages']
+                 if page['name'] in ('ebay_jsonld', 'ebay_iframe', 'amazon')}
+        self.assertEqual(paths, {'ebay_jsonld': 'json-ld', 'ebay_iframe': 'dom+iframe', 'amazon': 'dom'})
+
+
+if __name__ == '__main__':
+    unittest.main()
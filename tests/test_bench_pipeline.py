@@ -0,0 +1,26 @@
+import unittest
+import os
+import sys
+import random
+
+# Añadir los benchmarks al path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import bench_pipeline
+
+
+class TestBenchPipeline(unittest.TestCase):
+
+    def test_pipeline_end_to_end(self):
+        print("[TEST] Probando el benchmark de extremo a extremo con pocos documentos...")
+        self.assertEqual(bench_pipeline.main(['--documents', '4', '--filler-kb', '1']), 0)
+
+    def test_synthetic_page_is_parsed(self):
+        print("[TEST] Probando que las páginas sintéticas usan el perfil de eBay...")
+        html = bench_pipeline.product_page(1, random.Random(0), structured=False, filler_kb=1)
+        self.assertIn('x-item-title__mainTitle', html)
+        self.assertIn('i.ebayimg.com', html)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ import sys
 import json
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'downloader', 'app')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'common')))
 
 from app import (
     download_file_from_s3, 
@@ -18,7 +19,7 @@ from app import (
 
 class TestMessageProcessor(unittest.TestCase):
 
-    @patch('app.boto3.client')
+    @patch('app.get_s3_client')
     def test_download_file_from_s3(self, mock_s3_client):
         print("Probando download_file_from_s3()...")
         mock_client = MagicMock()
@@ -32,7 +33,7 @@ class TestMessageProcessor(unittest.TestCase):
         self.assertEqual(result, expected_local_path)
         print(f"Archivo descargado desde S3 to path: {result}")
 
-    @patch('builtins.open', new_callable=mock_open, read_data="test file content")
+    @patch('builtins.open', new_callable=mock_open, read_data=b"test file content")
     def test_read_file_content(self, mock_file):
         print("Probando read_file_content()...")
 
@@ -41,11 +42,11 @@ class TestMessageProcessor(unittest.TestCase):
         
         result = read_file_content(local_file_path)
         
-        mock_file.assert_called_once_with(local_file_path, 'r', encoding='utf-8')
+        mock_file.assert_called_once_with(local_file_path, 'rb')
         self.assertEqual(result, expected_content)
         print(f"Lectura de archivo: {result}")
 
-    @patch('app.Elasticsearch')
+    @patch('app.get_elasticsearch')
     def test_store_document_in_elasticsearch(self, mock_es):
         print("Probando store_document_in_elasticsearch()...")
 
@@ -60,43 +61,54 @@ class TestMessageProcessor(unittest.TestCase):
         self.assertEqual(result, 'test_es_id_123')
         print(f"DDocumento almacenado en Elasticsearch con ID: {result}")
 
-    @patch('app.pymysql.connect')
-    def test_update_mariadb_status(self, mock_connect):
+    @patch('app.db_connection')
+    def test_update_mariadb_status(self, mock_db_connection):
         print("Probando update_mariadb_status()...")
 
-        mock_connection = MagicMock()
+        mock_connection = mock_db_connection.return_value.__enter__.return_value
         mock_cursor = MagicMock()
-        mock_connect.return_value = mock_connection
         mock_connection.cursor.return_value = mock_cursor
         file_name = "test_document.txt"
         
         update_mariadb_status(file_name)
         
-        mock_connect.assert_called_once()
+        mock_db_connection.assert_called_once()
         mock_cursor.execute.assert_called_once()
         mock_connection.commit.assert_called_once()
         mock_cursor.close.assert_called_once()
-        mock_connection.close.assert_called_once()
+        # La conexión vuelve al pool en lugar de cerrarse
+        mock_connection.close.assert_not_called()
         print(f"Actualización del estado en MariaDB al archivo: {file_name}")
 
-    @patch('app.channel')
-    def test_publish_message_to_rabbitmq(self, mock_channel):
+    def test_publish_message_to_rabbitmq(self):
         print("Probando publish_message_to_rabbitmq()...")
+        mock_channel = MagicMock()
 
         document_id = "doc123"
         es_id = "es456"
-        expected_message = json.dumps({
+        expected_message = {
             'document_id': document_id,
-            'elasticsearch_id': es_id
-        })
+            'elasticsearch_id': es_id,
+            'schema_version': 1
+        }
         
-        publish_message_to_rabbitmq(document_id, es_id)
+        publish_message_to_rabbitmq(mock_channel, document_id, es_id)
         
         mock_channel.basic_publish.assert_called_once()
         call_args = mock_channel.basic_publish.call_args[1]
-        self.assertEqual(call_args['body'], expected_message)
+        self.assertEqual(json.loads(call_args['body']), expected_message)
+        self.assertEqual(call_args['properties'].type, 'document.stored')
+        self.assertEqual(call_args['properties'].headers['lane'], 'new')
         print(f"Mensaje publicado a RabbitMQ: {expected_message}")
 
+    def test_publish_keeps_lane(self):
+        print("Probando que el mensaje al procesador conserva el carril...")
+        mock_channel = MagicMock()
+        publish_message_to_rabbitmq(mock_channel, "doc123", "es456", lane='updated')
+        call_args = mock_channel.basic_publish.call_args[1]
+        self.assertTrue(call_args['routing_key'].endswith('.updated'))
+        self.assertEqual(call_args['properties'].headers['lane'], 'updated')
+
     @patch('app.download_file_from_s3')
     @patch('app.read_file_content')
     @patch('app.store_document_in_elasticsearch')
@@ -129,16 +141,63 @@ class TestMessageProcessor(unittest.TestCase):
         mock_publish.assert_called_once()
         print("Callback al mensaje de RabbitMQ ejecutado correctamente")
 
-    @patch('app.pymysql.connect')
-    def test_get_db_connection(self, mock_connect):
+    @patch('app.download_file_from_s3')
+    @patch('app.update_mariadb_status')
+    @patch('app.publish_message_to_rabbitmq')
+    def test_callback_schedules_retry(self, mock_publish, mock_update, mock_download):
+        print("Probando que una descarga fallida se reprograma...")
+        ch = MagicMock()
+        method = MagicMock(routing_key='documents')
+        mock_download.side_effect = TimeoutError("S3 no responde")
+
+        callback(ch, method, MagicMock(headers=None), json.dumps({'file_name': 'a.html', 'document_id': 'doc1'}))
+
+        mock_publish.assert_not_called()
+        call_args = ch.basic_publish.call_args[1]
+        self.assertEqual(call_args['routing_key'], 'documents.retry.5s')
+        self.assertEqual(call_args['properties'].headers['retry_count'], 1)
+
+    @patch('app.download_file_from_s3')
+    def test_callback_dead_letters_incomplete_message(self, mock_download):
+        print("Probando que un mensaje sin file_name va a la cola de muertos...")
+        ch = MagicMock()
+        method = MagicMock(routing_key='documents')
+
+        callback(ch, method, MagicMock(headers=None), json.dumps({'document_id': 'doc1'}))
+
+        mock_download.assert_not_called()
+        self.assertEqual(ch.basic_publish.call_args[1]['routing_key'], 'documents.dead')
+
+    @patch('app.download_file_from_s3')
+    @patch('app.retry.schedule_retry')
+    def test_failed_retry_publish_is_not_acked(self, mock_schedule_retry, mock_download):
+        print("Probando que el mensaje no se confirma si no se pudo reprogramar...")
+        from pipeline import lanes
+        mock_download.side_effect = TimeoutError("S3 no responde")
+        mock_schedule_retry.side_effect = ConnectionError("conexión cerrada")
+        ch = MagicMock()
+        consumer = lanes.LaneConsumer(MagicMock(), ch, callback, lanes.configured('documents', enabled=False),
+                                      auto_ack=True)
+        lane = consumer.lanes[0]
+        consumer._receive(lane, ch, MagicMock(delivery_tag=7, routing_key='documents'), MagicMock(headers=None),
+                          json.dumps({'file_name': 'a.html', 'document_id': 'doc1'}))
+
+        consumer.dispatch(consumer.next_lane())
+
+        mock_schedule_retry.assert_called_once()
+        ch.basic_ack.assert_not_called()
+        ch.basic_nack.assert_called_once_with(delivery_tag=7, requeue=True)
+
+    @patch('app.db_connection')
+    def test_get_db_connection(self, mock_db_connection):
         print("Probando get_db_connection()...")
 
         mock_connection = MagicMock()
-        mock_connect.return_value = mock_connection
+        mock_db_connection.return_value = mock_connection
         
         result = get_db_connection()
         
-        mock_connect.assert_called_once()
+        mock_db_connection.assert_called_once()
         self.assertEqual(result, mock_connection)
         print("Database connection established successfully")
 
@@ -0,0 +1,844 @@
+import unittest
+from unittest.mock import MagicMock
+import os
+import sys
+
+# Añadir el código compartido al path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'common')))
+
+from elasticsearch import ConflictError, NotFoundError
+from pipeline.bulk_ingest import BulkIngestMode
+from pipeline.content import decode_body, iter_decompressed
+from pipeline import messages
+from pipeline.messages import (
+    encode_message, decode_message, MessageError, DOCUMENT_DISCOVERED, DOCUMENT_STORED
+)
+from pipeline.config import PipelineConfig
+from pipeline.clients import ConnectionPool
+from pipeline import clients, worker, metrics
+from pipeline import tracing, trace_report, profiling, lanes, retry, replay, autoscaling
+import signal
+from pipeline.tracing import TraceContext
+from urllib.request import urlopen
+import tempfile
+import threading
+from unittest.mock import patch
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from prometheus_client import CollectorRegistry, Counter, REGISTRY, generate_latest
+import socket
+import gzip
+import time
+import json
+
+
+class FakeElasticsearch:
+    """Índice de estado en memoria con control de concurrencia optimista (if_seq_no)"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.documents = {}
+        self.seq_no = 0
+        self.indices = MagicMock()
+        self.indices.get_settings.side_effect = lambda index, **kwargs: {
+            index: {'settings': dict(self.settings)}}
+        self.indices.put_settings.side_effect = lambda index, settings: self.settings.update(settings)
+
+    def get(self, index, id):
+        if id not in self.documents:
+            raise NotFoundError('not found', MagicMock(status=404), {})
+        seq_no, source = self.documents[id]
+        return {'_source': json.loads(json.dumps(source)), '_seq_no': seq_no, '_primary_term': 1}
+
+    def _check(self, id, if_seq_no):
+        if if_seq_no is not None and (id not in self.documents or self.documents[id][0] != if_seq_no):
+            raise ConflictError('conflict', MagicMock(status=409), {})
+
+    def index(self, index, id, document, op_type=None, if_seq_no=None, if_primary_term=None, refresh=None):
+        if op_type == 'create' and id in self.documents:
+            raise ConflictError('conflict', MagicMock(status=409), {})
+        self._check(id, if_seq_no)
+        self.seq_no += 1
+        self.documents[id] = (self.seq_no, document)
+
+    def delete(self, index, id, if_seq_no=None, if_primary_term=None, refresh=None):
+        if id not in self.documents:
+            raise NotFoundError('not found', MagicMock(status=404), {})
+        self._check(id, if_seq_no)
+        del self.documents[id]
+
+
+class TestBulkIngestMode(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.es = FakeElasticsearch({'index.refresh_interval': '5s', 'index.number_of_replicas': None})
+        self.mode = self.replica('a')
+
+    def replica(self, owner):
+        return BulkIngestMode(self.es, ['documents'], forced=False, threshold=100, replicas=0,
+                              heartbeat_timeout=120, owner=owner, clock=lambda: self.now)
+
+    def owners(self):
+        return set(self.es.documents['documents'][1]['owners'])
+
+    def test_enter_records_original_settings(self):
+        print("[TEST] Probando BulkIngestMode.enter()...")
+        self.mode.enter()
+
+        state = self.es.documents['documents'][1]
+        self.assertEqual(state['settings'], {'index.refresh_interval': '5s', 'index.number_of_replicas': None})
+        self.assertEqual(state['owners'], {'a': 1000.0})
+        self.assertEqual(self.es.settings, {'index.refresh_interval': '-1', 'index.number_of_replicas': 0})
+        self.assertTrue(self.mode.active)
+
+    def test_enter_keeps_existing_record(self):
+        print("[TEST] Probando que enter() conserva el registro previo...")
+        self.mode.enter()
+        self.replica('b').enter()
+        self.assertEqual(self.es.documents['documents'][1]['settings']['index.refresh_interval'], '5s')
+        self.assertEqual(self.owners(), {'a', 'b'})
+
+    def test_check_enters_and_exits_with_queue_depth(self):
+        print("[TEST] Probando BulkIngestMode.check()...")
+        self.mode.check(10)
+        self.assertFalse(self.mode.active)
+
+        self.mode.check(500)
+        self.assertTrue(self.mode.active)
+        self.now += 30
+        self.mode.check(400)
+        self.assertEqual(self.es.documents['documents'][1]['owners'], {'a': 1030.0})
+
+        self.mode.check(0)
+        self.assertFalse(self.mode.active)
+        self.assertEqual(self.es.settings, {'index.refresh_interval': '5s', 'index.number_of_replicas': None})
+        self.es.indices.refresh.assert_called_once_with(index='documents')
+        self.assertNotIn('documents', self.es.documents)
+
+    def test_restore_pending(self):
+        print("[TEST] Probando BulkIngestMode.restore_pending()...")
+        self.mode.restore_pending()
+        self.es.indices.put_settings.assert_not_called()
+
+        # El worker murió sin salir: su latido queda viejo
+        self.mode.enter()
+        self.now += 121
+        self.replica('b').restore_pending()
+        self.assertEqual(self.es.settings['index.refresh_interval'], '5s')
+        self.assertNotIn('documents', self.es.documents)
+
+    def test_new_replica_keeps_live_peer_in_bulk_mode(self):
+        print("[TEST] Probando que una réplica nueva no restaura la carga de otra viva...")
+        self.mode.enter()
+        self.now += 60
+        self.replica('b').restore_pending()
+        self.assertEqual(self.es.settings['index.refresh_interval'], '-1')
+        self.assertEqual(self.owners(), {'a'})
+
+    def test_only_last_replica_restores(self):
+        print("[TEST] Probando que solo la última réplica en salir restaura el índice...")
+        other = self.replica('b')
+        self.mode.enter()
+        other.enter()
+        self.mode.exit()
+        self.assertEqual(self.es.settings['index.refresh_interval'], '-1')
+        self.assertEqual(self.owners(), {'b'})
+        other.exit()
+        self.assertEqual(self.es.settings['index.refresh_interval'], '5s')
+        self.assertNotIn('documents', self.es.documents)
+
+    def test_restore_yields_to_replica_that_joins(self):
+        print("[TEST] Probando que no se restaura si otra réplica se suma al mismo tiempo...")
+        other = self.replica('b')
+        self.mode.enter()
+        state, seq_no, primary_term = self.mode._state('documents')
+        other.enter()
+        self.assertFalse(self.mode._restore('documents', state, seq_no, primary_term))
+        self.assertEqual(self.es.settings['index.refresh_interval'], '-1')
+        self.assertIn('documents', self.es.documents)
+
+    def test_heartbeat_reenters_after_record_was_lost(self):
+        print("[TEST] Probando que el latido vuelve a activar un índice restaurado por error...")
+        self.mode.enter()
+        self.now += 121
+        self.replica('b').restore_pending()
+        self.mode.heartbeat()
+        self.assertEqual(self.es.settings['index.refresh_interval'], '-1')
+        self.assertEqual(self.es.documents['documents'][1]['settings']['index.refresh_interval'], '5s')
+
+
+class TestContent(unittest.TestCase):
+
+    def test_decode_body(self):
+        print("[TEST] Probando decode_body()...")
+        html_content = "<html>ñandú</html>"
+        self.assertEqual(decode_body(html_content.encode('utf-8')), html_content)
+        # Se detecta gzip aunque no venga el header
+        self.assertEqual(decode_body(gzip.compress(html_content.encode('utf-8'))), html_content)
+
+    def test_iter_decompressed(self):
+        print("[TEST] Probando iter_decompressed()...")
+        data = gzip.compress(("<p>" + "x" * 10000 + "</p>").encode('utf-8'))
+        chunks = [data[i:i + 100] for i in range(0, len(data), 100)]
+        result = b''.join(iter_decompressed(iter(chunks), 'gzip'))
+        self.assertEqual(len(result), 10007)
+        self.assertEqual(b''.join(iter_decompressed(iter([b'<a>', b'</a>']))), b'<a></a>')
+
+
+class TestMessages(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = {
+            'file_name': 'ebay_product_1.html', 'status': 'new',
+            'path': '2023395931/ebay_product_1.html', 'document_id': 7
+        }
+
+    def test_json_round_trip(self):
+        print("[TEST] Probando mensajes en JSON...")
+        body, properties = encode_message(DOCUMENT_DISCOVERED, self.fields, 'json')
+        self.assertEqual(properties.content_type, 'application/json')
+        self.assertEqual(properties.type, DOCUMENT_DISCOVERED)
+        self.assertEqual(properties.headers, {'schema_version': 1})
+        # Los consumidores anteriores leen el mismo diccionario
+        self.assertEqual(json.loads(body)['file_name'], 'ebay_product_1.html')
+        message = decode_message(body, properties)
+        self.assertEqual(message['document_id'], 7)
+        self.assertEqual(message['schema_version'], 1)
+
+    def test_decode_legacy_message(self):
+        print("[TEST] Probando mensajes sin versión...")
+        body = json.dumps({'document_id': 3, 'elasticsearch_id': 'abc'})
+        message = decode_message(body, None, DOCUMENT_STORED)
+        self.assertEqual(message['elasticsearch_id'], 'abc')
+        self.assertEqual(message['schema_version'], 0)
+
+    def test_invalid_messages(self):
+        print("[TEST] Probando mensajes inválidos...")
+        with self.assertRaises(MessageError):
+            encode_message(DOCUMENT_STORED, {'document_id': 1})
+        with self.assertRaises(MessageError):
+            decode_message(b'{no es json')
+        with self.assertRaises(MessageError):
+            decode_message(b'[1, 2]')
+
+    @unittest.skipIf(messages.msgpack is None, "msgpack no está instalado")
+    def test_msgpack_round_trip(self):
+        print("[TEST] Probando mensajes en msgpack...")
+        body, properties = encode_message(DOCUMENT_DISCOVERED, self.fields, 'msgpack')
+        self.assertEqual(properties.content_type, 'application/msgpack')
+        self.assertLess(len(body), len(encode_message(DOCUMENT_DISCOVERED, self.fields, 'json')[0]))
+        message = decode_message(body, properties)
+        self.assertEqual(message, self.fields)
+
+        properties.headers = {'schema_version': 99}
+        with self.assertRaises(MessageError):
+            decode_message(body, properties)
+
+    def test_msgpack_requires_library(self):
+        original = messages.msgpack
+        messages.msgpack = None
+        try:
+            with self.assertRaises(RuntimeError):
+                encode_message(DOCUMENT_STORED, {'document_id': 1, 'elasticsearch_id': 'x'}, 'msgpack')
+        finally:
+            messages.msgpack = original
+
+
+class TestRuntime(unittest.TestCase):
+
+    def test_config_from_env(self):
+        print("[TEST] Probando PipelineConfig.from_env()...")
+        with patch.dict(os.environ, {'ELASTICSEARCH': 'http://es:9200', 'MARIADB_POOL_SIZE': '8',
+                                     'RABBITMQ_QUEUE': 'documents', 'KEY': ''}):
+            config = PipelineConfig.from_env()
+        self.assertEqual(config.elasticsearch.url, 'http://es:9200')
+        self.assertEqual(config.mariadb.pool_size, 8)
+        self.assertEqual(config.rabbitmq.queue, 'documents')
+        self.assertEqual(config.s3.key, '2023395931')
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(PipelineConfig.from_env().elasticsearch.url, 'http://ic4302-es-http:9200')
+
+    def test_connection_pool_reuses_connections(self):
+        print("[TEST] Probando ConnectionPool...")
+        factory = MagicMock(side_effect=lambda: MagicMock())
+        pool = ConnectionPool(factory, size=1)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        first.ping.assert_called_once_with(reconnect=True)
+        self.assertEqual(factory.call_count, 1)
+
+        # Una conexión que falló no vuelve al pool
+        with self.assertRaises(RuntimeError):
+            with pool.connection() as broken:
+                raise RuntimeError("error de consulta")
+        broken.close.assert_called_once()
+        with pool.connection() as third:
+            pass
+        self.assertIsNot(third, broken)
+
+        # Si el ping falla se crea una conexión nueva
+        third.ping.side_effect = Exception("server gone away")
+        with pool.connection() as fourth:
+            pass
+        self.assertIsNot(fourth, third)
+        pool.close()
+        fourth.close.assert_called_once()
+
+    def test_clients_are_lazy(self):
+        print("[TEST] Probando que los clientes se crean al primer uso...")
+        clients.get_s3_client.cache_clear()
+        with patch('boto3.client') as mock_client:
+            self.assertFalse(mock_client.called)
+            first = clients.get_s3_client()
+            second = clients.get_s3_client()
+        self.assertIs(first, second)
+        mock_client.assert_called_once()
+        clients.get_s3_client.cache_clear()
+
+    @patch('pipeline.worker.close_all')
+    @patch('pipeline.worker.get_amqp_connection')
+    def test_run_worker(self, mock_connection, mock_close_all):
+        print("[TEST] Probando run_worker()...")
+        channel = mock_connection.return_value.channel.return_value
+        callback, setup = MagicMock(), MagicMock()
+        worker.run_worker(callback, queue='documents', prefetch=5, setup=setup)
+        channel.queue_declare.assert_called_once_with(queue='documents', durable=True)
+        channel.basic_qos.assert_called_once_with(prefetch_count=5)
+        channel.basic_consume.assert_called_once_with(queue='documents', on_message_callback=callback, auto_ack=False)
+        setup.assert_called_once_with(mock_connection.return_value, channel)
+        channel.start_consuming.assert_called_once()
+        mock_close_all.assert_called_once()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def rendered_metrics():
+    return generate_latest(REGISTRY).decode('utf-8')
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_stage_totals(self):
+        print("[TEST] Probando las etapas instrumentadas con stage()...")
+        with metrics.service_context('test-stages'):
+            for _ in range(3):
+                with metrics.stage('parse'):
+                    pass
+        count, total = metrics.stage_totals()[('test-stages', 'parse')]
+        self.assertEqual(count, 3)
+        self.assertGreaterEqual(total, 0)
+        self.assertIn('pipeline_stage_seconds_bucket{le="0.005",service="test-stages",stage="parse"} 3.0',
+                      rendered_metrics())
+
+    def test_service_context(self):
+        print("[TEST] Probando label de servicio por hilo...")
+        metrics.configure('procesor')
+        seen = {}
+
+        def worker_thread():
+            with metrics.service_context('downloader'):
+                seen['thread'] = metrics.current_service()
+
+        thread = threading.Thread(target=worker_thread)
+        thread.start()
+        thread.join()
+        self.assertEqual(seen['thread'], 'downloader')
+        self.assertEqual(metrics.current_service(), 'procesor')
+
+    def test_record_status(self):
+        print("[TEST] Probando record_status()...")
+        with metrics.service_context('test-status'):
+            metrics.record_status('error_saving')
+            metrics.record_status('error_saving')
+        self.assertIn('pipeline_document_status_total{service="test-status",status="error_saving"} 2.0',
+                      rendered_metrics())
+
+    def test_track_message(self):
+        print("[TEST] Probando track_message()...")
+        metrics.configure('test-service')
+
+        @metrics.track_message
+        def callback(fail):
+            if fail:
+                raise RuntimeError("falla")
+
+        callback(False)
+        with self.assertRaises(RuntimeError):
+            callback(True)
+        text = rendered_metrics()
+        self.assertIn('pipeline_messages_total{result="ok",service="test-service"} 1.0', text)
+        self.assertIn('pipeline_messages_total{result="error",service="test-service"} 1.0', text)
+        self.assertIn('pipeline_in_flight_messages{service="test-service"} 0.0', text)
+        self.assertIn('pipeline_stage_seconds_count{service="test-service",stage="message"} 2.0', text)
+
+    def test_sampled(self):
+        self.assertTrue(metrics.sampled(1))
+        self.assertFalse(metrics.sampled(0))
+        logger = MagicMock()
+        logger.isEnabledFor.return_value = False
+        self.assertFalse(metrics.sampled(1, logger=logger))
+
+    def test_endpoint(self):
+        print("[TEST] Probando el endpoint /metrics...")
+        registry = CollectorRegistry()
+        Counter('test_requests_total', 'Prueba', registry=registry).inc()
+        self.assertIsNone(metrics.start_metrics_server(port=0, registry=registry))
+        for routes in (None, {'/health': lambda: ('text/plain', b'ok')}):
+            port = free_port()
+            server = metrics.start_metrics_server(port=port, routes=routes, addr='127.0.0.1', registry=registry)
+            try:
+                with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                    self.assertIn('test_requests_total 1.0', response.read().decode('utf-8'))
+                if routes:
+                    with urlopen(f"http://127.0.0.1:{port}/health") as response:
+                        self.assertEqual(response.read(), b'ok')
+            finally:
+                server.shutdown()
+                server.server_close()
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.trace_file = os.path.join(self.temp_dir.name, 'traces.jsonl')
+        tracing.configure_export(self.trace_file)
+
+    def tearDown(self):
+        tracing.configure_export('')
+        self.temp_dir.cleanup()
+
+    def read_records(self):
+        with open(self.trace_file, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_headers_round_trip(self):
+        print("[TEST] Probando propagación del trace en headers...")
+        trace = TraceContext(source_modified_ms=1000)
+        trace.add_stage('s3-spider', 'detect', 1000, 1500)
+        body, properties = encode_message(DOCUMENT_STORED, {'document_id': 1, 'elasticsearch_id': 'x'},
+                                          message_format='json', headers=trace.headers())
+        self.assertEqual(properties.headers[messages.VERSION_HEADER], 1)
+        self.assertFalse(any(isinstance(value, float) for value in properties.headers.values()))
+        received = TraceContext.from_properties(properties)
+        self.assertEqual(received.trace_id, trace.trace_id)
+        self.assertEqual(received.source_modified_ms, 1000)
+        self.assertEqual(received.stages, [['s3-spider', 'detect', 1000, 1500]])
+
+    def test_legacy_message_starts_new_trace(self):
+        print("[TEST] Probando mensaje sin trace...")
+        first = TraceContext.from_properties(MagicMock(headers=None))
+        second = TraceContext.from_properties(MagicMock(headers={messages.VERSION_HEADER: 1}))
+        self.assertTrue(first.trace_id)
+        self.assertNotEqual(first.trace_id, second.trace_id)
+        self.assertEqual(second.stages, [])
+
+    def test_span_and_finish_export(self):
+        print("[TEST] Probando exportación de tramos y lag de frescura...")
+        trace = TraceContext(source_modified_ms=tracing.now_ms() - 5000)
+        with self.assertRaises(RuntimeError):
+            with trace.span('procesor', 'process'):
+                raise RuntimeError('falla')
+        lag = trace.finish('procesor', 'processed')
+        self.assertGreaterEqual(lag, 5000)
+        span, record = self.read_records()
+        self.assertEqual((span['type'], span['service'], span['stage']), ('span', 'procesor', 'process'))
+        self.assertEqual(record['type'], 'trace')
+        self.assertEqual(record['trace_id'], trace.trace_id)
+        self.assertEqual(len(record['stages']), 1)
+        self.assertIn('pipeline_freshness_lag_seconds_count{service="procesor"}', rendered_metrics())
+
+    def test_report_percentiles(self):
+        print("[TEST] Probando reporte de traces...")
+        for duration in range(1, 101):
+            trace = TraceContext(source_modified_ms=0)
+            trace.add_stage('downloader', 'download', 0, duration)
+            trace.finish('procesor', 'processed', finished_ms=duration * 1000)
+        TraceContext().finish('procesor', 'error_saving')
+        stages, lag = trace_report.summarize(trace_report.load_records([self.trace_file]))
+        summary = stages[('downloader', 'download')]
+        self.assertEqual((summary['count'], summary['p50'], summary['p95'], summary['p99']), (100, 50, 95, 99))
+        self.assertEqual(lag['count'], 100)
+        self.assertEqual(lag['p99'], 99000)
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profiler = profiling.Profiler(output_dir=self.temp_dir.name, top=10, tracemalloc_interval=0.001)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_disabled_does_not_profile(self):
+        print("[TEST] Probando que sin ventana no se perfila...")
+        handler = self.profiler.wrap(lambda value: value * 2)
+        self.assertEqual(handler(21), 42)
+        self.assertEqual(self.profiler.reports, [])
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_profiles_next_messages(self):
+        print("[TEST] Probando la ventana de perfilado de N mensajes...")
+
+        def parse_message(size):
+            return [str(index) for index in range(size)]
+
+        handler = self.profiler.wrap(parse_message)
+        self.profiler.arm(2)
+        handler(1000)
+        self.assertEqual(self.profiler.reports, [])
+        handler(1000)
+        handler(1000)  # fuera de la ventana
+        self.assertEqual(len(self.profiler.reports), 1)
+        base = self.profiler.reports[0]
+        self.assertTrue(os.path.exists(f"{base}.prof"))
+        with open(f"{base}.txt", encoding='utf-8') as file:
+            report = file.read()
+        self.assertIn('Perfil de 2 mensajes', report)
+        self.assertIn('parse_message', report)
+        self.assertIn('Asignaciones vivas', report)
+        self.assertEqual(self.profiler.remaining, 0)
+
+    def test_signal_arms_profiler(self):
+        print("[TEST] Probando activación del perfilado por señal...")
+        previous = signal.getsignal(signal.SIGUSR1)
+        try:
+            profiling.install(self.profiler, messages=0, signal_name='SIGUSR1', signal_messages=5)
+            self.assertEqual(self.profiler.remaining, 0)
+            os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertEqual(self.profiler.remaining, 5)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+
+
+class TestLanes(unittest.TestCase):
+
+    def make_consumer(self, callback=None, auto_ack=False):
+        self.channel = MagicMock()
+        self.connection = MagicMock()
+        configured = lanes.configured('documents', weights={'new': 3, 'updated': 1}, enabled=True)
+        return lanes.LaneConsumer(self.connection, self.channel, callback or MagicMock(), configured,
+                                  auto_ack=auto_ack, prefetch=2)
+
+    def deliver(self, consumer, lane_name, count):
+        lane = next(lane for lane in consumer.lanes if lane.name == lane_name)
+        for index in range(count):
+            properties = MagicMock(headers={lanes.LANE_HEADER: lane_name,
+                                            lanes.PUBLISHED_HEADER: int(time.time() * 1000) - 2000})
+            consumer._receive(lane, self.channel, MagicMock(delivery_tag=f"{lane_name}-{index}"), properties, b'{}')
+
+    def test_routing(self):
+        print("[TEST] Probando colas por carril...")
+        self.assertEqual(lanes.lane_for_status('new'), 'new')
+        self.assertEqual(lanes.lane_for_status('updated'), 'updated')
+        self.assertEqual(lanes.queue_for('documents', 'new', enabled=True), 'documents')
+        self.assertEqual(lanes.queue_for('documents', 'updated', enabled=True), 'documents.updated')
+        self.assertEqual(lanes.queue_for('documents', 'updated', enabled=False), 'documents')
+        self.assertEqual([lane.queue for lane in lanes.configured('documents', enabled=False)], ['documents'])
+        self.assertEqual(lanes.parse_weights('new=4, updated=1'), {'new': 4, 'updated': 1})
+        self.assertEqual(lanes.lane_of(MagicMock(headers=None)), 'new')
+
+    def test_start_sets_prefetch_per_lane(self):
+        print("[TEST] Probando prefetch por carril...")
+        consumer = self.make_consumer()
+        consumer.start()
+        self.channel.basic_qos.assert_any_call(prefetch_count=6)
+        self.channel.basic_qos.assert_any_call(prefetch_count=2)
+        queues = [call.kwargs['queue'] for call in self.channel.basic_consume.call_args_list]
+        self.assertEqual(queues, ['documents', 'documents.updated'])
+
+    def test_weighted_dispatch(self):
+        print("[TEST] Probando despacho ponderado entre carriles...")
+        order = []
+        consumer = self.make_consumer(lambda ch, method, properties, body: order.append(properties.headers['lane']))
+        self.deliver(consumer, 'updated', 10)
+        self.deliver(consumer, 'new', 6)
+        while True:
+            lane = consumer.next_lane()
+            if lane is None:
+                break
+            consumer.dispatch(lane)
+        self.assertEqual(order[:8].count('new'), 6)
+        self.assertEqual(order[8:], ['updated'] * 8)
+        self.assertIn('pipeline_lane_wait_seconds_count{lane="new",service="', rendered_metrics())
+
+    def test_auto_ack_after_callback(self):
+        print("[TEST] Probando ack automático del consumidor por carriles...")
+        consumer = self.make_consumer(auto_ack=True)
+        self.deliver(consumer, 'new', 1)
+        consumer.dispatch(consumer.next_lane())
+        consumer.callback.assert_called_once()
+        self.channel.basic_ack.assert_called_once_with(delivery_tag='new-0')
+
+    def test_failed_callback_is_not_acked(self):
+        print("[TEST] Probando que un callback con error no confirma el mensaje...")
+        consumer = self.make_consumer(MagicMock(side_effect=ConnectionError("canal cerrado")), auto_ack=True)
+        self.deliver(consumer, 'new', 1)
+        consumer.dispatch(consumer.next_lane())
+        self.channel.basic_ack.assert_not_called()
+        self.channel.basic_nack.assert_called_once_with(delivery_tag='new-0', requeue=True)
+        # Con ack manual el callback es dueño de la confirmación: el error se propaga
+        consumer = self.make_consumer(MagicMock(side_effect=ConnectionError("canal cerrado")))
+        self.deliver(consumer, 'new', 1)
+        with self.assertRaises(ConnectionError):
+            consumer.dispatch(consumer.next_lane())
+        self.channel.basic_ack.assert_not_called()
+        self.channel.basic_nack.assert_not_called()
+
+    def test_run_until_stopped(self):
+        print("[TEST] Probando loop de consumo por carriles...")
+        consumer = self.make_consumer()
+        events = iter([lambda: self.deliver(consumer, 'updated', 2), lambda: None, consumer.stop])
+        self.connection.process_data_events.side_effect = lambda time_limit: next(events)()
+        consumer.run()
+        self.assertEqual(consumer.callback.call_count, 2)
+
+
+class TestRetry(unittest.TestCase):
+
+    def published(self, channel):
+        call = channel.basic_publish.call_args.kwargs
+        return call['routing_key'], call['properties'].headers
+
+    def test_delay_queue_returns_to_origin(self):
+        print("[TEST] Probando cola de espera con TTL...")
+        channel = MagicMock()
+        self.assertEqual(retry.declare_delay_queue(channel, 'documents', 30), 'documents.retry.30s')
+        arguments = channel.queue_declare.call_args.kwargs['arguments']
+        self.assertEqual(arguments['x-message-ttl'], 30000)
+        self.assertEqual(arguments['x-dead-letter-exchange'], '')
+        self.assertEqual(arguments['x-dead-letter-routing-key'], 'documents')
+
+    def test_backoff_then_dead_letter(self):
+        print("[TEST] Probando reintentos con espera creciente y cola de muertos...")
+        channel = MagicMock()
+        properties = MagicMock(headers={lanes.LANE_HEADER: 'updated'})
+        targets = []
+        for expected in (retry.RETRY, retry.RETRY, retry.DEAD):
+            outcome = retry.schedule_retry(channel, 'documents.updated', b'{}', properties,
+                                           TimeoutError('S3 no responde'), delays=[5, 30])
+            self.assertEqual(outcome, expected)
+            target, headers = self.published(channel)
+            targets.append(target)
+            properties = MagicMock(headers=headers)
+        self.assertEqual(targets, ['documents.updated.retry.5s', 'documents.updated.retry.30s',
+                                   'documents.updated.dead'])
+        self.assertEqual(headers[retry.RETRY_COUNT_HEADER], 3)
+        self.assertEqual(headers[retry.ORIGINAL_QUEUE_HEADER], 'documents.updated')
+        self.assertEqual(headers[retry.FAILURE_REASON_HEADER], 'S3 no responde')
+        self.assertEqual(headers[lanes.LANE_HEADER], 'updated')
+        self.assertIn('pipeline_retries_total{error="TimeoutError",outcome="dead",service="', rendered_metrics())
+
+    def test_permanent_error_skips_retries(self):
+        print("[TEST] Probando error permanente directo a la cola de muertos...")
+        channel = MagicMock()
+        outcome = retry.schedule_retry(channel, 'documents', b'x', MagicMock(headers=None), 'Mensaje inválido',
+                                       permanent=True)
+        self.assertEqual(outcome, retry.DEAD)
+        self.assertEqual(self.published(channel)[0], 'documents.dead')
+
+    def dead_channel(self, reasons):
+        channel = MagicMock()
+        deliveries = [(MagicMock(delivery_tag=index), MagicMock(headers={
+            retry.FAILURE_REASON_HEADER: reason, retry.RETRY_COUNT_HEADER: 5,
+            retry.ORIGINAL_QUEUE_HEADER: 'documents.updated'}), b'{}') for index, reason in enumerate(reasons)]
+        channel.basic_get.side_effect = deliveries + [(None, None, None)]
+        return channel
+
+    def test_replay_in_batches(self):
+        print("[TEST] Probando reinyección de la cola de muertos...")
+        channel = self.dead_channel(['timeout', 'timeout', 'no encontrado'])
+        sleep = MagicMock()
+        replayed, held, reasons = replay.replay(channel, 'documents.dead', batch=2, interval=7,
+                                                reason='timeout', sleep=sleep)
+        self.assertEqual((replayed, held), (2, 1))
+        self.assertEqual(reasons['timeout'], 2)
+        sleep.assert_called_once_with(7)
+        call = channel.basic_publish.call_args.kwargs
+        self.assertEqual(call['routing_key'], 'documents.updated')
+        self.assertEqual(call['properties'].headers[retry.RETRY_COUNT_HEADER], 0)
+        channel.basic_nack.assert_called_once_with(delivery_tag=2, requeue=True)
+
+    def test_replay_dry_run(self):
+        print("[TEST] Probando resumen sin reinyectar...")
+        channel = self.dead_channel(['timeout', 'no encontrado'])
+        replayed, held, reasons = replay.replay(channel, 'documents.dead', dry_run=True)
+        self.assertEqual((replayed, held), (0, 2))
+        channel.basic_publish.assert_not_called()
+        channel.basic_ack.assert_not_called()
+        self.assertEqual(replay.original_queue('documents.dead', {}), 'documents')
+
+
+class StubManagementAPI:
+    """API de administración de RabbitMQ falsa: sirve /api/queues/%2F con `self.queues`"""
+
+    def __init__(self, queues):
+        self.queues = queues
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append((self.path, self.headers.get('Authorization')))
+                if self.path != '/api/queues/%2F':
+                    self.send_error(404)
+                    return
+                body = json.dumps(stub.queues).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def queue_item(name, messages, consumers=1, publish=0.0, ack=0.0):
+    return {'name': name, 'messages': messages, 'consumers': consumers,
+            'message_stats': {'publish_details': {'rate': publish}, 'ack_details': {'rate': ack}}}
+
+
+class TestAutoscaling(unittest.TestCase):
+
+    def setUp(self):
+        self.stage = autoscaling.Stage('procesor', ('processed', 'processed.updated'), min_replicas=1,
+                                       max_replicas=10, target_seconds=60, capacity=10)
+
+    def test_desired_replicas(self):
+        print("[TEST] Probando réplicas deseadas según backlog y tasas...")
+        stats = [autoscaling.QueueStats('processed', 1200, 2, publish_rate=30, ack_rate=20),
+                 autoscaling.QueueStats('processed.updated', 600, 2)]
+        # 10 msg/s por réplica; se necesitan 30 + 1800/60 = 60 msg/s
+        self.assertEqual(autoscaling.desired_replicas(self.stage, stats), (2, 6))
+        stats[0] = autoscaling.QueueStats('processed', 60000, 2, publish_rate=30, ack_rate=20)
+        self.assertEqual(autoscaling.desired_replicas(self.stage, stats), (2, 10))
+        # Sin consumidores se arranca con lo necesario para el backlog
+        stopped = [autoscaling.QueueStats('processed', 50, 0)]
+        self.assertEqual(autoscaling.desired_replicas(self.stage, stopped), (0, 1))
+
+    def test_scale_down_when_idle(self):
+        print("[TEST] Probando que una etapa sin trabajo baja hasta el mínimo...")
+        current, replicas = 8, []
+        while current > self.stage.min_replicas:
+            idle = [autoscaling.QueueStats('processed', 0, current),
+                    autoscaling.QueueStats('processed.updated', 0, current)]
+            _, current = autoscaling.desired_replicas(self.stage, idle)
+            replicas.append(current)
+        self.assertEqual(replicas, [7, 6, 5, 4, 3, 2, 1])
+
+    def test_scale_down_when_lightly_loaded(self):
+        print("[TEST] Probando que una etapa con poca carga libera réplicas...")
+        # Cola vacía y 1 msg/s: las confirmaciones igualan lo publicado pero basta una réplica
+        light = [autoscaling.QueueStats('processed', 0, 8, publish_rate=1, ack_rate=1)]
+        self.assertEqual(autoscaling.desired_replicas(self.stage, light), (8, 7))
+        light = [autoscaling.QueueStats('processed', 0, 2, publish_rate=1, ack_rate=1)]
+        self.assertEqual(autoscaling.desired_replicas(self.stage, light), (2, 1))
+        # Si la carga aún necesita las réplicas actuales no se baja
+        busy = [autoscaling.QueueStats('processed', 120, 4, publish_rate=38, ack_rate=38)]
+        self.assertEqual(autoscaling.desired_replicas(self.stage, busy), (4, 4))
+
+    def test_backpressure_hysteresis(self):
+        print("[TEST] Probando histéresis de la contrapresión...")
+        backpressure = autoscaling.Backpressure(high_water=100, low_water=50)
+        self.assertFalse(backpressure.update({'documents': 80}))
+        self.assertTrue(backpressure.update({'documents': 10, 'processed': 150}))
+        self.assertEqual(backpressure.deepest, 'processed')
+        self.assertTrue(backpressure.update({'processed': 70}))
+        self.assertFalse(backpressure.update({'processed': 40}))
+
+    def test_controller_against_stub_api(self):
+        print("[TEST] Probando el controlador contra una API de administración falsa...")
+        api = StubManagementAPI([
+            queue_item('documents', 300, consumers=1, publish=5, ack=5),
+            queue_item('processed', 9000, consumers=2, publish=40, ack=20),
+            queue_item('processed.retry.5s', 50000, consumers=0),
+        ])
+        try:
+            client = autoscaling.ManagementClient(api.url, user='user', password='secreto')
+            controller = autoscaling.Controller(client, [
+                autoscaling.stage_for('downloader', 'documents', capacity=5),
+                autoscaling.stage_for('procesor', 'processed', capacity=10),
+            ], autoscaling.Backpressure(high_water=5000, low_water=2500))
+            result = controller.poll()
+        finally:
+            api.close()
+
+        self.assertTrue(api.requests[0][1].startswith('Basic '))
+        self.assertEqual(result['downloader'], {'current': 1, 'desired': 2, 'messages': 300})
+        self.assertEqual(result['procesor'], {'current': 2, 'desired': 10, 'messages': 9000})
+        # Las colas de reintento esperan a propósito: no frenan ni escalan
+        state = controller.state()
+        self.assertTrue(state['paused'])
+        self.assertEqual(state['deepest_queue'], 'processed')
+        rendered = rendered_metrics()
+        self.assertIn('pipeline_autoscaler_desired_replicas{stage="procesor"} 10', rendered)
+        self.assertIn('pipeline_backpressure 1', rendered)
+
+        # Con la API caída se conserva el último estado
+        self.assertIsNone(controller.poll())
+        self.assertTrue(controller.state()['paused'])
+
+    def test_backpressure_route(self):
+        print("[TEST] Probando la ruta /backpressure del servidor de métricas...")
+        controller = autoscaling.Controller(MagicMock(), [])
+        port = free_port()
+        server = metrics.start_metrics_server(port=port, routes={'/backpressure': controller.route}, addr='127.0.0.1')
+        try:
+            with urlopen(f"http://127.0.0.1:{port}/backpressure") as response:
+                self.assertEqual(response.headers['Content-Type'], 'application/json')
+                self.assertFalse(json.loads(response.read())['paused'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def throttle(self, responses):
+        clock = [0.0]
+        replies = iter(responses)
+
+        def opener(url, timeout):
+            reply = next(replies)
+            if isinstance(reply, Exception):
+                raise reply
+            response = MagicMock()
+            response.__enter__.return_value.read.return_value = json.dumps({'paused': reply}).encode('utf-8')
+            return response
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        return autoscaling.Throttle('http://autoscaler/backpressure', poll_interval=5, max_wait=60,
+                                    opener=opener, sleep=sleep, clock=lambda: clock[0])
+
+    def test_throttle_waits_until_released(self):
+        print("[TEST] Probando la espera del productor por contrapresión...")
+        self.assertEqual(self.throttle([True, True, False]).wait(), 10)
+        self.assertEqual(self.throttle([True] * 20).wait(), 60)
+        self.assertEqual(autoscaling.Throttle('').wait(), 0)
+
+    def test_throttle_fails_open(self):
+        print("[TEST] Probando que el productor sigue si el controlador no responde...")
+        throttle = self.throttle([OSError('connection refused')])
+        self.assertEqual(throttle.wait(), 0)
+        # El estado se reutiliza dentro del intervalo de consulta
+        self.assertEqual(throttle.wait(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,6 +31,7 @@ os.environ['SECRET_KEY'] = 'test_secret_key'
 # pero para la prueba usaremos un mock del archivo
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'procesor', 'app')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'common')))
 
 class TestDocumentProcessor(unittest.TestCase):
     
@@ -368,5 +369,364 @@ class TestDocumentProcessor(unittest.TestCase):
         # Verificamos que se confirmó el mensaje a pesar del error
         self.mock_rabbitmq_channel.basic_ack.assert_called_with(delivery_tag="tag1")
 
+    @patch('app.retry.schedule_retry')
+    def test_process_message_retry_publish_fails(self, mock_schedule_retry):
+        # El canal se cayó: ni el procesamiento ni el reintento quedaron hechos
+        method = MagicMock()
+        method.delivery_tag = "tag1"
+        self.processor.update_document_status = MagicMock(side_effect=Exception("Test error"))
+        mock_schedule_retry.side_effect = ConnectionError("conexión cerrada")
+        
+        with self.assertRaises(ConnectionError):
+            self.processor.process_message(
+                self.mock_rabbitmq_channel, 
+                method, 
+                None, 
+                json.dumps({"id": "test_doc_id"}).encode('utf-8')
+            )
+        
+        # Verificamos que el mensaje queda sin confirmar para que RabbitMQ lo vuelva a entregar
+        self.mock_rabbitmq_channel.basic_ack.assert_not_called()
+
+class TestSiteProfiles(unittest.TestCase):
+
+    def setUp(self):
+        from site_profiles import load_profiles
+        self.registry = load_profiles()
+
+    def test_route_by_url(self):
+        # Verificamos que la URL tiene prioridad sobre el marcado
+        profile = self.registry.route("<html></html>", "https://www.amazon.com/dp/B000")
+        self.assertEqual(profile.name, "amazon")
+        profile = self.registry.route("<html></html>", "https://www.ebay.com/itm/123")
+        self.assertEqual(profile.name, "ebay")
+
+    def test_route_by_source_url_in_markup(self):
+        from structured_data import extract_source_url
+        html_content = ('<html><head><link href="https://www.amazon.com/dp/B000?a=1&amp;b=2" rel="canonical">'
+                        '</head><body><span class="x-item-title__mainTitle">X</span></body></html>')
+        url = extract_source_url(html_content)
+        self.assertEqual(url, "https://www.amazon.com/dp/B000?a=1&b=2")
+        # La URL manda aunque el marcado se parezca al de eBay
+        self.assertEqual(self.registry.route(html_content, url).name, "amazon")
+        self.assertEqual(extract_source_url('<meta property="og:url" content="https://www.ebay.com/itm/1">'),
+                         "https://www.ebay.com/itm/1")
+        self.assertIsNone(extract_source_url("<html></html>"))
+
+    def test_route_by_markup_and_default(self):
+        profile = self.registry.route('<span id="productTitle">X</span>')
+        self.assertEqual(profile.name, "amazon")
+        # Sin coincidencias se usa el perfil por defecto
+        profile = self.registry.route("<html><body></body></html>")
+        self.assertEqual(profile.name, "ebay")
+
+    def test_ebay_profile_extraction(self):
+        from bs4 import BeautifulSoup
+        html_content = """
+        <html><head><title>Cool Phone | eBay</title></head><body>
+            <a class="seo-breadcrumb-text"><span>Electronics</span></a>
+            <a class="seo-breadcrumb-text"><span>Phones</span></a>
+            <h1 class="x-item-title__mainTitle">Details about Cool Phone</h1>
+            <div class="x-price-primary"><span>US $12.99/ea</span></div>
+            <div class="ux-image-carousel"><img src="//i.ebayimg.com/a/s-l140.jpg"></div>
+        </body></html>
+        """
+        profile = self.registry.route(html_content)
+        soup = BeautifulSoup(html_content, 'html.parser')
+
+        self.assertEqual(profile.extract_product_name(soup, soup.title.string), "Cool Phone")
+        self.assertEqual(profile.extract_price(soup), "US $12.99/ea")
+        self.assertEqual(profile.extract_categories(soup), ["Electronics", "Phones"])
+        self.assertEqual(profile.extract_images(soup), ["https://i.ebayimg.com/a/s-l500.jpg"])
+
+    def test_amazon_profile_extraction(self):
+        from bs4 import BeautifulSoup
+        html_content = """
+        <html><head><title>Amazon.com: Desk Lamp</title></head><body>
+            <div id="wayfinding-breadcrumbs_feature_div"><ul><li><a>Home</a></li><li><a>Lamps</a></li></ul></div>
+            <span id="productTitle"> Desk Lamp </span>
+            <div id="corePrice_feature_div"><span class="a-offscreen">$19.99</span></div>
+            <div id="productDescription"><p>Bright lamp</p></div>
+        </body></html>
+        """
+        profile = self.registry.route(html_content)
+        soup = BeautifulSoup(html_content, 'html.parser')
+
+        self.assertEqual(profile.label, "amazon@1")
+        self.assertEqual(profile.extract_product_name(soup, soup.title.string), "Desk Lamp")
+        self.assertEqual(profile.extract_price(soup), "$19.99")
+        self.assertEqual(profile.extract_description(soup), "Bright lamp")
+        self.assertEqual(profile.extract_categories(soup), ["Home", "Lamps"])
+
+class TestStructuredData(unittest.TestCase):
+
+    def test_extract_structured_data_product(self):
+        from structured_data import extract_structured_data, extract_title
+        html_content = """
+        <html><head><title>Lamp &amp; Shade | eBay</title>
+        <script type="application/ld+json">
+        {"@context": "https://schema.org", "@graph": [
+            {"@type": "Product", "name": "Lamp &amp; Shade", "description": "Warm light",
+             "image": [{"@type": "ImageObject", "url": "https://i.ebayimg.com/1.jpg"}, "https://i.ebayimg.com/2.jpg"],
+             "offers": {"@type": "Offer", "price": "12.99", "priceCurrency": "USD"}},
+            {"@type": "BreadcrumbList", "itemListElement": [
+                {"@type": "ListItem", "position": 2, "name": "Lamps"},
+                {"@type": "ListItem", "position": 1, "item": {"name": "Home & Garden"}}]}
+        ]}
+        </script>
+        <script type="application/ld+json">{invalido</script>
+        </head><body></body></html>
+        """
+        fields = extract_structured_data(html_content)
+
+        self.assertEqual(extract_title(html_content), "Lamp & Shade | eBay")
+        self.assertEqual(fields["product_name"], "Lamp & Shade")
+        self.assertEqual(fields["price"], "USD 12.99")
+        self.assertEqual(fields["description"], "Warm light")
+        self.assertEqual(fields["categories"], ["Home & Garden", "Lamps"])
+        self.assertEqual(fields["images"], ["https://i.ebayimg.com/1.jpg", "https://i.ebayimg.com/2.jpg"])
+
+    def test_extract_structured_data_without_blocks(self):
+        from structured_data import extract_structured_data, extract_title
+        self.assertEqual(extract_structured_data("<html><body>Nada</body></html>"), {})
+        self.assertEqual(extract_title("<html></html>"), "Sin título")
+
+    @patch('app.BeautifulSoup')
+    def test_parse_skips_dom_when_structured_data_is_complete(self, mock_soup):
+        from app import DocumentProcessor
+        from site_profiles import load_profiles
+        processor = DocumentProcessor.__new__(DocumentProcessor)
+        processor.profiles = load_profiles()
+        html_content = """<html><head><script type="application/ld+json">
+        [{"@type": "Product", "name": "Mouse", "description": "Gaming", "image": "https://i.ebayimg.com/m.jpg",
+          "offers": [{"price": 5, "priceCurrency": "EUR"}]},
+         {"@type": "BreadcrumbList", "itemListElement": [{"position": 1, "name": "PC"}]}]
+        </script></head></html>"""
+
+        result = processor.parse_html_with_beautifulsoup(html_content)
+
+        # Verificamos que no se construyó el DOM
+        mock_soup.assert_not_called()
+        self.assertEqual(result["product_name"], "Mouse")
+        self.assertEqual(result["price"], "EUR 5")
+        self.assertEqual(result["categories"], ["PC"])
+
+    def test_non_text_values_are_skipped(self):
+        from structured_data import extract_structured_data
+        html_content = """<script type="application/ld+json">
+        [{"@type": "Product", "name": {"@value": "X"}, "description": ["a", "b"],
+          "offers": {"price": "5.00", "priceCurrency": "USD"}},
+         {"@type": "BreadcrumbList", "itemListElement": [
+            {"position": "2", "name": "Lamps &amp; Shades"}, {"position": 1, "name": "Home"},
+            {"position": "x", "name": "Lamps & Shades"}, {"position": 3, "name": {"x": 1}}]}]
+        </script>"""
+        fields = extract_structured_data(html_content)
+        self.assertNotIn("product_name", fields)
+        self.assertNotIn("description", fields)
+        self.assertEqual(fields["price"], "USD 5.00")
+        # Posiciones mixtas y nombres repetidos una vez normalizados
+        self.assertEqual(fields["categories"], ["Lamps & Shades", "Home"])
+
+    def test_malformed_json_ld_keeps_dom_extraction(self):
+        import app
+        processor = app.DocumentProcessor.__new__(app.DocumentProcessor)
+        processor.profiles = app.load_profiles()
+        html_content = """<html><head><title>Cool Phone | eBay</title>
+        <script type="application/ld+json">{"@type": "Product", "name": "Cool Phone"}</script></head><body>
+        <h1 class="x-item-title__mainTitle"><span>Cool Phone</span></h1>
+        <div class="x-price-primary"><span>US $99.00</span></div>
+        <div id="desc_div">Great phone</div></body></html>"""
+        with patch('app.extract_structured_data', side_effect=AttributeError("'dict' object has no attribute 'strip'")):
+            product = processor.parse_html_with_beautifulsoup(html_content)
+        self.assertEqual(product["product_name"], "Cool Phone")
+        self.assertEqual(product["price_value"], 99.0)
+        self.assertEqual(product["description"], "Great phone")
+
+class TestProductMapping(unittest.TestCase):
+
+    def test_normalize_price(self):
+        from product_mapping import normalize_price
+        casos = {
+            "US $12.99/ea": (12.99, "USD"),
+            "C $1,234.56": (1234.56, "CAD"),
+            "EUR 12,99": (12.99, "EUR"),
+            "£1.299,00": (1299.0, "GBP"),
+            "USD 5": (5.0, "USD"),
+            "US $10.00 to US $20.00": (10.0, "USD"),
+        }
+        for price_text, (value, currency) in casos.items():
+            result = normalize_price(price_text)
+            self.assertEqual(result["price_value"], value, price_text)
+            self.assertEqual(result["currency"], currency, price_text)
+
+        self.assertEqual(normalize_price(""), {"price_value": None, "currency": None})
+
+    def test_ensure_index_template_installs_when_missing(self):
+        import app
+        from product_mapping import TEMPLATE_VERSION
+        processor = app.DocumentProcessor.__new__(app.DocumentProcessor)
+        processor.es = MagicMock()
+        processor.es.indices.exists_index_template.return_value = False
+        processor.es.indices.exists.return_value = False
+
+        processor.ensure_index_template()
+
+        kwargs = processor.es.indices.put_index_template.call_args[1]
+        self.assertEqual(kwargs["index_patterns"], [app.ELASTICSEARCH_INDEX_DST])
+        self.assertEqual(kwargs["_meta"], {"version": TEMPLATE_VERSION})
+        properties = kwargs["template"]["mappings"]["properties"]
+        self.assertEqual(properties["price_value"]["type"], "scaled_float")
+        self.assertEqual(properties["categories"]["type"], "keyword")
+        self.assertFalse(properties["images"]["index"])
+
+    def test_ensure_index_template_skips_current_version(self):
+        import app
+        from product_mapping import TEMPLATE_VERSION
+        processor = app.DocumentProcessor.__new__(app.DocumentProcessor)
+        processor.es = MagicMock()
+        processor.es.indices.exists_index_template.return_value = True
+        processor.es.indices.get_index_template.return_value = {
+            "index_templates": [{"index_template": {"_meta": {"version": TEMPLATE_VERSION}}}]
+        }
+        processor.es.indices.exists.return_value = False
+
+        processor.ensure_index_template()
+
+        processor.es.indices.put_index_template.assert_not_called()
+
+class TestIncrementalUpdates(unittest.TestCase):
+
+    def setUp(self):
+        import app
+        from product_mapping import field_hashes
+        self.app = app
+        self.field_hashes = field_hashes
+        self.processor = app.DocumentProcessor.__new__(app.DocumentProcessor)
+        self.processor.es = MagicMock()
+        self.doc_data = {"product_name": "Mouse", "price": "US $5.00", "description": "Texto largo"}
+
+    def test_new_document_is_indexed_with_hashes(self):
+        from elasticsearch import NotFoundError
+        self.processor.es.get.side_effect = NotFoundError('not found', MagicMock(status=404), {})
+
+        self.assertTrue(self.processor.save_document_to_elasticsearch('1', self.doc_data))
+
+        body = self.processor.es.index.call_args[1]['body']
+        self.assertEqual(body["field_hashes"], self.field_hashes(self.doc_data))
+        self.processor.es.update.assert_not_called()
+
+    def test_unchanged_document_is_skipped(self):
+        self.processor.es.get.return_value = {"_source": {"field_hashes": self.field_hashes(self.doc_data)}}
+
+        self.assertTrue(self.processor.save_document_to_elasticsearch('1', self.doc_data))
+
+        self.processor.es.index.assert_not_called()
+        self.processor.es.update.assert_not_called()
+
+    def test_only_changed_fields_are_sent(self):
+        self.processor.es.get.return_value = {"_source": {"field_hashes": self.field_hashes(self.doc_data)}}
+        new_data = dict(self.doc_data, price="US $4.50")
+
+        self.assertTrue(self.processor.save_document_to_elasticsearch('1', new_data))
+
+        doc = self.processor.es.update.call_args[1]['doc']
+        self.assertEqual(doc["price"], "US $4.50")
+        self.assertNotIn("description", doc)
+        self.assertEqual(doc["field_hashes"], self.field_hashes(new_data))
+
+    def test_write_event_lists_changed_fields(self):
+        self.processor.events_channel = MagicMock()
+        self.processor.es.get.return_value = {"_source": {"field_hashes": self.field_hashes(self.doc_data)}}
+
+        self.assertTrue(self.processor.save_document_to_elasticsearch('1', dict(self.doc_data, price="US $4.50")))
+
+        call_args = self.processor.events_channel.basic_publish.call_args[1]
+        self.assertEqual(call_args['exchange'], self.app.EVENTS_EXCHANGE)
+        self.assertEqual(call_args['properties'].type, 'document.processed')
+        self.assertEqual(json.loads(call_args['body'])['fields'], ['price'])
+        self.assertEqual(self.processor.es.update.call_args[1]['doc']['document_id'], '1')
+
+    def test_unchanged_document_publishes_no_event(self):
+        self.processor.events_channel = MagicMock()
+        self.processor.es.get.return_value = {"_source": {"field_hashes": self.field_hashes(self.doc_data)}}
+
+        self.assertTrue(self.processor.save_document_to_elasticsearch('1', self.doc_data))
+
+        self.processor.events_channel.basic_publish.assert_not_called()
+
+class TestStreaming(unittest.TestCase):
+
+    def test_read_until_complete_stops_after_description(self):
+        from streaming import read_until_complete, parse_simple_selector
+        html_content = (
+            '<html><body><h1>Título ñandú</h1>'
+            '<div class="x-item-description-child"><div>Descripción</div></div>'
+            '<div class="resto">' + 'x' * 5000 + '</div></body></html>'
+        ).encode('utf-8')
+        # Fragmentos pequeños para partir caracteres multibyte
+        chunks = [html_content[i:i + 7] for i in range(0, len(html_content), 7)]
+        stop = [parse_simple_selector("div.x-item-description-child")]
+
+        content, bytes_read = read_until_complete(iter(chunks), stop)
+
+        self.assertIn("Título ñandú", content)
+        self.assertIn("<div>Descripción</div></div>", content)
+        self.assertLess(bytes_read, 200)
+
+    def test_read_until_complete_respects_max_bytes(self):
+        from streaming import read_until_complete, parse_simple_selector
+        chunks = [b'<p>' + b'a' * 100 + b'</p>'] * 50
+
+        content, bytes_read = read_until_complete(iter(chunks), [parse_simple_selector("#nunca")], max_bytes=500)
+
+        self.assertEqual(bytes_read, 535)
+
+    def test_download_file_from_s3_streams_body(self):
+        import app
+        from site_profiles import load_profiles
+        processor = app.DocumentProcessor.__new__(app.DocumentProcessor)
+        processor.profiles = load_profiles()
+        processor.s3_client = MagicMock()
+        body = MagicMock()
+        page = (b'<nav class="breadcrumb"><a>PC</a></nav><h1 class="x-item-title__mainTitle">Mouse</h1>'
+                b'<div class="x-price-primary">US $5</div><div class="ux-image-carousel"><img src="a.jpg"></div>')
+        body.iter_chunks.return_value = iter([page, b'<div id="desc_div">Hola</div>', b'<p>no se lee</p>'])
+        processor.s3_client.get_object.return_value = {'Body': body, 'ContentLength': 45}
+
+        content = processor.download_file_from_s3('123')
+
+        self.assertEqual(content, page.decode('utf-8') + '<div id="desc_div">Hola</div>')
+        body.close.assert_called_once()
+
+    def test_json_ld_after_description_is_read(self):
+        from streaming import read_until_complete
+        from site_profiles import load_profiles
+        from structured_data import extract_structured_data
+        profiles = load_profiles()
+        json_ld = ('<script type="application/ld+json">{"@type": "Product", "name": "Mouse", '
+                   '"image": "https://i.ebayimg.com/1.jpg", "offers": {"price": "5", "priceCurrency": "USD"}}</script>'
+                   '<script type="application/ld+json">{"@type": "BreadcrumbList", '
+                   '"itemListElement": [{"position": 1, "name": "PC"}]}</script>')
+        chunks = [b'<html><body><div id="desc_div">Hola</div>', b'<div>' + b'x' * 1000 + b'</div>',
+                  json_ld.encode('utf-8'), b'<footer>' + b'y' * 1000 + b'</footer>']
+
+        content, bytes_read = read_until_complete(iter(chunks), profiles.stream_stop,
+                                                  field_elements=profiles.stream_fields)
+
+        # Se sigue leyendo después de la descripción hasta cerrar el JSON-LD, no más
+        self.assertEqual(extract_structured_data(content)["categories"], ["PC"])
+        self.assertNotIn("footer", content)
+        self.assertEqual(bytes_read, sum(len(chunk) for chunk in chunks[:3]))
+
+    def test_field_closes_only_after_its_content(self):
+        from streaming import StopScanner, parse_simple_selector, parse_marker
+        scanner = StopScanner([parse_simple_selector("div#desc_div")],
+                              {"price": [parse_marker("[class*='x-price-primary'] span")]})
+        scanner.feed('<div id="desc_div">Hola</div><div class="x-price-primary main"><div>')
+        self.assertFalse(scanner.done)
+        scanner.feed('<span>US $5</span></div></div>')
+        self.assertTrue(scanner.done)
+        self.assertIsNone(parse_marker("a:not(.x)"))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
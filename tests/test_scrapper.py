@@ -5,8 +5,23 @@ import sys
 
 # Añadir el directorio del proyecto al path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'scrapper')))
+# Sin límite de tasa en las pruebas que no lo usan explícitamente
+os.environ.setdefault("SCRAPER_RATE", "0")
 
-from app import configure_selenium, search_product, select_random_product, extract_html, save_html_to_file, upload_to_s3
+from app import configure_selenium, search_product, select_random_product, extract_html, upload_to_s3, compress_html
+from browser_pool import BrowserPool
+from batch import run_batch, SkipProduct
+from app import parse_args
+from timing import StepTimings
+from http_fetcher import HttpFetcher
+from frontier import CrawlFrontier, BloomFilter, item_key
+from rate_limiter import DomainRateLimiter, FileBucketStore, domain_of
+import app
+import tempfile
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from selenium.common.exceptions import WebDriverException
 
 class TestScrapper(unittest.TestCase):
 
@@ -20,6 +35,35 @@ class TestScrapper(unittest.TestCase):
         self.assertTrue(mock_chrome.called)
         self.assertTrue(mock_chromedriver_manager.called)
 
+    @patch('app.ChromeDriverManager')
+    @patch('app.webdriver.Chrome')
+    def test_configure_selenium_lean_profile(self, mock_chrome, mock_chromedriver_manager):
+        print("Probando el perfil liviano del navegador...")
+        driver = configure_selenium(lean=True)
+        options = mock_chrome.call_args[1]['options']
+        self.assertIn("--headless=new", options.arguments)
+        self.assertIn("--disable-extensions", options.arguments)
+        self.assertEqual(options.page_load_strategy, "eager")
+        self.assertEqual(options.experimental_options["prefs"]["profile.managed_default_content_settings.images"], 2)
+        blocked = driver.execute_cdp_cmd.call_args_list[-1][0]
+        self.assertEqual(blocked[0], "Network.setBlockedURLs")
+        self.assertIn("*.woff2", blocked[1]["urls"])
+        self.assertIn("*doubleclick.net*", blocked[1]["urls"])
+
+        mock_chrome.reset_mock()
+        configure_selenium(lean=False)
+        options = mock_chrome.call_args[1]['options']
+        self.assertNotIn("--headless=new", options.arguments)
+        mock_chrome.return_value.execute_cdp_cmd.assert_not_called()
+
+    def test_page_weight(self):
+        print("Probando page_weight()...")
+        driver = MagicMock()
+        driver.execute_script.return_value = 204800
+        self.assertEqual(app.page_weight(driver), 204800)
+        driver.execute_script.side_effect = Exception("sin performance API")
+        self.assertEqual(app.page_weight(driver), 0)
+
     @patch('app.WebDriverWait')
     def test_search_product(self, mock_webdriver_wait):
         print("Probando search_product()...")
@@ -47,31 +91,372 @@ class TestScrapper(unittest.TestCase):
         print("HTML extraído:", html_content)
         self.assertEqual(html_content, "<html></html>")
 
-    @patch('app.os.makedirs')
-    @patch('app.open', new_callable=unittest.mock.mock_open)
-    @patch('app.os.path.exists', return_value=True)  # Simula que el archivo existe
-    def test_save_html_to_file(self, mock_exists, mock_open, mock_makedirs):
-        print("Probando save_html_to_file()...")
-        html_content = "<html></html>"
-        file_path, file_name = save_html_to_file(html_content)
-        print(f"Se intentó guardar el archivo en: {file_path} con nombre: {file_name}")
-        self.assertTrue(mock_open.called)
-        self.assertTrue(mock_makedirs.called)
-        mock_open.assert_called_with(file_path, "w", encoding="utf-8")
-        mock_open().write.assert_called_once_with(html_content)
-        self.assertTrue(os.path.exists(file_path))  # Se asegura de que el archivo existe
-
     @patch('app.boto3.client')
     def test_upload_to_s3(self, mock_boto3_client):
         print("Probando upload_to_s3()...")
+        app.get_s3_client.cache_clear()
         mock_client = MagicMock()
         mock_boto3_client.return_value = mock_client
-        file_path = "test_file.html"
         file_name = "test_file.html"
-        s3_key = upload_to_s3(file_path, file_name)
+        s3_key = upload_to_s3("<html></html>", file_name)
+        upload_to_s3("<html></html>", "otro.html")
         print(f"Subiendo archivo a S3 con la clave: {s3_key}")
-        self.assertTrue(mock_client.upload_file.called)
+        # El cliente se crea una sola vez y el HTML se sube desde memoria
+        self.assertEqual(mock_boto3_client.call_count, 1)
+        kwargs = mock_client.put_object.call_args_list[0][1]
+        self.assertEqual(kwargs["Body"], b"<html></html>")
+        self.assertNotIn("ContentEncoding", kwargs)
         self.assertEqual(s3_key, "2023395931/test_file.html")
+        app.get_s3_client.cache_clear()
+
+    def test_compress_html(self):
+        print("Probando compress_html()...")
+        import gzip
+        body, encoding = compress_html("<html>ñ</html>", "gzip")
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(gzip.decompress(body).decode("utf-8"), "<html>ñ</html>")
+        # Sin marca de tiempo en la cabecera el ETag no cambia entre re-scrapes
+        with patch("gzip.time.time", return_value=0):
+            first, _ = compress_html("<html>ñ</html>", "gzip")
+        self.assertEqual(first, body)
+        body, encoding = compress_html("<html></html>", "none")
+        self.assertIsNone(encoding)
+
+class TestBrowserPool(unittest.TestCase):
+
+    def test_reuses_session(self):
+        print("Probando reutilización de sesiones en BrowserPool...")
+        factory = MagicMock(side_effect=lambda: MagicMock())
+        pool = BrowserPool(factory, size=1, max_pages=10)
+        with pool.session() as first:
+            pass
+        with pool.session() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(factory.call_count, 1)
+
+    def test_recycles_after_max_pages(self):
+        print("Probando reciclaje de sesiones tras N páginas...")
+        factory = MagicMock(side_effect=lambda: MagicMock())
+        pool = BrowserPool(factory, size=1, max_pages=2)
+        for _ in range(3):
+            with pool.session():
+                pass
+        self.assertEqual(factory.call_count, 2)
+
+    def test_replaces_crashed_session(self):
+        print("Probando reemplazo de sesiones caídas...")
+        factory = MagicMock(side_effect=lambda: MagicMock())
+        pool = BrowserPool(factory, size=1, max_pages=10)
+        with self.assertRaises(WebDriverException):
+            with pool.session() as driver:
+                raise WebDriverException("chrome not reachable")
+        driver.quit.assert_called_once()
+        with pool.session() as replacement:
+            self.assertIsNot(replacement, driver)
+        pool.close()
+        replacement.quit.assert_called_once()
+
+class TestBatchMode(unittest.TestCase):
+
+    def test_run_batch_reaches_target(self):
+        print("Probando run_batch() con objetivo de productos...")
+        scraped = []
+        report = run_batch(scraped.append, ["a", "b"], target=5, concurrency=3)
+        self.assertEqual(report["products"], 5)
+        self.assertEqual(len(scraped), 5)
+        self.assertEqual(set(scraped), {"a", "b"})
+
+    def test_run_batch_counts_errors(self):
+        print("Probando run_batch() con errores...")
+        calls = []
+
+        def scrape(term):
+            calls.append(term)
+            if len(calls) % 2:
+                raise Exception("Página sin productos")
+
+        report = run_batch(scrape, ["a"], target=3, concurrency=1)
+        self.assertEqual(report["products"], 3)
+        self.assertEqual(report["errors"], 3)
+
+    def test_run_batch_counts_skipped(self):
+        print("Probando run_batch() cuando no quedan productos nuevos...")
+
+        def scrape(term):
+            raise SkipProduct("todos vistos")
+
+        report = run_batch(scrape, ["a"], target=5, concurrency=2, max_errors=4)
+        self.assertEqual(report["products"], 0)
+        self.assertEqual(report["errors"], 0)
+        self.assertGreaterEqual(report["skipped"], 4)
+
+    def test_run_batch_without_terms(self):
+        print("Probando run_batch() sin términos de búsqueda...")
+        scrape = MagicMock()
+        report = run_batch(scrape, [], target=5, concurrency=3)
+        self.assertEqual(report["products"], 0)
+        scrape.assert_not_called()
+
+    def test_run_batch_requires_limit(self):
+        with self.assertRaises(ValueError):
+            run_batch(MagicMock(), ["a"])
+
+    def test_parse_args(self):
+        print("Probando parse_args()...")
+        args = parse_args(["--batch", "--terms", "cpu,mouse", "--products", "10",
+                           "--concurrency", "4", "--base-url", "http://localhost:8000"])
+        self.assertTrue(args.batch)
+        self.assertEqual(args.terms, "cpu,mouse")
+        self.assertEqual(args.products, 10)
+        self.assertEqual(args.concurrency, 4)
+        self.assertEqual(args.base_url, "http://localhost:8000")
+
+class TestStepTimings(unittest.TestCase):
+
+    def test_step_records_durations(self):
+        print("Probando StepTimings...")
+        timings = StepTimings()
+        with timings.step("home"):
+            pass
+        with timings.step("home"):
+            pass
+        with timings.step("product"):
+            pass
+        summary = timings.summary()
+        self.assertEqual(summary["home"]["count"], 2)
+        self.assertEqual(summary["product"]["count"], 1)
+        self.assertEqual(set(timings.last), {"home", "product"})
+        timings.reset_last()
+        self.assertEqual(timings.last, {})
+
+    @patch('app.WebDriverWait')
+    def test_select_random_product_tolerates_timeout(self, mock_webdriver_wait):
+        print("Probando select_random_product() cuando el producto no termina de cargar...")
+        from selenium.common.exceptions import TimeoutException
+        link = MagicMock()
+        link.get_attribute.return_value = "https://www.ebay.com/itm/1"
+        mock_webdriver_wait.return_value.until.side_effect = [[link], TimeoutException(), TimeoutException()]
+        product_url = select_random_product(MagicMock())
+        self.assertEqual(product_url, "https://www.ebay.com/itm/1")
+        link.click.assert_called_once()
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCrawlFrontier(unittest.TestCase):
+
+    def test_item_key(self):
+        print("Probando item_key()...")
+        self.assertEqual(item_key("https://www.ebay.com/itm/Gaming-Mouse/256789012345?hash=abc"), "256789012345")
+        self.assertEqual(item_key("https://www.ebay.com/itm/256789012345"), "256789012345")
+        self.assertEqual(item_key("https://www.amazon.com/Mouse/dp/B07GBZ4Q68/ref=sr_1_1"), "B07GBZ4Q68")
+        self.assertEqual(item_key("http://127.0.0.1:8000/itm/1.html?x=1"), "127.0.0.1:8000/itm/1.html")
+
+    def test_bloom_filter(self):
+        print("Probando BloomFilter...")
+        bloom = BloomFilter.for_capacity(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"item-{i}")
+        self.assertTrue(all(f"item-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"otro-{i}" in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_choose_prefers_unseen_and_expires(self):
+        print("Probando CrawlFrontier.choose() y el TTL de revisita...")
+        clock = FakeClock()
+        frontier = CrawlFrontier(path=None, capacity=100, ttl=400, generations=4, clock=clock)
+        urls = ["https://www.ebay.com/itm/111111111", "https://www.ebay.com/itm/222222222"]
+        frontier.mark(urls[0])
+        self.assertEqual(frontier.choose(urls), urls[1])
+        # Reservado por otro worker hasta que se marque o libere
+        self.assertIsNone(frontier.choose(urls))
+        frontier.release(urls[1])
+        self.assertEqual(frontier.choose(urls), urls[1])
+        frontier.mark(urls[1])
+        self.assertTrue(frontier.seen(urls[0]))
+
+        clock.now += 450
+        self.assertFalse(frontier.seen(urls[0]))
+        self.assertIn(frontier.choose(urls), urls)
+
+    def test_save_and_load(self):
+        print("Probando que el frontier persiste entre ejecuciones...")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "frontier.json")
+            frontier = CrawlFrontier(path=path, capacity=100)
+            frontier.mark("https://www.ebay.com/itm/333333333")
+            frontier.save()
+            reloaded = CrawlFrontier(path=path, capacity=100)
+            self.assertTrue(reloaded.seen("https://www.ebay.com/itm/333333333"))
+            self.assertFalse(reloaded.seen("https://www.ebay.com/itm/444444444"))
+
+    def test_build_file_name_uses_item_id(self):
+        print("Probando build_file_name() con id de producto...")
+        self.assertEqual(app.build_file_name("https://www.ebay.com/itm/256789012345"),
+                         "ebay_product_256789012345.html")
+        self.assertTrue(app.build_file_name().startswith("ebay_product_2"))
+
+
+class FakeSleep:
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def __call__(self, seconds):
+        self.calls.append(seconds)
+        self.clock.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def make_limiter(self, **kwargs):
+        self.clock = FakeClock()
+        self.sleep = FakeSleep(self.clock)
+        kwargs.setdefault("rate", 2.0)
+        kwargs.setdefault("burst", 2)
+        return DomainRateLimiter(clock=self.clock, sleep=self.sleep, **kwargs)
+
+    def test_domain_of(self):
+        self.assertEqual(domain_of("https://www.ebay.com/itm/1"), "ebay.com")
+        self.assertEqual(domain_of("http://127.0.0.1:8000/sch/i.html"), "127.0.0.1")
+
+    def test_token_bucket_per_domain(self):
+        print("Probando DomainRateLimiter.acquire()...")
+        limiter = self.make_limiter()
+        self.assertEqual(limiter.acquire("https://www.ebay.com/a"), 0)
+        self.assertEqual(limiter.acquire("https://www.ebay.com/b"), 0)
+        # Sin tokens: espera 1/rate segundos
+        self.assertAlmostEqual(limiter.acquire("https://www.ebay.com/c"), 0.5)
+        # Otro dominio tiene su propio bucket
+        self.assertEqual(limiter.acquire("https://www.amazon.com/a"), 0)
+
+    def test_backoff_and_recovery(self):
+        print("Probando el backoff ante bloqueos...")
+        limiter = self.make_limiter(rate=2.0, backoff_base=10, backoff_max=25, rate_step=0.5)
+        url = "https://www.ebay.com/itm/1"
+        limiter.penalize(url)
+        self.assertEqual(limiter.current_rate(url), 1.0)
+        self.assertGreaterEqual(limiter.acquire(url), 10)
+        limiter.penalize(url)
+        limiter.penalize(url)
+        self.assertEqual(limiter.current_rate(url), 0.25)
+        waited = limiter.acquire(url)
+        self.assertGreaterEqual(waited, 25)
+        self.assertLess(waited, 30)
+        for _ in range(5):
+            limiter.succeed(url)
+        self.assertEqual(limiter.current_rate(url), 2.0)
+
+    def test_file_store_shared_between_limiters(self):
+        print("Probando el estado compartido en archivo...")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rate.json")
+            clock = FakeClock()
+            first = DomainRateLimiter(rate=1.0, burst=1, store=FileBucketStore(path), clock=clock,
+                                      sleep=FakeSleep(clock))
+            second = DomainRateLimiter(rate=1.0, burst=1, store=FileBucketStore(path), clock=clock,
+                                       sleep=FakeSleep(clock))
+            self.assertEqual(first.acquire("https://www.ebay.com/"), 0)
+            self.assertAlmostEqual(second.acquire("https://www.ebay.com/"), 1.0)
+
+    def test_http_fetcher_penalizes_blocked_pages(self):
+        print("Probando que HttpFetcher avisa al limitador de un bloqueo...")
+        limiter = MagicMock()
+        fetcher = HttpFetcher("test-agent", limiter=limiter)
+        response = MagicMock(status_code=429)
+        with patch.object(fetcher.session, "get", return_value=response):
+            self.assertIsNone(fetcher.get("https://www.ebay.com/itm/1"))
+        limiter.acquire.assert_called_once_with("https://www.ebay.com/itm/1")
+        limiter.penalize.assert_called_once_with("https://www.ebay.com/itm/1")
+
+        response = MagicMock(status_code=200, text="<html>Pardon Our Interruption</html>")
+        with patch.object(fetcher.session, "get", return_value=response):
+            self.assertIsNone(fetcher.get("https://www.ebay.com/itm/1"))
+        self.assertEqual(limiter.penalize.call_count, 2)
+        limiter.succeed.assert_not_called()
+
+
+FIXTURE_SITE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'ebay_site'))
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHttpFetcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Sitio de prueba local en lugar de eBay
+        handler = functools.partial(QuietHandler, directory=FIXTURE_SITE)
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_search_results_and_product_page(self):
+        print("Probando HttpFetcher con el sitio de prueba...")
+        fetcher = HttpFetcher("test-agent")
+        links = fetcher.search_results(self.base_url, "mouse")
+        self.assertEqual(links[0], f"{self.base_url}/itm/1.html")
+        self.assertEqual(len(links), 3)
+        html_content = fetcher.product_page(links[2])
+        self.assertIn("Gaming Mouse RGB", html_content)
+
+    def test_invalid_pages_escalate(self):
+        print("Probando que HttpFetcher rechaza páginas sin marcadores...")
+        fetcher = HttpFetcher("test-agent")
+        self.assertIsNone(fetcher.product_page(f"{self.base_url}/index.html"))
+        self.assertIsNone(fetcher.product_page(f"{self.base_url}/itm/404.html"))
+        self.assertEqual(fetcher.last_status, 404)
+
+    @patch('app.upload_to_s3', return_value="2023395931/test.html")
+    def test_scrape_product_uses_http_tier(self, mock_upload):
+        print("Probando scrape_product() por el nivel HTTP...")
+        pool = MagicMock()
+        app.scrape_product(pool, "mouse", self.base_url, HttpFetcher("test-agent"))
+        pool.session.assert_not_called()
+        self.assertIn("x-item-title__mainTitle", mock_upload.call_args[0][0])
+
+    @patch('app.upload_to_s3', return_value="2023395931/test.html")
+    @patch('app.wait_for_product')
+    def test_scrape_product_falls_back_to_browser(self, mock_wait, mock_upload):
+        print("Probando scrape_product() con escalamiento al navegador...")
+        fetcher = MagicMock()
+        fetcher.search_results.return_value = ["https://www.ebay.com/itm/9"]
+        fetcher.product_page.return_value = None
+        driver = MagicMock()
+        driver.page_source = "<html>renderizado</html>"
+        pool = BrowserPool(lambda: driver)
+        app.scrape_product(pool, "mouse", self.base_url, fetcher)
+        driver.get.assert_called_once_with("https://www.ebay.com/itm/9")
+        self.assertEqual(mock_upload.call_args[0][0], "<html>renderizado</html>")
+
+    @patch('app.upload_to_s3', return_value="2023395931/test.html")
+    def test_scrape_product_skips_seen_products(self, mock_upload):
+        print("Probando scrape_product() con el frontier...")
+        pool = MagicMock()
+        fetcher = HttpFetcher("test-agent")
+        frontier = CrawlFrontier(path=None, capacity=100)
+        for _ in range(3):
+            app.scrape_product(pool, "mouse", self.base_url, fetcher, frontier)
+        names = {call[0][1] for call in mock_upload.call_args_list}
+        self.assertEqual(len(names), 3)
+        with self.assertRaises(SkipProduct):
+            app.scrape_product(pool, "mouse", self.base_url, fetcher, frontier)
+        self.assertEqual(mock_upload.call_count, 3)
+        pool.session.assert_not_called()
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,205 @@
+import unittest
+from unittest.mock import MagicMock
+import os
+import sys
+import json
+import threading
+from urllib.parse import parse_qs
+from urllib.request import urlopen
+from urllib.error import HTTPError
+
+os.environ.setdefault('ELASTICSEARCH_INDEX_DST', 'processed_documents')
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'search', 'app')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'common')))
+
+from app import (
+    Query, SearchService, SearchError, apply_write_event, on_write_event, create_server, encode_cursor
+)
+from query_cache import QueryCache
+from pipeline.messages import encode_message, DOCUMENT_PROCESSED
+
+
+def es_response(ids, total=None):
+    return {'hits': {'total': {'value': total if total is not None else len(ids)}, 'hits': [
+        {'_id': doc_id, '_source': {'product_name': f"Producto {doc_id}", 'price_value': 10.0},
+         'sort': [1.5, doc_id]} for doc_id in ids]}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = QueryCache(max_entries=2, ttl=30, settle=1, clock=self.clock)
+
+    def test_lru_and_ttl(self):
+        print("[TEST] Probando expiración y desalojo LRU de la caché...")
+        self.cache.put('a', b'A', ['1'])
+        self.cache.put('b', b'B', ['2'])
+        self.assertEqual(self.cache.get('a'), b'A')
+        self.cache.put('c', b'C', ['3'])
+        # 'b' era la menos usada
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), b'A')
+        self.clock.now += 31
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_invalidate_documents(self):
+        print("[TEST] Probando invalidación por documento...")
+        self.cache.put('a', b'A', ['1', '2'])
+        self.cache.put('b', b'B', ['3'])
+        self.assertEqual(self.cache.invalidate_documents(['2']), 1)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), b'B')
+        # Mientras la escritura no es visible no se guardan páginas con el documento
+        self.assertFalse(self.cache.put('a', b'A', ['2']))
+        self.assertTrue(self.cache.put('c', b'C', ['4']))
+        self.clock.now += 2
+        self.assertTrue(self.cache.put('a', b'A', ['2']))
+
+    def test_stale_query_is_not_stored(self):
+        print("[TEST] Probando que una consulta anterior a la invalidación no se guarda...")
+        version = self.cache.version
+        self.cache.clear()
+        self.clock.now += 2
+        self.assertFalse(self.cache.put('a', b'A', ['1'], version=version))
+        self.assertTrue(self.cache.put('a', b'A', ['1'], version=self.cache.version))
+
+    def test_clears_are_coalesced(self):
+        print("[TEST] Probando que los vaciados se agrupan en uno por ventana...")
+        self.cache.put('a', b'A', ['1'])
+        self.assertTrue(self.cache.clear())
+        # Lo que se guarda antes de que la escritura sea visible vive hasta el final de la ventana
+        self.clock.now += 0.5
+        self.assertTrue(self.cache.put('b', b'B', ['2'], version=self.cache.version))
+        self.assertFalse(self.cache.clear())
+        self.assertEqual(self.cache.get('b'), b'B')
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get('b'))
+        # Pasada la ventana el siguiente vaciado se aplica
+        self.assertTrue(self.cache.put('c', b'C', ['3']))
+        self.assertTrue(self.cache.clear())
+        self.assertEqual(len(self.cache), 0)
+
+    def test_hot_queries_hit_under_steady_writes(self):
+        print("[TEST] Probando aciertos de caché con escrituras continuas del procesador...")
+        es = MagicMock()
+        es.search.return_value = es_response(['1', '2'])
+        service = SearchService(es, 'processed_documents', self.cache)
+        results = []
+        # Un documento nuevo cada 100 ms durante 10 s y una consulta frecuente entre cada uno
+        for event in range(100):
+            apply_write_event(self.cache, {'document_id': event, 'fields': ['product_name', 'price_value']})
+            self.clock.now += 0.05
+            results.append(service.search('search', parse_qs('q=mouse'))[1])
+            self.clock.now += 0.05
+        # A lo sumo una consulta a Elasticsearch por ventana de refresco
+        self.assertLessEqual(results.count('miss'), 11)
+        self.assertGreaterEqual(results.count('hit'), 89)
+
+
+class TestQuery(unittest.TestCase):
+
+    def test_normalization(self):
+        print("[TEST] Probando la normalización de consultas...")
+        first = Query.from_params('search', parse_qs('q=Wireless%20%20Mouse&category=B&category=A'))
+        second = Query.from_params('search', parse_qs('q=wireless+mouse&category=A&category=B'))
+        self.assertEqual(first, second)
+        self.assertEqual(first.sort, 'relevance')
+        self.assertEqual(Query.from_params('price', parse_qs('min=5')).sort, 'price_asc')
+        self.assertEqual(Query.from_params('price', parse_qs('min=5&size=5000')).size, 100)
+
+    def test_required_parameters(self):
+        print("[TEST] Probando parámetros obligatorios por endpoint...")
+        for endpoint, query in (('search', ''), ('category', 'q=x'), ('price', 'q=x'), ('price', 'min=9&max=1'),
+                                ('search', 'q=x&sort=nombre'), ('search', 'q=x&after=%%%')):
+            with self.assertRaises(SearchError, msg=f"{endpoint}?{query}"):
+                Query.from_params(endpoint, parse_qs(query))
+
+    def test_request_uses_search_after(self):
+        print("[TEST] Probando filtros y paginación con search_after...")
+        cursor = encode_cursor([12.5, '42'])
+        request = Query.from_params('price', parse_qs(f"min=10&max=20&category=Electronics&after={cursor}")).request()
+        filters = request['query']['bool']['filter']
+        self.assertIn({'terms': {'categories': ['Electronics']}}, filters)
+        self.assertIn({'range': {'price_value': {'gte': 10.0, 'lte': 20.0}}}, filters)
+        self.assertEqual(request['search_after'], [12.5, '42'])
+        self.assertNotIn('from', request)
+        self.assertEqual(list(request['sort'][-1]), ['document_id'])
+
+
+class TestSearchService(unittest.TestCase):
+
+    def setUp(self):
+        self.es = MagicMock()
+        self.cache = QueryCache(max_entries=100, ttl=30, settle=0)
+        self.service = SearchService(self.es, 'processed_documents', self.cache)
+
+    def test_hot_query_served_from_cache(self):
+        print("[TEST] Probando que una consulta repetida no llega a Elasticsearch...")
+        self.es.search.return_value = es_response(['1', '2'], total=7)
+        body, cache = self.service.search('search', parse_qs('q=mouse&size=2'))
+        self.assertEqual(cache, 'miss')
+        result = json.loads(body)
+        self.assertEqual(result['total'], 7)
+        self.assertEqual([hit['id'] for hit in result['hits']], ['1', '2'])
+        self.assertEqual(result['next'], encode_cursor([1.5, '2']))
+
+        # La latencia de un acierto se mide en benchmarks/bench_search.py
+        for _ in range(3):
+            cached, cache = self.service.search('search', parse_qs('q=Mouse&size=2'))
+            self.assertEqual(cache, 'hit')
+            self.assertEqual(cached, body)
+        self.es.search.assert_called_once()
+
+    def test_write_events_invalidate(self):
+        print("[TEST] Probando invalidación con los eventos del procesador...")
+        self.es.search.return_value = es_response(['1', '2'])
+        self.service.search('search', parse_qs('q=mouse'))
+        self.es.search.return_value = es_response(['3'])
+        self.service.search('category', parse_qs('category=Electronics'))
+
+        # Solo cambiaron las imágenes del documento 1: se descarta la página que lo contiene
+        apply_write_event(self.cache, {'document_id': 1, 'fields': ['images']})
+        self.assertEqual(self.service.search('search', parse_qs('q=mouse'))[1], 'miss')
+        self.assertEqual(self.service.search('category', parse_qs('category=Electronics'))[1], 'hit')
+
+        # Un documento nuevo o un precio distinto puede cambiar cualquier consulta
+        body, properties = encode_message(DOCUMENT_PROCESSED, {'document_id': '9', 'fields': ['price', 'price_value']})
+        on_write_event(self.cache, MagicMock(), MagicMock(), properties, body)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_http_endpoints(self):
+        print("[TEST] Probando los endpoints HTTP...")
+        self.es.search.return_value = es_response(['1'])
+        server = create_server(self.service, port=0, host='127.0.0.1')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            for expected in ('miss', 'hit'):
+                with urlopen(f"{base}/price?min=1&max=50") as response:
+                    self.assertEqual(response.headers['X-Cache'], expected)
+                    self.assertEqual(json.loads(response.read())['hits'][0]['id'], '1')
+            with self.assertRaises(HTTPError) as error:
+                urlopen(f"{base}/search")
+            self.assertEqual(error.exception.code, 400)
+            self.es.search.side_effect = ConnectionError('sin conexión')
+            with self.assertRaises(HTTPError) as error:
+                urlopen(f"{base}/category?category=Toys")
+            self.assertEqual(error.exception.code, 502)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,93 +6,105 @@ import json
 import pika
 import pymysql
 import hashlib
+import tempfile
 import boto3
 
 # Añadir el directorio del proyecto al path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 's3-spider', 'app')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'common')))
 
 from app import (
     get_db_connection, get_files_in_s3, calculate_md5, get_stored_md5, insert_new_document,
-    update_db_status, get_document_id, publish_message, process_file, main
+    update_db_status, get_document_id, publish_message, process_file, main, config
 )
 
 class TestScrapper(unittest.TestCase):
 
-    @patch('app.get_db_connection')
-    def test_get_db_connection(self, mock_get_db_connection):
+    @patch('app.db_connection')
+    def test_get_db_connection(self, mock_db_connection):
         print("[TEST] Probando get_db_connection()...")
         mock_connection = MagicMock()
-        mock_get_db_connection.return_value = mock_connection
+        mock_db_connection.return_value = mock_connection
         conn = get_db_connection()
         print("[TEST] Conexión a la base de datos establecida:", conn)
         self.assertEqual(conn, mock_connection)
 
-    @patch('app.s3_client.list_objects_v2')
-    def test_get_files_in_s3(self, mock_list_objects):
+    @patch('app.get_s3_client')
+    def test_get_files_in_s3(self, mock_get_s3_client):
         print("[TEST] Probando get_files_in_s3()...")
-        mock_list_objects.return_value = {
+        mock_get_s3_client.return_value.list_objects_v2.return_value = {
             'Contents': [{'Key': '2023395931/file1.html'}, {'Key': '2023395931/file2.html'}]
         }
         files = get_files_in_s3()
         print(f"[TEST] Archivos encontrados en S3: {files}")
         self.assertEqual(files, ['file1.html', 'file2.html'])
 
-    @patch('app.s3_client.get_object')
-    def test_calculate_md5(self, mock_get_object):
+    @patch('app.get_s3_client')
+    def test_calculate_md5(self, mock_get_s3_client):
         print("[TEST] Probando calculate_md5()...")
-        mock_get_object.return_value = {'Body': MagicMock(read=MagicMock(return_value=b'Hello World'))}
+        mock_get_s3_client.return_value.get_object.return_value = {'Body': MagicMock(read=MagicMock(return_value=b'Hello World'))}
         md5_hash = calculate_md5("file1.html")
         print(f"[TEST] MD5 calculado: {md5_hash}")
         self.assertEqual(md5_hash, hashlib.md5(b'Hello World').hexdigest())
 
-    @patch('app.get_stored_md5')
-    def test_get_stored_md5(self, mock_get_stored_md5):
+    @patch('app.db_connection')
+    def test_get_stored_md5(self, mock_db_connection):
         print("[TEST] Probando get_stored_md5()...")
-        mock_get_stored_md5.return_value = '1234567890abcdef'
+        mock_cursor = mock_db_connection.return_value.__enter__.return_value.cursor.return_value
+        mock_cursor.fetchone.return_value = ('1234567890abcdef',)
         stored_md5 = get_stored_md5("file1.html")
         print(f"[TEST] MD5 almacenado en la base de datos: {stored_md5}")
         self.assertEqual(stored_md5, '1234567890abcdef')
 
-    @patch('app.pymysql.connect')
-    def test_insert_new_document(self, mock_connect):
+    @patch('app.db_connection')
+    def test_insert_new_document(self, mock_db_connection):
         print("[TEST] Probando insert_new_document()...")
-        mock_connection = MagicMock()
+        mock_connection = mock_db_connection.return_value.__enter__.return_value
         mock_cursor = MagicMock()
         mock_connection.cursor.return_value = mock_cursor
-        mock_connect.return_value = mock_connection
         insert_new_document("file1.html", "1234567890abcdef")
         print(f"[TEST] Inserción de nuevo documento realizada en la base de datos.")
         mock_cursor.execute.assert_called_once()
 
-    @patch('app.pymysql.connect')
-    def test_update_db_status(self, mock_connect):
+    @patch('app.db_connection')
+    def test_update_db_status(self, mock_db_connection):
         print("[TEST] Probando update_db_status()...")
-        mock_connection = MagicMock()
+        mock_connection = mock_db_connection.return_value.__enter__.return_value
         mock_cursor = MagicMock()
         mock_connection.cursor.return_value = mock_cursor
-        mock_connect.return_value = mock_connection
         update_db_status("file1.html", "1234567890abcdef")
         print(f"[TEST] Actualización de documento en la base de datos.")
         mock_cursor.execute.assert_called_once()
 
-    @patch('app.get_document_id')
-    def test_get_document_id(self, mock_get_document_id):
+    @patch('app.db_connection')
+    def test_get_document_id(self, mock_db_connection):
         print("[TEST] Probando get_document_id()...")
-        mock_get_document_id.return_value = 1
+        mock_cursor = mock_db_connection.return_value.__enter__.return_value.cursor.return_value
+        mock_cursor.fetchone.return_value = (1,)
         document_id = get_document_id("file1.html")
         print(f"[TEST] ID del documento en la base de datos: {document_id}")
         self.assertEqual(document_id, 1)
 
-    @patch('app.pika.BlockingConnection')
-    def test_publish_message(self, mock_blocking_connection):
+    @patch('app.get_amqp_channel')
+    def test_publish_message(self, mock_get_amqp_channel):
         print("[TEST] Probando publish_message()...")
-        mock_connection = MagicMock()
-        mock_channel = MagicMock()
-        mock_connection.channel.return_value = mock_channel
-        mock_blocking_connection.return_value = mock_connection
+        mock_channel = mock_get_amqp_channel.return_value
         publish_message("file1.html", "new", 1)
         print("[TEST] Mensaje publicado en RabbitMQ.")
         mock_channel.basic_publish.assert_called_once()
+        call_args = mock_channel.basic_publish.call_args[1]
+        self.assertEqual(call_args['properties'].type, 'document.discovered')
+        self.assertEqual(json.loads(call_args['body'])['path'], "2023395931/file1.html")
+        self.assertEqual(call_args['properties'].headers['lane'], 'new')
+
+    @patch('app.get_amqp_channel')
+    def test_publish_updated_uses_its_lane(self, mock_get_amqp_channel):
+        print("[TEST] Probando publish_message() de un documento actualizado...")
+        mock_channel = mock_get_amqp_channel.return_value
+        publish_message("file1.html", "updated", 1)
+        call_args = mock_channel.basic_publish.call_args[1]
+        self.assertEqual(call_args['routing_key'], f"{config.rabbitmq.queue}.updated")
+        self.assertEqual(call_args['properties'].headers['lane'], 'updated')
 
     @patch('app.calculate_md5')
     @patch('app.get_stored_md5')
@@ -120,6 +132,26 @@ class TestScrapper(unittest.TestCase):
         process_file("file3.html")
         print("[TEST] Proceso de archivo sin cambios completado.")
 
+    @patch('app.calculate_md5', return_value="new_md5")
+    @patch('app.get_stored_md5', return_value=None)
+    @patch('app.insert_new_document')
+    @patch('app.get_document_id', return_value=7)
+    @patch('app.publish_message')
+    @patch('app.THROTTLE')
+    def test_process_file_waits_for_backpressure(self, mock_throttle, mock_publish_message, *mocks):
+        print("[TEST] Probando que el spider espera la contrapresión antes de publicar...")
+        order = []
+        mock_throttle.wait.side_effect = lambda: order.append('wait')
+        mock_publish_message.side_effect = lambda *args: order.append('publish')
+        process_file("file1.html")
+        self.assertEqual(order, ['wait', 'publish'])
+
+        # Los archivos sin cambios no consultan al controlador
+        mock_throttle.wait.reset_mock()
+        with patch('app.get_stored_md5', return_value="new_md5"):
+            process_file("file2.html")
+        mock_throttle.wait.assert_not_called()
+
     def test_main(self):
         with patch('app.get_files_in_s3', return_value=['file1.html', 'file2.html']), \
              patch('app.process_file') as mock_process_file:
@@ -128,5 +160,15 @@ class TestScrapper(unittest.TestCase):
             print("[TEST] Verificando que process_file fue llamado...")
             mock_process_file.assert_called_with('file2.html')
 
+    def test_main_writes_metrics_file(self):
+        print("[TEST] Probando que main() deja las métricas en METRICS_FILE...")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'spider.prom')
+            with patch('app.get_files_in_s3', return_value=['file1.html']), patch('app.process_file'), \
+                 patch('app.close_all'), patch('app.metrics.METRICS_FILE', path):
+                main()
+            with open(path, encoding='utf-8') as file:
+                self.assertIn('# TYPE pipeline_stage_seconds histogram', file.read())
+
 if __name__ == '__main__':
     unittest.main()